@@ -0,0 +1,79 @@
+"""
+Benchmark: per-call SQLite connections vs. the reusable tuned connection
+
+Compares queries/sec of the previous Database behaviour (a new sqlite3
+connection plus a PRAGMA round trip for every execute_*, rollback journal)
+against the current thread-local WAL connection.
+
+Usage:
+    python benchmarks/db_connections.py [--rows 2000] [--reads 20000] [--writes 2000]
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.database import Database  # noqa: E402
+
+
+class LegacyDatabase(Database):
+    """Database with the old connection-per-call behaviour"""
+
+    def get_connection(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("PRAGMA foreign_keys = ON")
+        conn.row_factory = sqlite3.Row
+        self._local.in_tx = getattr(self._local, 'in_tx', False)
+        return conn
+
+
+def run(db_class, path, rows, reads, writes):
+    db = db_class(path)
+    if db_class is LegacyDatabase:
+        db.execute_query("PRAGMA journal_mode = DELETE")
+
+    db.execute_many(
+        "INSERT INTO clientes (username_tradingview, email) VALUES (?, ?)",
+        [(f"bench_user_{i}", f"user{i}@example.com") for i in range(rows)]
+    )
+
+    started = time.perf_counter()
+    for i in range(reads):
+        db.execute_query("SELECT * FROM clientes WHERE id = ?", (i % rows + 1,))
+    read_elapsed = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for i in range(writes):
+        db.execute_update("UPDATE clientes SET notas = ? WHERE id = ?", (f"n{i}", i % rows + 1))
+    write_elapsed = time.perf_counter() - started
+
+    return reads / read_elapsed, writes / write_elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=2000)
+    parser.add_argument('--reads', type=int, default=20000)
+    parser.add_argument('--writes', type=int, default=2000)
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, db_class in (('per-call connection', LegacyDatabase), ('reused WAL connection', Database)):
+            path = os.path.join(tmp, name.replace(' ', '_'), 'bench.db')
+            results[name] = run(db_class, path, args.rows, args.reads, args.writes)
+
+    print(f"\n{'mode':<24}{'reads/s':>12}{'writes/s':>12}")
+    for name, (read_qps, write_qps) in results.items():
+        print(f"{name:<24}{read_qps:>12,.0f}{write_qps:>12,.0f}")
+    base_r, base_w = results['per-call connection']
+    new_r, new_w = results['reused WAL connection']
+    print(f"{'speedup':<24}{new_r / base_r:>11.1f}x{new_w / base_w:>11.1f}x")
+
+
+if __name__ == '__main__':
+    main()
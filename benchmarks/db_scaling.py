@@ -0,0 +1,152 @@
+"""
+Benchmark: model queries on a large database, with their query plans
+
+Times every read method of Indicador, Cliente and Acceso, Database.get_stats,
+the dashboard queries and the grouped-access view against a database made by
+generate_data.py, then prints EXPLAIN QUERY PLAN for each SQL statement the
+method ran (captured from Database.execute_query).
+
+Usage:
+    python benchmarks/generate_data.py                 # 100k clients, 1M accesses
+    python benchmarks/db_scaling.py [--db PATH] [--repeat 5] [--only Acceso.] [--no-plans]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from generate_data import DEFAULT_DB  # noqa: E402
+
+
+class RecordingDatabase:
+    """Wraps execute_query to remember every (query, params) a method runs"""
+
+    def __init__(self, db):
+        self.db = db
+        self.statements: List[Tuple[str, tuple]] = []
+        self._execute_query = db.execute_query
+        db.execute_query = self.execute_query
+
+    def execute_query(self, query: str, params: tuple = ()) -> List[Dict[str, Any]]:
+        self.statements.append((query, params))
+        return self._execute_query(query, params)
+
+    def plan(self, query: str, params: tuple) -> List[str]:
+        rows = self._execute_query(f"EXPLAIN QUERY PLAN {query}", params)
+        depth = {0: 0}
+        lines = []
+        for row in rows:
+            level = depth.get(row['parent'], 0) + 1
+            depth[row['id']] = level
+            lines.append('  ' * level + row['detail'])
+        return lines
+
+
+def cases(models, services, db) -> List[Tuple[str, Callable[[], Any]]]:
+    """(label, call) for every read path, with arguments picked from the data"""
+    Indicador, Cliente, Acceso = models.Indicador, models.Cliente, models.Acceso
+    top = db.execute_query("""
+        SELECT indicador_id FROM accesos GROUP BY indicador_id ORDER BY COUNT(*) DESC LIMIT 1
+    """)[0]['indicador_id']
+    heavy_client = db.execute_query("""
+        SELECT cliente_id FROM accesos GROUP BY cliente_id ORDER BY COUNT(*) DESC LIMIT 1
+    """)[0]['cliente_id']
+    client = Cliente.get_by_id(heavy_client)
+    indicator = Indicador.get_by_id(top)
+    page = Acceso.get_active_accesses(50)
+    last = page[-1]
+    key = [last['fecha_fin'], last['id']]
+
+    return [
+        ('Indicador.get_by_id', lambda: Indicador.get_by_id(top)),
+        ('Indicador.get_by_pub_id', lambda: Indicador.get_by_pub_id(indicator['pub_id'])),
+        ('Indicador.get_all', Indicador.get_all),
+        ('Indicador.get_active', Indicador.get_active),
+        ('Indicador.get_page(50)', lambda: Indicador.get_page(50)),
+        ('Indicador.search', lambda: Indicador.search('momentum')),
+        ('Cliente.get_by_id', lambda: Cliente.get_by_id(heavy_client)),
+        ('Cliente.get_by_username', lambda: Cliente.get_by_username(client['username_tradingview'])),
+        ('Cliente.get_all', Cliente.get_all),
+        ('Cliente.get_active', Cliente.get_active),
+        ('Cliente.get_page(50)', lambda: Cliente.get_page(50)),
+        ('Cliente.get_page(50, deep)', lambda: Cliente.get_page(50, [heavy_client // 2])),
+        ('Cliente.search', lambda: Cliente.search('garcía')),
+        ('Cliente.search(prefix)', lambda: Cliente.search('ana_gar')),
+        ('Cliente.get_with_access_count', Cliente.get_with_access_count),
+        ('Acceso.get_by_id', lambda: Acceso.get_by_id(last['id'])),
+        ('Acceso.get_by_client_and_indicator',
+         lambda: Acceso.get_by_client_and_indicator(heavy_client, top)),
+        ('Acceso.get_client_accesses', lambda: Acceso.get_client_accesses(heavy_client)),
+        ('Acceso.get_indicator_accesses', lambda: Acceso.get_indicator_accesses(top)),
+        ('Acceso.get_active_accesses', Acceso.get_active_accesses),
+        ('Acceso.get_active_accesses(50)', lambda: Acceso.get_active_accesses(50)),
+        ('Acceso.get_active_accesses(50, next)', lambda: Acceso.get_active_accesses(50, key)),
+        ('Acceso.get_grouped_by_client', Acceso.get_grouped_by_client),
+        ('Acceso.get_grouped_by_client(50)', lambda: Acceso.get_grouped_by_client(50)),
+        ('Acceso.get_expiring_soon', Acceso.get_expiring_soon),
+        ('Acceso.get_expiring_soon(50)', lambda: Acceso.get_expiring_soon(7, 50)),
+        ('Acceso.get_expired', Acceso.get_expired),
+        ('Acceso.get_upcoming_expirations(1000)', lambda: Acceso.get_upcoming_expirations(1000)),
+        ('Acceso.get_entitlements(top)', lambda: Acceso.get_entitlements([indicator['pub_id']])),
+        ('Acceso.is_active_for', lambda: Acceso.is_active_for(client['username_tradingview'], indicator['pub_id'])),
+        ('Database.get_stats', db.get_stats),
+        ('DashboardService.get_dashboard_stats', services.DashboardService.get_dashboard_stats),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default=DEFAULT_DB)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--only', default='', help='run labels starting with this prefix')
+    parser.add_argument('--no-plans', action='store_true')
+    args = parser.parse_args()
+    if not os.path.exists(args.db):
+        raise SystemExit(f"{args.db} not found: run benchmarks/generate_data.py first")
+
+    from src import database
+    db = database.Database(args.db)
+    database.db = db
+    from src import models, services
+    models.db = db
+    services.db = db
+    recorder = RecordingDatabase(db)
+
+    counts = db.get_stats()
+    print(f"\n{args.db}: {counts['total_clientes']:,} clients, {counts['total_accesos']:,} accesses "
+          f"({counts['accesos_activos']:,} active); median of {args.repeat} runs\n")
+    print(f"{'query':<42}{'rows':>9}{'ms':>10}")
+
+    plans = []
+    for label, call in cases(models, services, db):
+        if not label.startswith(args.only):
+            continue
+        recorder.statements = []
+        result = call()
+        statements = list(recorder.statements)
+        samples = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            call()
+            samples.append(time.perf_counter() - start)
+        rows = len(result) if isinstance(result, list) else int(bool(result))
+        print(f"{label:<42}{rows:>9,}{statistics.median(samples) * 1000:>10.2f}")
+        plans.append((label, statements))
+
+    if args.no_plans:
+        return
+    for label, statements in plans:
+        print(f"\n== {label}")
+        for query, params in statements:
+            print('   ' + ' '.join(query.split())[:160])
+            for line in recorder.plan(query, params):
+                print('   ' + line)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+"""
+Benchmark: end-to-end access flows against the local TradingView stub
+
+Starts benchmarks/tv_stub.py in a subprocess and points the service at it
+via TRADINGVIEW_BASE_URL. The database and cookie file live in a temporary
+directory. Each flow runs --ops operations from --concurrency threads over
+distinct usernames and reports latency percentiles and throughput:
+
+    grant          AccesoService.grant_access (DB + outbox row; TradingView is async)
+    sync           outbox tasks from 'grant' applied against TradingView
+    check          AccesoService.check_access (DB + roster lookup)
+    legacy_check   GET    /access/<username>?indicator_id=
+    revoke         AccesoService.revoke_access
+    legacy_grant   POST   /access/<username> {indicator_id, days} (inline TradingView)
+    legacy_revoke  DELETE /access/<username> {indicator_id}
+    bulk           AccesoService.grant_access_to_all_indicators (one user x every indicator)
+    legacy_bulk    POST   /access/<username> {pine_ids, duration} (concurrent fan-out)
+
+The client's adaptive rate limiter is raised to --rate-limit requests/s per
+endpoint so the service, not the default 5 req/s budget, is measured.
+
+Usage:
+    python benchmarks/e2e_access.py [--ops 200] [--concurrency 8] [--indicators 5]
+                                    [--latency-ms 20] [--error-rate 0] [--throttle-rate 0]
+                                    [--flows grant,sync,check,...]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+FLOWS = ('grant', 'sync', 'check', 'legacy_check', 'revoke',
+         'legacy_grant', 'legacy_revoke', 'bulk', 'legacy_bulk')
+ADMIN = {'X-Admin-Token': 'bench'}
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def run_flow(name: str, operation: Callable[[int], bool], ops: int, concurrency: int):
+    """Run operation(i) for i in range(ops); it returns False (or raises) on failure"""
+    latencies: List[float] = []
+    errors = 0
+    lock = threading.Lock()
+
+    def one(i):
+        nonlocal errors
+        start = time.perf_counter()
+        try:
+            ok = operation(i)
+        except Exception:
+            ok = False
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            errors += 0 if ok else 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(one, range(ops)))
+    wall = time.perf_counter() - started
+
+    ms = [latency * 1000 for latency in latencies]
+    print(f"{name:<15}{len(ms):>7}{errors:>8}{statistics.median(ms):>10.1f}{percentile(ms, 95):>10.1f}"
+          f"{percentile(ms, 99):>10.1f}{len(ms) / wall:>12.1f}")
+
+
+def start_stub(args):
+    command = [sys.executable, os.path.join(ROOT, 'benchmarks', 'tv_stub.py'), '--port', '0',
+               '--latency-ms', str(args.latency_ms), '--error-rate', str(args.error_rate),
+               '--throttle-rate', str(args.throttle_rate), '--retry-after', str(args.retry_after),
+               '--seed', '42']
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline()
+    return process, line.strip().rsplit(' ', 1)[-1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--ops', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--indicators', type=int, default=5)
+    parser.add_argument('--latency-ms', type=float, default=20.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--throttle-rate', type=float, default=0.0)
+    parser.add_argument('--retry-after', type=float, default=1.0)
+    parser.add_argument('--rate-limit', type=float, default=1000.0)
+    parser.add_argument('--flows', default=','.join(FLOWS))
+    args = parser.parse_args()
+    flows = [flow.strip() for flow in args.flows.split(',') if flow.strip()]
+    unknown = set(flows) - set(FLOWS)
+    if unknown:
+        parser.error(f"unknown flows: {', '.join(sorted(unknown))}")
+
+    stub, base_url = start_stub(args)
+    tmp = tempfile.TemporaryDirectory()
+    try:
+        os.chdir(tmp.name)
+        os.environ.update({
+            'TRADINGVIEW_BASE_URL': base_url,
+            'ADMIN_TOKEN': ADMIN['X-Admin-Token'],
+            'TV_RATE_LIMIT': str(args.rate_limit),
+            'TV_RATE_BURST': str(int(args.rate_limit)),
+        })
+        from src.cookie_manager import CookieManager
+        CookieManager().save_cookies('stub-session', 'stub-sign')
+
+        from src.server import create_app
+        from src.services import AccesoService, IndicadorService
+        from src.models import SyncTask
+        from src.outbox import OutboxWorker
+        app = create_app(start_background=False)
+
+        # Validate the session up front (injected faults may hit the first tvcoins probe)
+        from src.tradingview import get_client
+        for _ in range(20):
+            try:
+                get_client(validate=False).ensure_session(force=True)
+                break
+            except Exception:
+                time.sleep(0.1)
+
+        pub_ids = [f'PUB;stub{i:04d}' for i in range(args.indicators)]
+        for i, pub_id in enumerate(pub_ids):
+            IndicadorService.create_indicator(f'Stub indicator {i}', pub_id)
+        pub_id = pub_ids[0]
+
+        local = threading.local()
+
+        def client():
+            # Flask test clients are not thread-safe: one per benchmark thread
+            if not hasattr(local, 'client'):
+                local.client = app.test_client()
+            return local.client
+
+        def sync_one(_):
+            # Claim and apply one outbox task, as the worker does
+            tasks = SyncTask.claim_due(1)
+            if not tasks:
+                return False
+            worker._process(tasks[0])
+            return SyncTask.get_by_id(tasks[0]['id'])['estado'] == 'completado'
+
+        worker = OutboxWorker()
+        operations = {
+            'grant': lambda i: AccesoService.grant_access(f'svc{i:06d}', pub_id, 30)['success'],
+            'sync': sync_one,
+            'check': lambda i: AccesoService.check_access(f'svc{i:06d}', pub_id)['has_access'],
+            'legacy_check': lambda i: client().get(f'/access/svc{i:06d}?indicator_id={pub_id}',
+                                                   headers=ADMIN).get_json()['status'] == 'checked',
+            'revoke': lambda i: AccesoService.revoke_access(f'svc{i:06d}', pub_id)['success'],
+            'legacy_grant': lambda i: client().post(f'/access/legacy{i:06d}', headers=ADMIN,
+                                                    json={'indicator_id': pub_id, 'days': 7}
+                                                    ).get_json()['success'],
+            'legacy_revoke': lambda i: client().delete(f'/access/legacy{i:06d}', headers=ADMIN,
+                                                       json={'indicator_id': pub_id}).get_json()['success'],
+            'bulk': lambda i: AccesoService.grant_access_to_all_indicators(f'bulk{i:06d}', 30)['success'],
+            'legacy_bulk': lambda i: client().post(f'/access/fanout{i:06d}', headers=ADMIN,
+                                                   json={'pine_ids': pub_ids, 'duration': '7D'}
+                                                   ).status_code == 200,
+        }
+
+        print(f"\nstub {base_url}: latency {args.latency_ms}ms, errors {args.error_rate:.1%}, "
+              f"429s {args.throttle_rate:.1%}; {args.ops} ops x {args.concurrency} threads, "
+              f"{args.indicators} indicators\n")
+        print(f"{'flow':<15}{'ops':>7}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'ops/sec':>12}")
+        for flow in flows:
+            run_flow(flow, operations[flow], args.ops, args.concurrency)
+    finally:
+        os.chdir(ROOT)
+        stub.terminate()
+        stub.wait()
+        tmp.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+"""
+Synthetic data generator for database scaling benchmarks
+
+Fills indicadores, clientes and accesos with realistic skew:
+
+- indicator popularity follows a Zipf-like curve (a few indicators hold most accesses)
+- accesses per client are exponentially distributed (most have a few, some many)
+- active expirations cluster in the coming weeks; 10% of active accesses are
+  permanent and ~1% are already past due, waiting for the expiry job
+- history: expired and revoked rows, including repeats of the same pair
+
+The schema is created by the service's own Database class, so triggers
+(stats counters, FTS indexes) and indexes are exactly those of production.
+
+Usage:
+    python benchmarks/generate_data.py [--db PATH] [--clients 100000] [--accesses 1000000]
+                                       [--indicators 200] [--seed 42] [--force]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+DEFAULT_DB = os.path.join(tempfile.gettempdir(), 'pinescript_scale.db')
+BATCH = 50000
+
+FIRST_NAMES = ['Ana', 'Luis', 'María', 'Carlos', 'Sofía', 'Jorge', 'Lucía', 'Pedro', 'Elena', 'Diego',
+               'John', 'Emma', 'Liam', 'Olivia', 'Noah', 'Mia', 'Hiro', 'Yuki', 'Ahmed', 'Fatima']
+LAST_NAMES = ['García', 'Martínez', 'López', 'González', 'Pérez', 'Rodríguez', 'Smith', 'Johnson',
+              'Brown', 'Tanaka', 'Silva', 'Khan', 'Müller', 'Rossi', 'Dubois', 'Novak']
+INDICATOR_WORDS = ['Trend', 'Momentum', 'Volume', 'Scalper', 'Swing', 'Breakout', 'Oscillator',
+                   'Divergence', 'Smart Money', 'Order Block', 'Liquidity', 'Fibonacci', 'Pivot']
+DOMAINS = ['gmail.com', 'hotmail.com', 'outlook.com', 'yahoo.com', 'proton.me']
+
+
+def fmt(value: datetime) -> str:
+    return value.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def generate_indicators(rng, count):
+    rows = []
+    for i in range(count):
+        words = rng.sample(INDICATOR_WORDS, 2)
+        estado = 'activo' if rng.random() < 0.9 else 'inactivo'
+        rows.append((f"{words[0]} {words[1]} v{i}", f"PUB;{rng.getrandbits(64):016x}",
+                     f"{rng.choice(['1.0', '2.1', '3.0', '4.2'])}", round(rng.uniform(0, 99), 2),
+                     f"{words[0]} and {words[1].lower()} signals", estado))
+    return rows
+
+
+def generate_clients(rng, count, now):
+    rows = []
+    for i in range(count):
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        username = f"{first.lower()}_{last.lower()}{i}"
+        estado = 'activo' if rng.random() < 0.95 else 'inactivo'
+        registered = now - timedelta(days=rng.expovariate(1 / 400))
+        rows.append((username, f"{username}@{rng.choice(DOMAINS)}", f"{first} {last}", fmt(registered), estado))
+    return rows
+
+
+def generate_accesses(rng, clients, indicators, total, now):
+    """Yield access rows; at most one active row per (client, indicator) pair"""
+    weights = [1 / (rank + 1) ** 1.1 for rank in range(indicators)]
+    per_client = total / clients
+    produced = 0
+    for cliente_id in range(1, clients + 1):
+        remaining_clients = clients - cliente_id + 1
+        count = max(1, int(rng.expovariate(1 / per_client)) + 1)
+        if cliente_id == clients:
+            count = max(0, total - produced)  # Land exactly on the requested total
+        else:
+            count = min(count, max(0, total - produced - (remaining_clients - 1)))
+        active_pairs = set()
+        for indicador_id in rng.choices(range(1, indicators + 1), weights=weights, k=count):
+            duration = rng.choice((7, 30, 30, 30, 90, 365))
+            roll = rng.random()
+            if indicador_id not in active_pairs and roll < 0.65:
+                active_pairs.add(indicador_id)
+                estado = 'activo'
+                if rng.random() < 0.10:
+                    fecha_fin = None
+                elif rng.random() < 0.01:
+                    fecha_fin = now - timedelta(hours=rng.uniform(0, 48))  # Due, not yet expired
+                else:
+                    fecha_fin = now + timedelta(days=rng.expovariate(1 / 20))
+            else:
+                estado = 'expirado' if roll < 0.9 else 'revocado'
+                fecha_fin = now - timedelta(days=rng.expovariate(1 / 90))
+            fecha_inicio = (fecha_fin or now) - timedelta(days=duration)
+            yield (cliente_id, indicador_id, fmt(fecha_inicio), fmt(fecha_fin) if fecha_fin else None,
+                   'temporal' if fecha_fin else 'permanente', estado, fmt(fecha_inicio))
+            produced += 1
+
+
+def insert_batches(db, query, rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH:
+            db.execute_many(query, batch)
+            batch = []
+    if batch:
+        db.execute_many(query, batch)
+
+
+def generate(db_path, clients, accesses, indicators, seed, force=False):
+    if os.path.exists(db_path):
+        if not force:
+            raise SystemExit(f"{db_path} exists (use --force to replace it)")
+        for suffix in ('', '-wal', '-shm', '.lock'):
+            if os.path.exists(db_path + suffix):
+                os.remove(db_path + suffix)
+
+    from src.database import Database
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    db = Database(db_path)
+
+    started = time.perf_counter()
+    db.execute_many("""
+        INSERT INTO indicadores (nombre, pub_id, version, precio, descripcion, estado)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, generate_indicators(rng, indicators))
+    insert_batches(db, """
+        INSERT INTO clientes (username_tradingview, email, nombre_completo, fecha_registro, estado)
+        VALUES (?, ?, ?, ?, ?)
+    """, generate_clients(rng, clients, now))
+    print(f"  {indicators:,} indicators, {clients:,} clients in {time.perf_counter() - started:.1f}s")
+
+    phase = time.perf_counter()
+    insert_batches(db, """
+        INSERT INTO accesos (cliente_id, indicador_id, fecha_inicio, fecha_fin, tipo_acceso, estado, fecha_creacion)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, generate_accesses(rng, clients, indicators, accesses, now))
+    print(f"  {accesses:,} accesses in {time.perf_counter() - phase:.1f}s")
+
+    phase = time.perf_counter()
+    with db.transaction() as conn:
+        conn.execute("ANALYZE")
+    print(f"  ANALYZE in {time.perf_counter() - phase:.1f}s")
+    db.close()
+    return db
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default=DEFAULT_DB)
+    parser.add_argument('--clients', type=int, default=100000)
+    parser.add_argument('--accesses', type=int, default=1000000)
+    parser.add_argument('--indicators', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--force', action='store_true', help='replace an existing database')
+    args = parser.parse_args()
+
+    print(f"Generating {args.db}")
+    started = time.perf_counter()
+    db = generate(args.db, args.clients, args.accesses, args.indicators, args.seed, args.force)
+    stats = db.get_stats()
+    print(f"Done in {time.perf_counter() - started:.1f}s: {stats}")
+    db.close()
+
+
+if __name__ == '__main__':
+    main()
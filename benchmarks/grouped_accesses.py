@@ -0,0 +1,142 @@
+"""
+Benchmark: grouped access view, Python grouping vs. one JSON1 aggregate query
+
+Builds a temporary database with N clients holding a few active accesses
+each, then times the previous implementation (fetch every access row,
+group in a dict, parse fecha_fin per row, count statuses per client)
+against Acceso.get_grouped_by_client().
+
+Usage:
+    python benchmarks/grouped_accesses.py [--clients 10000] [--indicators 20] [--per-client 3]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+
+def legacy_grouped(db):
+    """The dict-based grouping the service used before the aggregate query"""
+    rows = db.execute_query("""
+        SELECT a.*, c.username_tradingview, c.nombre_completo, c.email,
+               i.nombre as indicador_nombre, i.pub_id, i.version
+        FROM accesos a
+        JOIN clientes c ON a.cliente_id = c.id
+        JOIN indicadores i ON a.indicador_id = i.id
+        WHERE a.estado = 'activo'
+        ORDER BY a.fecha_fin ASC
+    """)
+    clients = {}
+    now = datetime.utcnow()
+    for access in rows:
+        client = clients.setdefault(access['cliente_id'], {
+            'client_id': access['cliente_id'],
+            'username_tradingview': access['username_tradingview'],
+            'nombre_completo': access['nombre_completo'],
+            'email': access['email'] or '',
+            'indicators': []
+        })
+        status = 'active'
+        if access['fecha_fin']:
+            expiry = datetime.strptime(access['fecha_fin'], '%Y-%m-%d %H:%M:%S')
+            if expiry < now:
+                status = 'expired'
+            elif (expiry - now).days <= 7:
+                status = 'expiring'
+        client['indicators'].append({
+            'indicator_id': access['indicador_id'],
+            'indicator_name': access['indicador_nombre'],
+            'indicator_version': access['version'] or '1.0',
+            'pub_id': access['pub_id'],
+            'access_id': access['id'],
+            'fecha_inicio': access['fecha_inicio'],
+            'fecha_fin': access['fecha_fin'],
+            'estado': access['estado'],
+            'fecha_creacion': access['fecha_creacion'],
+            'status': status
+        })
+    grouped = []
+    for client in clients.values():
+        indicators = client['indicators']
+        client.update({
+            'indicators_count': len(indicators),
+            'active_indicators': len([i for i in indicators if i['status'] == 'active']),
+            'expiring_indicators': len([i for i in indicators if i['status'] == 'expiring']),
+            'expired_indicators': len([i for i in indicators if i['status'] == 'expired'])
+        })
+        grouped.append(client)
+    grouped.sort(key=lambda x: x['username_tradingview'])
+    return grouped
+
+
+def populate(db, clients, indicators, per_client):
+    random.seed(42)
+    now = datetime.utcnow()
+    db.execute_many("INSERT INTO indicadores (nombre, pub_id) VALUES (?, ?)",
+                    [(f"Indicator {i}", f"PUB;bench{i}") for i in range(indicators)])
+    db.execute_many("INSERT INTO clientes (username_tradingview, email) VALUES (?, ?)",
+                    [(f"bench_user_{i:06d}", f"user{i}@example.com") for i in range(clients)])
+    rows = []
+    for client_id in range(1, clients + 1):
+        for indicator_id in random.sample(range(1, indicators + 1), per_client):
+            days = random.randint(-5, 60)
+            fecha_fin = None if days > 55 else (now + timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
+            rows.append((client_id, indicator_id, fecha_fin))
+    db.execute_many("INSERT INTO accesos (cliente_id, indicador_id, fecha_fin) VALUES (?, ?, ?)", rows)
+    return len(rows)
+
+
+def timed(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=10000)
+    parser.add_argument('--indicators', type=int, default=20)
+    parser.add_argument('--per-client', type=int, default=3)
+    parser.add_argument('--page-size', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        from src import database
+        db = database.Database(os.path.join(tmp, 'bench.db'))
+        database.db = db
+        from src import models
+        models.db = db
+
+        accesses = populate(db, args.clients, args.indicators, args.per_client)
+        print(f"\n{args.clients:,} clients, {accesses:,} active accesses\n")
+
+        legacy_time, legacy = timed(lambda: legacy_grouped(db), args.repeat)
+        sql_time, grouped = timed(models.Acceso.get_grouped_by_client, args.repeat)
+        page_time, page = timed(lambda: models.Acceso.get_grouped_by_client(args.page_size), args.repeat)
+
+        # Same clients, counts and access ids
+        def summary(rows):
+            return [(r['username_tradingview'], r['indicators_count'], r['active_indicators'],
+                     r['expiring_indicators'], r['expired_indicators'],
+                     sorted(i['access_id'] for i in r['indicators'])) for r in rows]
+        assert summary(legacy) == summary(grouped), "grouped views differ"
+
+        print(f"{'implementation':<34}{'seconds':>10}")
+        print(f"{'python grouping (previous)':<34}{legacy_time:>10.3f}")
+        print(f"{'json1 aggregate query':<34}{sql_time:>10.3f}")
+        print(f"{f'json1 aggregate, page of {args.page_size}':<34}{page_time:>10.3f}")
+        print(f"\nspeedup (full view): {legacy_time / sql_time:.1f}x")
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
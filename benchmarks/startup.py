@@ -0,0 +1,156 @@
+"""
+Benchmark: service startup time
+
+Every run is a fresh interpreter (as on a deploy restart) started in a
+temporary directory, so data/pinescript_control.db there is the database
+under test. Each run reports:
+
+    import         import src.server (Flask and the route modules' dependencies)
+    db_init        Database() for the global db: open SQLite, schema check/migrations
+    create_app     blueprint registration
+    first_request  GET /api/v1/dashboard through the test client
+    process        wall time of the whole subprocess, interpreter included
+
+Scenarios:
+    cold      no database file yet: full schema creation
+    migrate   existing database whose stored schema version is reset, i.e. what
+              every start cost before the version check
+    warm      existing database at the current schema version
+
+It also lists which of the lazily imported modules were loaded by startup,
+and what importing them up front (as before) would add.
+
+Usage:
+    python benchmarks/startup.py [--runs 5] [--clients 5000] [--per-client 3]
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+PHASES = ('import', 'db_init', 'create_app', 'first_request', 'process')
+LAZY_MODULES = ('requests', 'urllib3', 'dateutil', 'asyncio')
+
+CHILD = r'''
+import json, os, sys, time
+os.environ['ADMIN_TOKEN'] = 'bench'
+timings = {}
+start = time.perf_counter()
+import src.server
+timings['import'] = time.perf_counter() - start
+
+phase = time.perf_counter()
+from src.database import db
+timings['db_init'] = time.perf_counter() - phase
+
+phase = time.perf_counter()
+app = src.server.create_app(start_background=False)
+timings['create_app'] = time.perf_counter() - phase
+
+phase = time.perf_counter()
+response = app.test_client().get('/api/v1/dashboard', headers={'X-Admin-Token': 'bench'})
+timings['first_request'] = time.perf_counter() - phase
+assert response.status_code == 200, response.status_code
+
+print(json.dumps({'timings': timings, 'loaded': [m for m in LAZY_MODULES if m in sys.modules]}))
+'''
+
+
+def populate(cwd, clients, per_client):
+    """Let the service create its schema in cwd, then seed it; returns the database path"""
+    run_child(cwd)
+    db_path = os.path.join(cwd, 'data', 'pinescript_control.db')
+    random.seed(42)
+    now = datetime.utcnow()
+    conn = sqlite3.connect(db_path)
+    conn.executemany("INSERT INTO indicadores (nombre, pub_id) VALUES (?, ?)",
+                     [(f'Indicator {i}', f'PUB;{i:04d}') for i in range(20)])
+    conn.executemany("INSERT INTO clientes (username_tradingview, email) VALUES (?, ?)",
+                     [(f'user{i:06d}', f'user{i}@example.com') for i in range(clients)])
+    rows = []
+    for client_id in range(1, clients + 1):
+        for indicator_id in random.sample(range(1, 21), per_client):
+            fecha_fin = (now + timedelta(days=random.randint(-30, 365))).strftime('%Y-%m-%d %H:%M:%S')
+            rows.append((client_id, indicator_id, fecha_fin))
+    conn.executemany("INSERT INTO accesos (cliente_id, indicador_id, fecha_fin) VALUES (?, ?, ?)", rows)
+    conn.commit()
+    conn.close()
+    return db_path, len(rows)
+
+
+def run_child(cwd):
+    env = dict(os.environ, PYTHONPATH=ROOT, PYTHONDONTWRITEBYTECODE='1')
+    code = f"LAZY_MODULES = {LAZY_MODULES!r}\n" + CHILD
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, '-c', code], cwd=cwd, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    wall = time.perf_counter() - start
+    result = json.loads(output.strip().splitlines()[-1])
+    result['timings']['process'] = wall
+    return result
+
+
+def deferred_import_cost():
+    """Seconds a fresh interpreter spends importing the modules startup now defers"""
+    code = ("import time; start = time.perf_counter()\n"
+            "import requests, urllib3, dateutil.parser, dateutil.relativedelta, asyncio, concurrent.futures\n"
+            "print(time.perf_counter() - start)")
+    output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout
+    return float(output.strip())
+
+
+def scenario(name, runs, prepare, cwd):
+    samples = []
+    loaded = []
+    for _ in range(runs):
+        prepare()
+        result = run_child(cwd)
+        samples.append(result['timings'])
+        loaded = result['loaded']
+    medians = {phase: statistics.median(s[phase] for s in samples) for phase in PHASES}
+    print(f"{name:<10}" + ''.join(f"{medians[p] * 1000:>15.1f}" for p in PHASES))
+    return medians, loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--clients', type=int, default=5000)
+    parser.add_argument('--per-client', type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as cold_dir, tempfile.TemporaryDirectory() as tmp:
+        db_path, accesses = populate(tmp, args.clients, args.per_client)
+        print(f"\n{args.clients:,} clients, {accesses:,} accesses; median of {args.runs} runs (ms)\n")
+        print(f"{'scenario':<10}" + ''.join(f"{p:>15}" for p in PHASES))
+
+        def fresh():
+            shutil.rmtree(os.path.join(cold_dir, 'data'), ignore_errors=True)
+
+        def reset_version():
+            conn = sqlite3.connect(db_path)
+            conn.execute("PRAGMA user_version = 0")
+            conn.close()
+
+        scenario('cold', args.runs, fresh, cold_dir)
+        migrate, _ = scenario('migrate', args.runs, reset_version, tmp)
+        warm, loaded = scenario('warm', args.runs, lambda: None, tmp)
+
+        print(f"\ndb_init, warm vs migrate: {migrate['db_init'] / warm['db_init']:.1f}x faster")
+        print(f"lazily imported modules loaded at startup: {', '.join(loaded) or 'none'}")
+        cost = statistics.median(deferred_import_cost() for _ in range(args.runs))
+        print(f"importing them eagerly would add: {cost * 1000:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,236 @@
+"""
+Local TradingView stub for benchmarks and manual testing
+
+Emulates the endpoints the client uses, with an in-memory roster per pine_id:
+
+    GET  /tvcoins/details/                   session check (any cookie is accepted)
+    GET  /username_hint/?s=<name>            every name exists except those starting with 'invalid'
+    POST /pine_perm/list_users/              roster, newest first, limit/offset pagination with 'next';
+                                             an optional 'username' field filters it
+    POST /pine_perm/add/                     multipart pine_id, username_recip[, expiration]
+    POST /pine_perm/modify_user_expiration/  same fields
+    POST /pine_perm/remove/                  pine_id, username_recip
+    GET  /__stub__/stats                     request counts per endpoint
+    POST /__stub__/reset                     clear rosters and counters
+
+Latency, error rate (HTTP 500) and throttling (HTTP 429 with Retry-After)
+are injectable. Point the service at it with TRADINGVIEW_BASE_URL.
+
+Usage:
+    python benchmarks/tv_stub.py [--port 8765] [--latency-ms 50] [--error-rate 0.01] [--throttle-rate 0.01]
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from collections import Counter
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional
+from urllib.parse import parse_qs, urlencode, urlparse
+
+ENDPOINTS = {
+    '/tvcoins/details/': 'tvcoins',
+    '/username_hint/': 'username_hint',
+    '/pine_perm/list_users/': 'list_users',
+    '/pine_perm/add/': 'add_access',
+    '/pine_perm/modify_user_expiration/': 'modify_access',
+    '/pine_perm/remove/': 'remove_access',
+}
+
+
+class StubState:
+    """Rosters and counters shared by every request thread"""
+
+    def __init__(self, latency_ms: float = 0.0, error_rate: float = 0.0,
+                 throttle_rate: float = 0.0, retry_after: float = 1.0, seed: Optional[int] = None):
+        self.latency = latency_ms / 1000.0
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            # pine_id -> username (lowercase) -> {'username', 'expiration', 'created'}
+            self.rosters: Dict[str, Dict[str, Dict[str, Any]]] = {}
+            self.sequence = 0
+            self.requests: Counter = Counter()
+            self.errors: Counter = Counter()
+            self.throttled: Counter = Counter()
+
+    def fault(self, endpoint: str) -> Optional[int]:
+        """Injected status for this request (500 or 429), or None to serve it"""
+        with self.lock:
+            self.requests[endpoint] += 1
+            roll = self.random.random()
+            if roll < self.error_rate:
+                self.errors[endpoint] += 1
+                return 500
+            if roll < self.error_rate + self.throttle_rate:
+                self.throttled[endpoint] += 1
+                return 429
+        return None
+
+    def sleep(self):
+        if self.latency:
+            time.sleep(self.latency * self.random.uniform(0.5, 1.5))
+
+    def grant(self, pine_id: str, username: str, expiration: Optional[str]):
+        with self.lock:
+            roster = self.rosters.setdefault(pine_id, {})
+            key = username.lower()
+            entry = roster.get(key)
+            if entry is None:
+                self.sequence += 1
+                entry = roster[key] = {'username': username, 'created': self.sequence}
+            entry['expiration'] = expiration
+
+    def remove(self, pine_id: str, username: str):
+        with self.lock:
+            self.rosters.get(pine_id, {}).pop(username.lower(), None)
+
+    def page(self, pine_id: str, limit: int, offset: int, username: str = ''):
+        with self.lock:
+            users = sorted(self.rosters.get(pine_id, {}).values(), key=lambda u: -u['created'])
+            if username:
+                users = [u for u in users if username.lower() in u['username'].lower()]
+            return [{'username': u['username'], 'expiration': u['expiration']}
+                    for u in users[offset:offset + limit]], len(users)
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                'requests': dict(self.requests),
+                'errors': dict(self.errors),
+                'throttled': dict(self.throttled),
+                'rosters': {pine_id: len(users) for pine_id, users in self.rosters.items()}
+            }
+
+
+def _form_fields(content_type: str, body: bytes) -> Dict[str, str]:
+    """Fields of a multipart/form-data or urlencoded body"""
+    if content_type.startswith('multipart/form-data'):
+        message = BytesParser(policy=HTTP).parsebytes(
+            b'Content-Type: ' + content_type.encode() + b'\r\n\r\n' + body)
+        return {part.get_param('name', header='content-disposition'): part.get_content()
+                for part in message.iter_parts()}
+    return {key: values[0] for key, values in parse_qs(body.decode()).items()}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    state: StubState
+    protocol_version = 'HTTP/1.1'  # Keep-alive, like TradingView
+    # Headers and body are separate writes: without TCP_NODELAY each response
+    # can stall ~40ms on Nagle + delayed ACK
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, payload: Any = None, headers: Optional[Dict[str, str]] = None):
+        body = json.dumps(payload if payload is not None else {}).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _handle(self, method: str):
+        url = urlparse(self.path)
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+
+        if url.path == '/__stub__/stats':
+            return self._send(200, self.state.stats())
+        if url.path == '/__stub__/reset' and method == 'POST':
+            self.state.reset()
+            return self._send(200, {'reset': True})
+
+        endpoint = ENDPOINTS.get(url.path)
+        if endpoint is None:
+            return self._send(404, {'detail': 'Not found'})
+
+        self.state.sleep()
+        status = self.state.fault(endpoint)
+        if status == 429:
+            return self._send(429, {'detail': 'Too many requests'},
+                              {'Retry-After': str(self.state.retry_after)})
+        if status == 500:
+            return self._send(500, {'detail': 'Internal error'})
+
+        query = parse_qs(url.query)
+        if endpoint == 'tvcoins':
+            return self._send(200, {'partner_fiat_balance': 0, 'link': 'stub-vendor',
+                                    'partner_status': 1, 'aff_id': 0})
+        if endpoint == 'username_hint':
+            name = query.get('s', [''])[0]
+            return self._send(200, [] if not name or name.lower().startswith('invalid')
+                              else [{'username': name}])
+
+        fields = _form_fields(self.headers.get('Content-Type', ''), body)
+        pine_id = fields.get('pine_id', '')
+        if endpoint == 'list_users':
+            limit = int(query.get('limit', ['10'])[0])
+            offset = int(query.get('offset', ['0'])[0])
+            results, count = self.state.page(pine_id, limit, offset, fields.get('username', ''))
+            next_url = None
+            if offset + len(results) < count:
+                next_url = f"{url.path}?{urlencode({'limit': limit, 'offset': offset + limit, 'order_by': '-created'})}"
+            return self._send(200, {'results': results, 'next': next_url, 'count': count})
+
+        username = fields.get('username_recip', '')
+        if not pine_id or not username:
+            return self._send(422, {'detail': 'pine_id and username_recip are required'})
+        if endpoint == 'remove_access':
+            self.state.remove(pine_id, username)
+        else:
+            self.state.grant(pine_id, username, fields.get('expiration'))
+        return self._send(200, {'status': 'ok'})
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+
+def start_stub(port: int = 0, host: str = '127.0.0.1', **options) -> ThreadingHTTPServer:
+    """Serve the stub from a daemon thread; the bound URL is server.base_url"""
+    handler = type('Handler', (StubHandler,), {'state': StubState(**options)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.base_url = f"http://{host}:{server.server_address[1]}"
+    server.state = handler.state
+    threading.Thread(target=server.serve_forever, name='tv-stub', daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765, help='0 picks a free port')
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='mean added latency (+/- 50%%)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of calls answered with 500')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='fraction of calls answered with 429')
+    parser.add_argument('--retry-after', type=float, default=1.0, help='Retry-After seconds sent with 429')
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+
+    server = start_stub(args.port, args.host, latency_ms=args.latency_ms, error_rate=args.error_rate,
+                        throttle_rate=args.throttle_rate, retry_after=args.retry_after, seed=args.seed)
+    print(f"TradingView stub listening on {server.base_url}", flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
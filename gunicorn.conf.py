@@ -0,0 +1,30 @@
+"""
+Gunicorn settings for PineScript Control Access
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+The app is built once in the master (schema setup and migrations run there,
+under the database lock file) and forked into the workers. Each worker then
+starts its own background threads in post_fork.
+"""
+import os
+
+bind = os.getenv('BIND', f"0.0.0.0:{os.getenv('PORT', '5000')}")
+workers = int(os.getenv('WEB_CONCURRENCY', '2'))
+# Requests mostly wait on TradingView or SQLite: threads are cheaper than processes
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', '8'))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
+graceful_timeout = 30
+preload_app = True
+
+
+def pre_fork(server, worker):
+    # The master opened SQLite while building the app; children open their own
+    from src.database import db
+    db.close()
+
+
+def post_fork(server, worker):
+    from src.server import start_background_services
+    start_background_services()
@@ -0,0 +1,132 @@
+"""
+In-process caches for PineScript Control Access
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+# Read-endpoint response cache: entries, seconds, largest body kept (bytes)
+RESPONSE_CACHE_SIZE = int(os.getenv('RESPONSE_CACHE_SIZE', '256'))
+RESPONSE_CACHE_TTL = float(os.getenv('RESPONSE_CACHE_TTL', '30'))
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv('RESPONSE_CACHE_MAX_BYTES', str(2 * 1024 * 1024)))
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire after a per-entry TTL"""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: 'OrderedDict[Hashable, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING:
+                self.misses += 1
+                return default
+            value, expires_at = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + (self.ttl if ttl is None else ttl))
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: Hashable):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': round(self.hits / lookups, 3) if lookups else 0.0
+            }
+
+
+class GenerationCache:
+    """Cache invalidated wholesale by bumping a generation counter on every write.
+
+    Readers take the generation before computing a value and hand it back to
+    set(); a value computed while a write happened is then simply dropped.
+    The TTL bounds staleness from writers this process does not see (other
+    workers, manual SQL) and from time-dependent values.
+    """
+
+    def __init__(self, maxsize: int = RESPONSE_CACHE_SIZE, ttl: float = RESPONSE_CACHE_TTL,
+                 max_item_bytes: int = RESPONSE_CACHE_MAX_BYTES):
+        self._cache = TTLCache(maxsize, ttl)
+        self.max_item_bytes = max_item_bytes
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.invalidations = 0
+        self.oversized = 0
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def bump(self):
+        """Invalidate everything cached so far (call after committing a write)"""
+        with self._lock:
+            self._generation += 1
+            self.invalidations += 1
+        self._cache.clear()
+
+    def get(self, key: Hashable) -> Tuple[int, Any]:
+        """Return (generation, value or None); pass the generation back to set()"""
+        generation = self._generation
+        return generation, self._cache.get((generation, key))
+
+    def set(self, generation: int, key: Hashable, value: Any) -> bool:
+        if generation != self._generation:
+            return False  # A write landed while the value was being computed
+        if hasattr(value, '__len__') and len(value) > self.max_item_bytes:
+            self.oversized += 1
+            return False
+        self._cache.set((generation, key), value)
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self._cache.stats()
+        stats.update({
+            'generation': self._generation,
+            'invalidations': self.invalidations,
+            'oversized_skipped': self.oversized,
+            'ttl': self._cache.ttl
+        })
+        return stats
+
+
+# Serialized JSON bodies of the admin read endpoints, invalidated by model writes
+response_cache = GenerationCache()
@@ -0,0 +1,122 @@
+"""
+Circuit breaker for TradingView HTTP calls
+
+After FAILURE_THRESHOLD consecutive failures (timeouts, connection errors,
+5xx) the circuit opens and calls fail immediately with CircuitOpenError for
+RESET_TIMEOUT seconds. Then a single trial call is let through (half-open):
+success closes the circuit, failure opens it again.
+"""
+import os
+import threading
+import time
+from typing import Any, Dict
+
+FAILURE_THRESHOLD = int(os.getenv('TV_BREAKER_THRESHOLD', '5'))
+RESET_TIMEOUT = float(os.getenv('TV_BREAKER_RESET', '30'))
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling TradingView while the circuit is open"""
+
+    def __init__(self, name: str, retry_after: float):
+        self.retry_after = retry_after
+        super().__init__(f"TradingView temporarily unavailable ({name} circuit open, "
+                         f"retry in {retry_after:.0f}s)")
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker, shared across threads"""
+
+    def __init__(self, name: str, failure_threshold: int = FAILURE_THRESHOLD,
+                 reset_timeout: float = RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+        self.times_opened = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = HALF_OPEN
+            self._trial_in_flight = False
+        return self._state
+
+    def retry_after(self) -> float:
+        with self._lock:
+            if self._current_state() != OPEN:
+                return 0.0
+            return max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+
+    def is_open(self) -> bool:
+        """True while calls would be rejected (does not consume the half-open trial)"""
+        with self._lock:
+            state = self._current_state()
+            return state == OPEN or (state == HALF_OPEN and self._trial_in_flight)
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may go out now"""
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return
+            if state == HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return
+            self.rejected += 1
+            remaining = self.reset_timeout - (time.monotonic() - self._opened_at)
+            raise CircuitOpenError(self.name, max(remaining, 1.0))
+
+    def cancel_trial(self):
+        """Release the half-open trial of a call that never reached TradingView"""
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._trial_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            if self._state != CLOSED:
+                print(f"✅ Circuit {self.name} closed")
+            self._state = CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != OPEN:
+                    self.times_opened += 1
+                    print(f"⚠️ Circuit {self.name} opened after {self._failures} consecutive failure(s)")
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+                self._trial_in_flight = False
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            state = self._current_state()
+            return {
+                'state': state,
+                'consecutive_failures': self._failures,
+                'times_opened': self.times_opened,
+                'rejected_calls': self.rejected,
+                'retry_after_seconds': round(max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at)), 1)
+                if state == OPEN else 0.0
+            }
+
+
+# One breaker for the whole TradingView host: when it is down, every endpoint is
+breaker = CircuitBreaker('tradingview')
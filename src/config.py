@@ -1,8 +1,33 @@
+import os
+
+# Point at a local stub (benchmarks/tv_stub.py) to test without real TradingView
+base_url = os.getenv('TRADINGVIEW_BASE_URL', 'https://www.tradingview.com').rstrip('/')
+# Sent as the Origin header on pine_perm calls
+origin = base_url
+
 urls = dict(
-  tvcoins="https://www.tradingview.com/tvcoins/details/",
-  username_hint="https://www.tradingview.com/username_hint/",
-  list_users="https://www.tradingview.com/pine_perm/list_users/",
-  modify_access="https://www.tradingview.com/pine_perm/modify_user_expiration/",
-  add_access="https://www.tradingview.com/pine_perm/add/",
-  remove_access="https://www.tradingview.com/pine_perm/remove/",
-  signin="https://www.tradingview.com/accounts/signin/")
+  tvcoins=f"{base_url}/tvcoins/details/",
+  username_hint=f"{base_url}/username_hint/",
+  list_users=f"{base_url}/pine_perm/list_users/",
+  modify_access=f"{base_url}/pine_perm/modify_user_expiration/",
+  add_access=f"{base_url}/pine_perm/add/",
+  remove_access=f"{base_url}/pine_perm/remove/",
+  signin=f"{base_url}/accounts/signin/")
+
+
+def profile_urls(username):
+  """Endpoints tried in order for the account's profile data"""
+  return [
+    f"{base_url}/pine_perm/get_author_data/?username={username}",
+    f"{base_url}/u/{username}/",
+    f"{base_url}/accounts/me/",
+    f"{base_url}/social/user/",
+  ]
+
+# (connect, read) timeouts in seconds per urls key; 'default' covers the rest
+_connect_timeout = float(os.getenv('TV_CONNECT_TIMEOUT', '3.05'))
+_read_timeout = float(os.getenv('TV_READ_TIMEOUT', '10'))
+timeouts = dict(
+  default=(_connect_timeout, _read_timeout),
+  list_users=(_connect_timeout, _read_timeout * 2),
+  profile=(_connect_timeout, _read_timeout / 2))
@@ -6,6 +6,9 @@ class CookieManager:
     def __init__(self, file_path=None):
         # Allow configurable cookie file path via environment variable
         self.file_path = file_path or os.getenv('COOKIE_FILE', 'data/cookies.json')
+        # Parsed cookies plus the (mtime, size) of the file they came from
+        self._cached = None
+        self._cached_signature = None
         self.ensure_data_dir()
     
     def ensure_data_dir(self):
@@ -31,19 +34,34 @@ class CookieManager:
             print(f"Error saving cookies: {e}")
             return False
     
+    def file_signature(self):
+        """(mtime_ns, size) del archivo de cookies, o None si no existe"""
+        try:
+            st = os.stat(self.file_path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+    
     def load_cookies(self):
-        """Cargar cookies desde archivo JSON"""
-        if not os.path.exists(self.file_path):
+        """Cargar cookies desde archivo JSON (solo se vuelve a leer si cambió su mtime)"""
+        signature = self.file_signature()
+        if signature is None:
+            self._cached = self._cached_signature = None
             return '', '', None
+        
+        if signature == self._cached_signature:
+            return self._cached
             
         try:
             with open(self.file_path, 'r') as f:
                 data = json.load(f)
-            return (
+            self._cached = (
                 data.get('tv_sessionid', ''),
                 data.get('tv_sessionid_sign', ''),
                 data.get('cookies_updated_at')
             )
+            self._cached_signature = signature
+            return self._cached
         except Exception as e:
             print(f"Error loading cookies: {e}")
             return '', '', None
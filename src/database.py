@@ -1,27 +1,198 @@
 import sqlite3
 import os
-from datetime import datetime
-from typing import Optional, List, Dict, Any
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Optional, List, Dict, Any, Iterator
+
+from .locks import file_lock
+from .metrics import db_latency
+
+# Connection tuning (override via environment)
+SQLITE_CACHE_SIZE_KB = int(os.getenv('SQLITE_CACHE_SIZE_KB', '16384'))
+SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', str(64 * 1024 * 1024)))
+SQLITE_STATEMENT_CACHE = int(os.getenv('SQLITE_STATEMENT_CACHE', '256'))
+SQLITE_BUSY_TIMEOUT = float(os.getenv('SQLITE_BUSY_TIMEOUT', '10'))
+
+# Stored in PRAGMA user_version once init_database has run; bump it whenever
+# init_database changes so existing databases are migrated on the next start
+SCHEMA_VERSION = 1
+
+# TIMESTAMP columns hold UTC text in SQLite's own format, so they sort and
+# compare correctly against datetime('now') / CURRENT_TIMESTAMP
+DB_TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+def to_db_timestamp(value: Optional[datetime] = None) -> str:
+    """Format a datetime (naive = local time) as canonical UTC text; defaults to now"""
+    if value is None:
+        value = datetime.now(timezone.utc)
+    return value.astimezone(timezone.utc).strftime(DB_TIMESTAMP_FORMAT)
+
+# (table, total counter, active counter) maintained by triggers in stats_counters
+STATS_COUNTER_TABLES = (
+    ('indicadores', 'total_indicadores', 'indicadores_activos'),
+    ('clientes', 'total_clientes', 'clientes_activos'),
+    ('accesos', 'total_accesos', 'accesos_activos'),
+)
+
+STATS_KEYS = [name for _, total, activos in STATS_COUNTER_TABLES for name in (total, activos)] + \
+    ['proximos_vencimientos']
+
+# Conditional aggregation: every counter in one pass over each table
+STATS_AGGREGATE_QUERY = """
+    SELECT i.total_indicadores, i.indicadores_activos,
+           c.total_clientes, c.clientes_activos,
+           a.total_accesos, a.accesos_activos
+    FROM (SELECT COUNT(*) AS total_indicadores,
+                 SUM(CASE WHEN estado = 'activo' THEN 1 ELSE 0 END) AS indicadores_activos
+          FROM indicadores) i,
+         (SELECT COUNT(*) AS total_clientes,
+                 SUM(CASE WHEN estado = 'activo' THEN 1 ELSE 0 END) AS clientes_activos
+          FROM clientes) c,
+         (SELECT COUNT(*) AS total_accesos,
+                 SUM(CASE WHEN estado = 'activo' THEN 1 ELSE 0 END) AS accesos_activos
+          FROM accesos) a
+"""
+
+# Columns indexed for full-text search, per table (<table>_fts)
+SEARCH_INDEXES = {
+    'clientes': ('username_tradingview', 'email', 'nombre_completo'),
+    'indicadores': ('nombre', 'descripcion', 'pub_id'),
+}
 
 class Database:
     """Simple SQLite database manager for PineScript Control Access"""
     
-    def __init__(self, db_path: str = "data/pinescript_control.db"):
+    def __init__(self, db_path: str = "data/pinescript_control.db", initialize: bool = True):
         self.db_path = db_path
+        # One long-lived connection per thread (and per process, see get_connection)
+        self._local = threading.local()
+        # Connections inherited through fork(): kept referenced so they are never closed
+        self._inherited: List[sqlite3.Connection] = []
+        self._init_lock = threading.Lock()
+        self._initialized = False
+        self.fts_enabled = False
+        if hasattr(os, 'register_at_fork'):
+            after_fork = weakref.WeakMethod(self._after_fork)
+            os.register_at_fork(after_in_child=lambda: after_fork() and after_fork()())
         self.ensure_db_directory()
-        self.init_database()
+        if initialize:
+            self.initialize()
+    
+    def initialize(self):
+        """Create and migrate the schema once per process.
+        
+        A database already at SCHEMA_VERSION is only inspected, not migrated.
+        Otherwise worker processes starting together take turns through a lock
+        file next to the database, so migrations never run concurrently.
+        """
+        with self._init_lock:
+            if self._initialized:
+                return
+            if not self._schema_is_current():
+                with file_lock(self.db_path + '.lock'):
+                    # Another process may have migrated while this one waited
+                    if not self._schema_is_current():
+                        self.init_database()
+            self._initialized = True
+    
+    def _schema_is_current(self) -> bool:
+        """True if init_database already ran at SCHEMA_VERSION; also restores fts_enabled"""
+        conn = self.get_connection()
+        if conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            return False
+        self.fts_enabled = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'clientes_fts'"
+        ).fetchone() is not None
+        return True
     
     def ensure_db_directory(self):
         """Create database directory if it doesn't exist"""
         os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
     
-    def get_connection(self) -> sqlite3.Connection:
-        """Get database connection with foreign keys enabled"""
-        conn = sqlite3.connect(self.db_path)
+    def _open_connection(self) -> sqlite3.Connection:
+        """Open a tuned connection: WAL, synchronous=NORMAL, cache/mmap sizes, foreign keys"""
+        conn = sqlite3.connect(self.db_path, timeout=SQLITE_BUSY_TIMEOUT,
+                               cached_statements=SQLITE_STATEMENT_CACHE)
+        # WAL lets readers proceed while a writer commits; NORMAL is durable under WAL
+        # except for the last transactions on power loss
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute(f"PRAGMA cache_size = -{SQLITE_CACHE_SIZE_KB}")
+        conn.execute(f"PRAGMA mmap_size = {SQLITE_MMAP_SIZE}")
+        conn.execute("PRAGMA temp_store = MEMORY")
         conn.execute("PRAGMA foreign_keys = ON")
         conn.row_factory = sqlite3.Row  # Enable dict-like access to rows
         return conn
     
+    def _after_fork(self):
+        """Drop the parent's per-thread state in a forked child (see get_connection)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            self._inherited.append(conn)
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+    
+    def get_connection(self) -> sqlite3.Connection:
+        """Get this thread's database connection, opening it on first use"""
+        conn = getattr(self._local, 'conn', None)
+        # A connection inherited through fork() must never be reused by the child, nor
+        # closed: closing it could checkpoint or unlock on behalf of the parent
+        if conn is None or self._local.pid != os.getpid():
+            if conn is not None:
+                self._inherited.append(conn)
+            conn = self._open_connection()
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+            self._local.in_tx = False
+        return conn
+    
+    def close(self):
+        """Close this thread's connection (it is reopened on next use)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            conn.close()
+        self._local.conn = None
+    
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Run several statements atomically.
+        
+        Every execute_* call made on this thread inside the block reuses the
+        same connection and is committed (or rolled back) together.
+        """
+        conn = self.get_connection()
+        if self._local.in_tx:
+            # Nested block: join the outer transaction
+            yield conn
+            return
+        
+        started = time.perf_counter()
+        conn.execute("BEGIN IMMEDIATE")
+        self._local.in_tx = True
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self._local.in_tx = False
+            # Time the write lock was held, statements run inside included
+            db_latency.observe(time.perf_counter() - started, 'transaction')
+    
+    @contextmanager
+    def _connection(self) -> Iterator[tuple]:
+        """Yield (connection, autocommit) - autocommit is False inside transaction()"""
+        conn = self.get_connection()
+        if self._local.in_tx:
+            yield conn, False
+            return
+        with conn:  # Commits on success, rolls back on error
+            yield conn, True
+    
     def init_database(self):
         """Initialize database with all tables"""
         with self.get_connection() as conn:
@@ -72,16 +243,226 @@ class Database:
                 )
             """)
             
+            # Create bulk job tables (usernames x indicators matrix processed in background)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS bulk_jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    tipo VARCHAR(50) DEFAULT 'grant',
+                    estado VARCHAR(20) DEFAULT 'pendiente',
+                    duracion_dias INTEGER NOT NULL,
+                    total_items INTEGER DEFAULT 0,
+                    fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    fecha_inicio TIMESTAMP,
+                    fecha_fin TIMESTAMP
+                )
+            """)
+            
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS bulk_job_items (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    job_id INTEGER NOT NULL,
+                    username_tradingview VARCHAR(100) NOT NULL,
+                    pub_id VARCHAR(100) NOT NULL,
+                    estado VARCHAR(20) DEFAULT 'pendiente',
+                    mensaje TEXT,
+                    access_id INTEGER,
+                    fecha_actualizacion TIMESTAMP,
+                    FOREIGN KEY (job_id) REFERENCES bulk_jobs (id) ON DELETE CASCADE
+                )
+            """)
+            
+            # Create sync outbox (TradingView calls committed together with the DB change)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS sync_outbox (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    operacion VARCHAR(20) NOT NULL,
+                    username_tradingview VARCHAR(100) NOT NULL,
+                    pub_id VARCHAR(100) NOT NULL,
+                    payload TEXT,
+                    access_id INTEGER,
+                    estado VARCHAR(20) DEFAULT 'pendiente',
+                    intentos INTEGER DEFAULT 0,
+                    proximo_intento TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    ultimo_error TEXT,
+                    fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    fecha_actualizacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            
             # Create indexes for better performance
             conn.execute("CREATE INDEX IF NOT EXISTS idx_accesos_cliente ON accesos (cliente_id)")
             conn.execute("CREATE INDEX IF NOT EXISTS idx_accesos_indicador ON accesos (indicador_id)")
-            conn.execute("CREATE INDEX IF NOT EXISTS idx_accesos_estado ON accesos (estado)")
+            # (estado, fecha_fin) below also serves estado-only lookups
+            conn.execute("DROP INDEX IF EXISTS idx_accesos_estado")
             conn.execute("CREATE INDEX IF NOT EXISTS idx_clientes_username ON clientes (username_tradingview)")
             conn.execute("CREATE INDEX IF NOT EXISTS idx_indicadores_pub_id ON indicadores (pub_id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_bulk_job_items_job ON bulk_job_items (job_id, estado)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_sync_outbox_due ON sync_outbox (estado, proximo_intento)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_accesos_estado_fin ON accesos (estado, fecha_fin)")
+            
+            self._migrate_normalize_timestamps(conn)
+            self._migrate_unique_active_access(conn)
+            self._init_stats_counters(conn)
+            self._init_search_index(conn)
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
             
             conn.commit()
             print("✅ Database initialized successfully")
     
+    def _init_stats_counters(self, conn):
+        """Create the stats_counters table and the triggers that keep it current"""
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS stats_counters (
+                nombre VARCHAR(50) PRIMARY KEY,
+                valor INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        
+        # total_<tabla> follows every row, <tabla>_activos only rows with estado = 'activo'
+        for table, total, activos in STATS_COUNTER_TABLES:
+            conn.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_stats_insert AFTER INSERT ON {table}
+                BEGIN
+                    UPDATE stats_counters
+                    SET valor = valor + CASE nombre WHEN '{total}' THEN 1 ELSE (NEW.estado IS 'activo') END
+                    WHERE nombre IN ('{total}', '{activos}');
+                END
+            """)
+            conn.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_stats_delete AFTER DELETE ON {table}
+                BEGIN
+                    UPDATE stats_counters
+                    SET valor = valor - CASE nombre WHEN '{total}' THEN 1 ELSE (OLD.estado IS 'activo') END
+                    WHERE nombre IN ('{total}', '{activos}');
+                END
+            """)
+            conn.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_stats_update AFTER UPDATE OF estado ON {table}
+                WHEN (OLD.estado IS 'activo') != (NEW.estado IS 'activo')
+                BEGIN
+                    UPDATE stats_counters
+                    SET valor = valor + (NEW.estado IS 'activo') - (OLD.estado IS 'activo')
+                    WHERE nombre = '{activos}';
+                END
+            """)
+        
+        # Seed once (new table or counters added to an existing database)
+        seeded = conn.execute("SELECT COUNT(*) FROM stats_counters").fetchone()[0]
+        if seeded < len(STATS_COUNTER_TABLES) * 2:
+            self._seed_stats_counters(conn)
+    
+    def _init_search_index(self, conn):
+        """Create FTS5 external-content indexes over clientes and indicadores.
+        
+        Triggers keep them in sync; a newly created index is rebuilt from its
+        table. Sets fts_enabled = False when SQLite was built without FTS5.
+        """
+        for table, columns in SEARCH_INDEXES.items():
+            fts = f"{table}_fts"
+            existed = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (fts,)
+            ).fetchone()
+            try:
+                conn.execute(f"""
+                    CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+                        {', '.join(columns)},
+                        content='{table}', content_rowid='id',
+                        tokenize='unicode61 remove_diacritics 2'
+                    )
+                """)
+            except sqlite3.OperationalError as e:
+                print(f"⚠️ FTS5 unavailable, search falls back to LIKE: {e}")
+                self.fts_enabled = False
+                return
+            
+            cols = ', '.join(columns)
+            new_values = ', '.join(f"NEW.{c}" for c in columns)
+            old_values = ', '.join(f"OLD.{c}" for c in columns)
+            conn.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS trg_{fts}_insert AFTER INSERT ON {table}
+                BEGIN
+                    INSERT INTO {fts} (rowid, {cols}) VALUES (NEW.id, {new_values});
+                END
+            """)
+            conn.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS trg_{fts}_delete AFTER DELETE ON {table}
+                BEGIN
+                    INSERT INTO {fts} ({fts}, rowid, {cols}) VALUES ('delete', OLD.id, {old_values});
+                END
+            """)
+            conn.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS trg_{fts}_update AFTER UPDATE OF {cols} ON {table}
+                BEGIN
+                    INSERT INTO {fts} ({fts}, rowid, {cols}) VALUES ('delete', OLD.id, {old_values});
+                    INSERT INTO {fts} (rowid, {cols}) VALUES (NEW.id, {new_values});
+                END
+            """)
+            if not existed:
+                conn.execute(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')")
+        self.fts_enabled = True
+    
+    def _seed_stats_counters(self, conn):
+        """Recompute every counter from the tables in a single pass per table"""
+        counts = conn.execute(STATS_AGGREGATE_QUERY).fetchone()
+        conn.executemany(
+            "INSERT OR REPLACE INTO stats_counters (nombre, valor) VALUES (?, ?)",
+            [(name, counts[name] or 0) for name in counts.keys()]
+        )
+    
+    def refresh_stats_counters(self):
+        """Rebuild stats_counters from the tables (e.g. after manual edits with triggers off)"""
+        with self._connection() as (conn, autocommit):
+            self._seed_stats_counters(conn)
+            if autocommit:
+                conn.commit()
+    
+    def _migrate_normalize_timestamps(self, conn):
+        """Rewrite ISO-8601 access dates ('2025-10-28T11:11:53.083419') as canonical UTC text.
+        
+        Naive values were written with datetime.now(), i.e. server local time,
+        hence the 'utc' modifier; values carrying an offset are already absolute.
+        """
+        for column in ('fecha_inicio', 'fecha_fin'):
+            updated = conn.execute(f"""
+                UPDATE accesos
+                SET {column} = CASE
+                    WHEN substr({column}, 20) GLOB '*[-+Z]*' THEN datetime({column})
+                    ELSE datetime({column}, 'utc')
+                END
+                WHERE {column} LIKE '%T%'
+            """).rowcount
+            if updated:
+                print(f"🔄 Normalized {updated} accesos.{column} timestamps to UTC")
+    
+    def _migrate_unique_active_access(self, conn):
+        """At most one active access per (cliente, indicador), enforced by a partial unique index"""
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_accesos_activo_unico'"
+        ).fetchone()
+        if exists:
+            return
+        
+        # Keep the longest-running active row of each pair (permanent first, then latest)
+        duplicates = conn.execute("""
+            UPDATE accesos
+            SET estado = 'revocado', notas = 'Acceso duplicado consolidado'
+            WHERE estado = 'activo' AND id NOT IN (
+                SELECT id FROM (
+                    SELECT id, ROW_NUMBER() OVER (
+                        PARTITION BY cliente_id, indicador_id
+                        ORDER BY fecha_fin IS NULL DESC, fecha_fin DESC, id DESC
+                    ) AS rn
+                    FROM accesos WHERE estado = 'activo'
+                ) WHERE rn = 1
+            )
+        """).rowcount
+        if duplicates:
+            print(f"🔄 Revoked {duplicates} duplicate active accesos")
+        conn.execute("""
+            CREATE UNIQUE INDEX idx_accesos_activo_unico
+            ON accesos (cliente_id, indicador_id) WHERE estado = 'activo'
+        """)
+    
     def _migrate_add_precio_column(self, conn):
         """Add precio column to indicadores table if it doesn't exist"""
         try:
@@ -98,48 +479,64 @@ class Database:
     
     def execute_query(self, query: str, params: tuple = ()) -> List[Dict[str, Any]]:
         """Execute a SELECT query and return results as list of dicts"""
-        with self.get_connection() as conn:
+        with db_latency.time('query'), self._connection() as (conn, autocommit):
             cursor = conn.execute(query, params)
             columns = [description[0] for description in cursor.description]
-            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+            rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+            if autocommit and conn.in_transaction:
+                # UPDATE ... RETURNING runs through here too
+                conn.commit()
+            return rows
     
     def execute_insert(self, query: str, params: tuple = ()) -> int:
         """Execute an INSERT query and return the last row id"""
-        with self.get_connection() as conn:
+        with db_latency.time('insert'), self._connection() as (conn, autocommit):
             cursor = conn.execute(query, params)
-            conn.commit()
+            if autocommit:
+                conn.commit()
             return cursor.lastrowid
     
+    def execute_many(self, query: str, params_seq: List[tuple]) -> int:
+        """Execute the same INSERT/UPDATE for many parameter tuples in one transaction"""
+        with db_latency.time('many'), self._connection() as (conn, autocommit):
+            cursor = conn.executemany(query, params_seq)
+            if autocommit:
+                conn.commit()
+            return cursor.rowcount
+    
     def execute_update(self, query: str, params: tuple = ()) -> int:
         """Execute an UPDATE/DELETE query and return affected rows count"""
-        with self.get_connection() as conn:
+        with db_latency.time('update'), self._connection() as (conn, autocommit):
             cursor = conn.execute(query, params)
-            conn.commit()
+            if autocommit:
+                conn.commit()
             return cursor.rowcount
     
     def get_stats(self) -> Dict[str, int]:
-        """Get basic statistics about the database"""
-        stats = {}
+        """Get basic statistics about the database.
         
-        # Count tables
-        stats['total_indicadores'] = self.execute_query("SELECT COUNT(*) as count FROM indicadores")[0]['count']
-        stats['indicadores_activos'] = self.execute_query("SELECT COUNT(*) as count FROM indicadores WHERE estado = 'activo'")[0]['count']
-        
-        stats['total_clientes'] = self.execute_query("SELECT COUNT(*) as count FROM clientes")[0]['count']
-        stats['clientes_activos'] = self.execute_query("SELECT COUNT(*) as count FROM clientes WHERE estado = 'activo'")[0]['count']
-        
-        stats['total_accesos'] = self.execute_query("SELECT COUNT(*) as count FROM accesos")[0]['count']
-        stats['accesos_activos'] = self.execute_query("SELECT COUNT(*) as count FROM accesos WHERE estado = 'activo'")[0]['count']
-        
-        # Próximos a vencer (próximos 7 días)
-        stats['proximos_vencimientos'] = self.execute_query("""
-            SELECT COUNT(*) as count FROM accesos 
-            WHERE estado = 'activo' 
-            AND fecha_fin IS NOT NULL 
+        Totals come from the trigger-maintained stats_counters table and the
+        upcoming expirations from a range scan on (estado, fecha_fin), all in
+        one statement; the full aggregate query is only used as a fallback.
+        """
+        rows = self.execute_query("""
+            SELECT nombre, valor FROM stats_counters
+            UNION ALL
+            SELECT 'proximos_vencimientos', COUNT(*) FROM accesos
+            WHERE estado = 'activo'
+            AND fecha_fin IS NOT NULL
             AND fecha_fin <= datetime('now', '+7 days')
-        """)[0]['count']
+        """)
+        stats = {row['nombre']: row['valor'] for row in rows}
+        
+        if len(stats) <= len(STATS_COUNTER_TABLES) * 2:
+            # Counters missing (table emptied by hand): answer from the tables and reseed
+            stats = dict(self.execute_query(STATS_AGGREGATE_QUERY)[0])
+            self.refresh_stats_counters()
+            stats['proximos_vencimientos'] = next(
+                row['valor'] for row in rows if row['nombre'] == 'proximos_vencimientos')
         
-        return stats
+        return {key: stats.get(key) or 0 for key in STATS_KEYS}
 
 # Global database instance
 db = Database()
\ No newline at end of file
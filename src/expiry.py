@@ -0,0 +1,179 @@
+"""
+Access expiry scheduler
+
+Keeps a min-heap of upcoming ``fecha_fin`` values and sleeps until the
+earliest one. When it fires, every due access is marked 'expirado' and a
+TradingView revoke is queued in the sync outbox, in one transaction. Grants
+push their new expiration onto the heap so renewals and new accesses are
+picked up without reloading from SQLite.
+
+The heap only decides *when* to wake up: due accesses are always re-read
+from the database, so stale entries (e.g. an access renewed after it was
+scheduled) are harmless.
+"""
+import heapq
+import os
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from .database import DB_TIMESTAMP_FORMAT, to_db_timestamp
+from .models import Acceso
+
+# Upcoming expirations loaded into the heap at once (later ones are loaded as it drains)
+EXPIRY_PRELOAD = int(os.getenv('EXPIRY_PRELOAD', '1000'))
+# Longest sleep between checks; also how often writes from other processes are noticed
+EXPIRY_MAX_SLEEP = float(os.getenv('EXPIRY_MAX_SLEEP', '300'))
+
+
+class ExpiryScheduler:
+    """Background thread that expires accesses exactly when their fecha_fin passes"""
+
+    def __init__(self, preload: int = EXPIRY_PRELOAD, max_sleep: float = EXPIRY_MAX_SLEEP):
+        self.preload = preload
+        self.max_sleep = max_sleep
+        self._heap: List[Tuple[str, int]] = []
+        # Latest fecha_fin loaded from the DB; None when every upcoming expiration is in the heap
+        self._horizon: Optional[str] = None
+        self._cond = threading.Condition()
+        self._stop = False
+        self._thread: Optional[threading.Thread] = None
+        self.expired = 0
+        self.runs = 0
+        self.last_run: Optional[str] = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop = False
+        self._thread = threading.Thread(target=self._run, name='access-expiry', daemon=True)
+        self._thread.start()
+        print("✅ Access expiry scheduler started")
+
+    def stop(self, timeout: float = 5.0):
+        with self._cond:
+            self._stop = True
+            self._cond.notify()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def is_running(self) -> bool:
+        return bool(self._thread and self._thread.is_alive())
+
+    def schedule(self, access_id: int, fecha_fin: Optional[str]):
+        """Add a new or renewed expiration (canonical UTC text); None means permanent"""
+        if not fecha_fin:
+            return
+        with self._cond:
+            if self._horizon is not None and fecha_fin > self._horizon:
+                return  # Beyond what is loaded: the next reload picks it up
+            heapq.heappush(self._heap, (fecha_fin, access_id))
+            if self._heap[0] == (fecha_fin, access_id):
+                self._cond.notify()  # New earliest expiration: recompute the sleep
+
+    def reload(self):
+        """Rebuild the heap from the earliest active expirations in the database"""
+        rows = Acceso.get_upcoming_expirations(self.preload)
+        with self._cond:
+            self._heap = [(row['fecha_fin'], row['id']) for row in rows]
+            heapq.heapify(self._heap)
+            self._horizon = rows[-1]['fecha_fin'] if len(rows) >= self.preload else None
+            self._cond.notify()
+
+    def _seconds_until_next(self) -> Optional[float]:
+        """Seconds until the heap's earliest expiration (None if the heap is empty)"""
+        if not self._heap:
+            return None
+        expires_at = datetime.strptime(self._heap[0][0], DB_TIMESTAMP_FORMAT)
+        return (expires_at - datetime.utcnow()).total_seconds()
+
+    def _run(self):
+        try:
+            self.reload()
+        except Exception as e:
+            print(f"⚠️ Expiry scheduler failed to load: {e}")
+
+        while True:
+            with self._cond:
+                if self._stop:
+                    return
+                delay = self._seconds_until_next()
+                if delay is None and self._horizon is not None:
+                    delay = 0  # Loaded window drained: reload now
+                idle = delay is None or delay > self.max_sleep
+                if delay is None or delay > 0:
+                    if self._cond.wait(self.max_sleep if idle else delay):
+                        continue  # Woken by schedule()/stop(): recompute the sleep
+            try:
+                if idle:
+                    # Nothing due for max_sleep: resync with writes made by other processes
+                    self.reload()
+                self.run_once()
+            except Exception as e:
+                print(f"⚠️ Expiry scheduler error: {e}")
+                with self._cond:
+                    self._cond.wait(min(30.0, self.max_sleep))
+
+    def run_once(self) -> int:
+        """Expire everything due now, drop fired heap entries; returns accesses expired"""
+        from .services import AccesoService
+
+        now = to_db_timestamp()
+        with self._cond:
+            while self._heap and self._heap[0][0] <= now:
+                heapq.heappop(self._heap)
+            drained = not self._heap and self._horizon is not None
+
+        count = AccesoService.process_expired_accesses()
+        self.expired += count
+        self.runs += 1
+        self.last_run = now
+        if count:
+            print(f"⏰ Expired {count} access(es); TradingView revocations queued")
+        if drained:
+            self.reload()
+        return count
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            next_expiry = self._heap[0][0] if self._heap else None
+            size = len(self._heap)
+        return {
+            'running': self.is_running(),
+            'scheduled': size,
+            'next_expiry': next_expiry,
+            'expired': self.expired,
+            'runs': self.runs,
+            'last_run': self.last_run
+        }
+
+
+_scheduler: Optional[ExpiryScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_expiry_scheduler() -> ExpiryScheduler:
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = ExpiryScheduler()
+        return _scheduler
+
+
+def start_expiry_scheduler() -> ExpiryScheduler:
+    scheduler = get_expiry_scheduler()
+    scheduler.start()
+    return scheduler
+
+
+def notify_expiry(access_id: int, fecha_fin: Optional[str] = None):
+    """Tell the scheduler an access was granted or renewed (no-op if it is not running).
+
+    Without fecha_fin the committed row is read back to get it.
+    """
+    if _scheduler is None or not _scheduler.is_running():
+        return
+    if fecha_fin is None:
+        access = Acceso.get_by_id(access_id)
+        fecha_fin = access['fecha_fin'] if access else None
+    _scheduler.schedule(access_id, fecha_fin)
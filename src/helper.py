@@ -1,6 +1,7 @@
-from dateutil import parser
-from dateutil.relativedelta import relativedelta
 def get_access_extension(currentExpirationDate:str, extension_type:str, extension_length:int):
+  # dateutil is only needed when an access is extended: keep it off the startup path
+  from dateutil import parser
+  from dateutil.relativedelta import relativedelta
   expiration = parser.parse(currentExpirationDate)
   if(extension_type=='Y'):
     expiration = expiration + relativedelta(years=extension_length)
@@ -0,0 +1,149 @@
+"""
+Background bulk-grant jobs for PineScript Control Access
+
+A job is a matrix of usernames x pub_ids granted for the same number of days.
+Every cell is persisted in ``bulk_job_items`` so progress can be polled and
+unfinished jobs are resumed after a restart.
+"""
+import os
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from .database import db
+from .models import BulkJob, BulkJobItem, Indicador
+
+# Usernames processed in parallel across all jobs
+JOB_WORKERS = int(os.getenv('BULK_JOB_WORKERS', '4'))
+# Upper bound on cells per job to keep a single submission reasonable
+MAX_JOB_ITEMS = int(os.getenv('BULK_JOB_MAX_ITEMS', '10000'))
+
+
+class BulkJobRunner:
+    """Executes bulk jobs on a worker pool and reports their progress"""
+
+    def __init__(self, max_workers: int = JOB_WORKERS):
+        self.max_workers = max_workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                    thread_name_prefix='bulk-job')
+            return self._executor
+
+    def submit_grant_job(self, usernames: List[str], pub_ids: Optional[List[str]], days: int) -> Dict[str, Any]:
+        """Persist a usernames x pub_ids grant job and start it; returns the job summary"""
+        usernames = list(dict.fromkeys(u.strip() for u in usernames if u and u.strip()))
+        if not pub_ids:
+            pub_ids = [indicator['pub_id'] for indicator in Indicador.get_active()]
+        pub_ids = list(dict.fromkeys(p.strip() for p in pub_ids if p and p.strip()))
+
+        if not usernames:
+            raise ValueError('At least one username is required')
+        if not pub_ids:
+            raise ValueError('No indicators to grant')
+        if days <= 0:
+            raise ValueError('duracion_dias must be positive')
+
+        cells = [(username, pub_id) for username in usernames for pub_id in pub_ids]
+        if len(cells) > MAX_JOB_ITEMS:
+            raise ValueError(f'Job too large: {len(cells)} cells (max {MAX_JOB_ITEMS})')
+
+        # Job and cells commit together: a job without items would be resumed as finished
+        with db.transaction():
+            job_id = BulkJob.create(tipo='grant', estado='pendiente', duracion_dias=days, total_items=len(cells))
+            BulkJobItem.create_many(job_id, cells)
+        self._schedule(job_id)
+        print(f"📦 Bulk job {job_id} queued: {len(usernames)} users x {len(pub_ids)} indicators")
+        return self.get_job(job_id, include_items=False)
+
+    def _schedule(self, job_id: int):
+        job = BulkJob.get_by_id(job_id)
+        pending = BulkJobItem.get_job_items(job_id, estado='pendiente')
+        if not pending:
+            BulkJob.mark_finished_if_done(job_id)
+            return
+
+        BulkJob.mark_started(job_id)
+        # One task per username: its cells run sequentially, which avoids racing
+        # on client auto-creation and on the same (client, indicator) access row
+        by_user: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        for item in pending:
+            by_user[item['username_tradingview']].append(item)
+
+        executor = self._get_executor()
+        for items in by_user.values():
+            executor.submit(self._run_user_items, job_id, job['duracion_dias'], items)
+
+    def _run_user_items(self, job_id: int, days: int, items: List[Dict[str, Any]]):
+        from .services import AccesoService
+
+        for item in items:
+            BulkJobItem.update(item['id'], estado='procesando')
+            try:
+                result = AccesoService.grant_access(item['username_tradingview'], item['pub_id'], days)
+                BulkJobItem.set_result(item['id'],
+                                       'exito' if result['success'] else 'fallido',
+                                       result.get('message', ''),
+                                       result.get('access_id'))
+            except Exception as e:
+                BulkJobItem.set_result(item['id'], 'fallido', str(e))
+
+        if BulkJob.mark_finished_if_done(job_id):
+            print(f"✅ Bulk job {job_id} completed")
+
+    def resume_unfinished(self) -> int:
+        """Re-schedule jobs interrupted by a restart and return how many were resumed"""
+        jobs = BulkJob.get_unfinished()
+        for job in jobs:
+            BulkJobItem.reset_running(job['id'])
+            self._schedule(job['id'])
+        return len(jobs)
+
+    def get_job(self, job_id: int, include_items: bool = True) -> Optional[Dict[str, Any]]:
+        """Job row plus per-state counters and, optionally, every cell"""
+        job = BulkJob.get_by_id(job_id)
+        if not job:
+            return None
+
+        counts = BulkJobItem.count_by_estado(job_id)
+        done = counts.get('exito', 0) + counts.get('fallido', 0)
+        job['progress'] = {
+            'total': job['total_items'],
+            'pendiente': counts.get('pendiente', 0),
+            'procesando': counts.get('procesando', 0),
+            'exito': counts.get('exito', 0),
+            'fallido': counts.get('fallido', 0),
+            'percent': round(100.0 * done / job['total_items'], 1) if job['total_items'] else 100.0
+        }
+        if include_items:
+            job['items'] = BulkJobItem.get_job_items(job_id)
+        return job
+
+    def list_jobs(self, limit: int = 20) -> List[Dict[str, Any]]:
+        return BulkJob.get_recent(limit)
+
+
+_runner: Optional[BulkJobRunner] = None
+_runner_lock = threading.Lock()
+
+
+def get_job_runner() -> BulkJobRunner:
+    """Process-wide job runner"""
+    global _runner
+    with _runner_lock:
+        if _runner is None:
+            _runner = BulkJobRunner()
+        return _runner
+
+
+def resume_bulk_jobs() -> int:
+    """Resume jobs interrupted by a restart; call from a single process only"""
+    resumed = get_job_runner().resume_unfinished()
+    if resumed:
+        print(f"🔄 Resumed {resumed} unfinished bulk job(s)")
+    return resumed
@@ -0,0 +1,60 @@
+"""
+Inter-process file locks
+
+Several worker processes share one SQLite file. These advisory locks
+(fcntl.flock) serialize the work that must happen once (schema creation and
+migrations) and pick the single process that runs the singleton schedules.
+Where fcntl is unavailable they degrade to no-ops, which is correct for the
+single-process development server.
+"""
+import os
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# path -> (pid, fd) of locks this process holds until it exits
+_held: Dict[str, Tuple[int, int]] = {}
+_held_lock = threading.Lock()
+
+
+@contextmanager
+def file_lock(path: str) -> Iterator[None]:
+    """Hold an exclusive lock on path for the duration of the block (blocks until free)"""
+    if fcntl is None:
+        yield
+        return
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)  # Closing the descriptor releases the lock
+
+
+def try_hold_lock(path: str) -> bool:
+    """Take an exclusive lock on path for the rest of this process's life, without waiting.
+
+    Returns True if this process holds it (now or from an earlier call). The
+    lock is released by the OS when the process exits, so a replacement
+    worker can take over.
+    """
+    if fcntl is None:
+        return True
+    pid = os.getpid()
+    with _held_lock:
+        held = _held.get(path)
+        if held and held[0] == pid:
+            return True
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        _held[path] = (pid, fd)
+        return True
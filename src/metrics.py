@@ -0,0 +1,243 @@
+"""
+In-process metrics rendered in the Prometheus text exposition format
+
+Counters and histograms live in this process only: under gunicorn every
+worker keeps its own, and a scrape of GET /metrics reports the worker that
+served it (the `pid` label of service_info tells them apart). Gauges such as
+cache hit ratios and the circuit breaker state are read at scrape time.
+"""
+import bisect
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Sequence, Tuple
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Latency buckets (seconds): requests and TradingView calls take 5ms-10s,
+# SQLite statements mostly well under a millisecond
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5)
+
+_STARTED_AT = time.time()
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: Sequence[str], values: Sequence) -> str:
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Registry:
+    """Every metric in the order it was defined; render() produces the scrape body"""
+
+    def __init__(self):
+        self._metrics: List['Metric'] = []
+        self._lock = threading.Lock()
+
+    def register(self, metric: 'Metric'):
+        with self._lock:
+            self._metrics.append(metric)
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics)
+        for metric in metrics:
+            try:
+                samples = list(metric.samples())
+            except Exception as e:
+                # A failing gauge callback must not break the whole scrape
+                print(f"⚠️ Metric {metric.name} unavailable: {e}")
+                continue
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, label_names, label_values, value in samples:
+                lines.append(f"{name}{_format_labels(label_names, label_values)} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        REGISTRY.register(self)
+
+    def samples(self) -> Iterator[Tuple[str, Sequence[str], Sequence, float]]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for label_values, value in values:
+            yield self.name, self.labels, label_values, value
+
+
+class _Timer:
+    """Context manager observing the elapsed time of its block"""
+    __slots__ = ('histogram', 'labels', 'started')
+
+    def __init__(self, histogram: 'Histogram', labels: tuple):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labels)
+        return False
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [count per bucket (+Inf last), sum]
+        self._values: Dict[tuple, list] = {}
+
+    def observe(self, value: float, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def time(self, *labels) -> _Timer:
+        return _Timer(self, labels)
+
+    def samples(self):
+        with self._lock:
+            values = sorted((labels, (list(counts), total)) for labels, (counts, total) in self._values.items())
+        bucket_labels = self.labels + ('le',)
+        for label_values, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                yield f"{self.name}_bucket", bucket_labels, label_values + (_format_value(bound),), cumulative
+            yield f"{self.name}_sum", self.labels, label_values, total
+            yield f"{self.name}_count", self.labels, label_values, cumulative
+
+
+class CallbackMetric(Metric):
+    """Values read at scrape time from callback() -> {label values: value}"""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str],
+                 callback: Callable[[], Dict[tuple, float]], kind: str = 'gauge'):
+        super().__init__(name, documentation, labels)
+        self.kind = kind
+        self.callback = callback
+
+    def samples(self):
+        for label_values, value in sorted(self.callback().items()):
+            yield self.name, self.labels, label_values, value
+
+
+# Inbound HTTP (recorded by init_app)
+http_requests = Counter('http_requests_total', 'HTTP requests served',
+                        ('method', 'route', 'status'))
+http_latency = Histogram('http_request_duration_seconds', 'HTTP request latency',
+                         ('method', 'route'))
+
+# Outbound TradingView calls, labelled by config.urls key (recorded by TradingView._request)
+tradingview_requests = Counter('tradingview_requests_total', 'TradingView calls by response status',
+                               ('endpoint', 'status'))
+tradingview_latency = Histogram('tradingview_request_duration_seconds', 'TradingView call latency',
+                                ('endpoint',))
+tradingview_errors = Counter('tradingview_errors_total',
+                             'Failed TradingView calls (exception, server_error, throttled, circuit_open, rate_limited)',
+                             ('endpoint', 'reason'))
+
+# SQLite (recorded by Database.execute_* and transaction())
+db_latency = Histogram('sqlite_query_duration_seconds', 'SQLite statement latency by Database method',
+                       ('operation',), buckets=DB_BUCKETS)
+
+
+def _cache_stats() -> Dict[str, dict]:
+    from .cache import response_cache
+    from .tradingview import username_cache
+    return {'responses': response_cache.stats(), 'usernames': username_cache.stats()}
+
+
+def _cache_metric(key: str) -> Callable[[], Dict[tuple, float]]:
+    return lambda: {(name,): stats[key] for name, stats in _cache_stats().items()}
+
+
+def _breaker_state() -> Dict[tuple, float]:
+    from .circuit_breaker import breaker, CLOSED, OPEN, HALF_OPEN
+    state = breaker.snapshot()['state']
+    return {(name,): 1.0 if name == state else 0.0 for name in (CLOSED, OPEN, HALF_OPEN)}
+
+
+CallbackMetric('cache_hits_total', 'Cache lookups that found a live entry', ('cache',),
+               _cache_metric('hits'), kind='counter')
+CallbackMetric('cache_misses_total', 'Cache lookups that missed or found an expired entry', ('cache',),
+               _cache_metric('misses'), kind='counter')
+CallbackMetric('cache_hit_ratio', 'Hits / lookups since start', ('cache',), _cache_metric('hit_ratio'))
+CallbackMetric('cache_entries', 'Entries currently cached', ('cache',), _cache_metric('size'))
+CallbackMetric('tradingview_circuit_state', 'Circuit breaker state (1 for the current one)', ('state',),
+               _breaker_state)
+CallbackMetric('service_info', 'Process that rendered this scrape', ('pid',),
+               lambda: {(str(os.getpid()),): 1.0})
+CallbackMetric('process_start_time_seconds', 'Start time of the process (Unix time)', (),
+               lambda: {(): _STARTED_AT})
+
+
+def render() -> str:
+    return REGISTRY.render()
+
+
+def init_app(app):
+    """Time every request the app serves, labelled by its URL rule (not the raw path)"""
+    from flask import g, request
+
+    @app.before_request
+    def _start_timer():
+        g._metrics_started = time.perf_counter()
+
+    @app.after_request
+    def _record_request(response):
+        started = g.pop('_metrics_started', None)
+        if started is not None:
+            # Unmatched paths share one label so 404 scans cannot blow up cardinality
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+            http_latency.observe(time.perf_counter() - started, request.method, route)
+            http_requests.inc(request.method, route, str(response.status_code))
+        return response
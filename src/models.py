@@ -1,10 +1,15 @@
-from datetime import datetime, timedelta
+import json
+import re
+from datetime import datetime, timedelta, timezone
 from typing import Optional, List, Dict, Any
-from .database import db
+from .database import db, to_db_timestamp
+from .cache import response_cache
 
 class BaseModel:
     """Base model with common functionality"""
     table_name = ""
+    # Writes to tables shown by the admin read endpoints drop their cached responses
+    invalidates_cache = True
     
     @classmethod
     def create(cls, **kwargs) -> int:
@@ -21,7 +26,9 @@ class BaseModel:
             VALUES ({', '.join(placeholders)})
         """
         
-        return db.execute_insert(query, tuple(values))
+        record_id = db.execute_insert(query, tuple(values))
+        cls._invalidate_cache()
+        return record_id
     
     @classmethod
     def get_by_id(cls, record_id: int) -> Optional[Dict[str, Any]]:
@@ -40,6 +47,21 @@ class BaseModel:
         
         return db.execute_query(query, params)
     
+    @classmethod
+    def get_page(cls, limit: int, after: Optional[list] = None, where_clause: str = "",
+                 params: tuple = ()) -> List[Dict[str, Any]]:
+        """Keyset page in get_all order (id DESC); after is the [id] of the previous page's last row"""
+        conditions = [where_clause] if where_clause else []
+        if after:
+            conditions.append("id < ?")
+            params = tuple(params) + (int(after[0]),)
+        query = f"SELECT * FROM {cls.table_name}"
+        if conditions:
+            query += f" WHERE {' AND '.join(conditions)}"
+        query += " ORDER BY id DESC LIMIT ?"
+        
+        return db.execute_query(query, tuple(params) + (limit,))
+    
     @classmethod
     def update(cls, record_id: int, **kwargs) -> bool:
         """Update a record by ID"""
@@ -52,19 +74,123 @@ class BaseModel:
         values = list(filtered_kwargs.values()) + [record_id]
         
         query = f"UPDATE {cls.table_name} SET {set_clause} WHERE id = ?"
-        return db.execute_update(query, tuple(values)) > 0
+        updated = db.execute_update(query, tuple(values)) > 0
+        if updated:
+            cls._invalidate_cache()
+        return updated
     
     @classmethod
     def delete(cls, record_id: int) -> bool:
         """Delete a record by ID"""
         query = f"DELETE FROM {cls.table_name} WHERE id = ?"
-        return db.execute_update(query, (record_id,)) > 0
+        deleted = db.execute_update(query, (record_id,)) > 0
+        if deleted:
+            cls._invalidate_cache()
+        return deleted
+    
+    @classmethod
+    def upsert(cls, conflict_columns: List[str], conflict_where: str = "",
+               update: Optional[Dict[str, Any]] = None, **kwargs) -> Optional[int]:
+        """Insert a record, or update the row it conflicts with, in one statement.
+        
+        conflict_columns/conflict_where must match a UNIQUE index (partial
+        indexes need their WHERE clause). On conflict the values in update are
+        set, by default every inserted column except the conflict columns.
+        Returns the ID of the inserted or updated row (None if nothing to update).
+        """
+        filtered_kwargs = cls._filter_columns(**kwargs)
+        columns = list(filtered_kwargs.keys())
+        values = list(filtered_kwargs.values())
+        
+        if update is None:
+            set_clause = ', '.join(f"{col} = excluded.{col}" for col in columns if col not in conflict_columns)
+            update_values = []
+        else:
+            update = cls._filter_columns(**update)
+            set_clause = ', '.join(f"{col} = ?" for col in update)
+            update_values = list(update.values())
+        
+        target = f"({', '.join(conflict_columns)})"
+        if conflict_where:
+            target += f" WHERE {conflict_where}"
+        action = f"DO UPDATE SET {set_clause}" if set_clause else "DO NOTHING"
+        
+        query = f"""
+            INSERT INTO {cls.table_name} ({', '.join(columns)}) 
+            VALUES ({', '.join('?' for _ in columns)})
+            ON CONFLICT {target} {action}
+            RETURNING id
+        """
+        rows = db.execute_query(query, tuple(values + update_values))
+        cls._invalidate_cache()
+        return rows[0]['id'] if rows else None  # DO NOTHING returns no row
+    
+    @classmethod
+    def _search(cls, term: str, columns: tuple, weights: tuple, order_by: str,
+                estado: Optional[str], limit: int) -> List[Dict[str, Any]]:
+        """Ranked prefix search through <table>_fts, or LIKE when FTS5 is unavailable"""
+        params: list = []
+        estado_clause = "AND t.estado = ?" if estado else ""
+        
+        if db.fts_enabled:
+            fts_query = build_fts_query(term)
+            if fts_query is None:
+                return []
+            fts = f"{cls.table_name}_fts"
+            query = f"""
+                SELECT t.* FROM {fts} f
+                JOIN {cls.table_name} t ON t.id = f.rowid
+                WHERE {fts} MATCH ? {estado_clause}
+                ORDER BY bm25({fts}, {', '.join(str(w) for w in weights)})
+                LIMIT ?
+            """
+            params.append(fts_query)
+        else:
+            query = f"""
+                SELECT t.* FROM {cls.table_name} t
+                WHERE ({' OR '.join(f"t.{col} LIKE ?" for col in columns)}) {estado_clause}
+                ORDER BY t.{order_by}
+                LIMIT ?
+            """
+            params.extend([f"%{term}%"] * len(columns))
+        
+        if estado:
+            params.append(estado)
+        params.append(limit)
+        return db.execute_query(query, tuple(params))
+    
+    @classmethod
+    def _invalidate_cache(cls):
+        if cls.invalidates_cache:
+            response_cache.bump()
     
     @classmethod
     def _filter_columns(cls, **kwargs) -> Dict[str, Any]:
         """Filter kwargs to include only valid columns - override in subclasses"""
         return kwargs
 
+# Maximum rows returned by the admin search box
+SEARCH_LIMIT = 50
+
+def build_fts_query(term: str) -> Optional[str]:
+    """Turn free text into an FTS5 query: every word must match as a prefix"""
+    words = re.findall(r'\w+', term)
+    if not words:
+        return None
+    return ' '.join(f'"{word}"*' for word in words)
+
+# Display status of an access row: 'expired', 'expiring' (within 7 whole days) or 'active'.
+# datetime('now') is truncated to the second, so the bounds are inclusive: a
+# fecha_fin in the current second is already in the past for (fecha_fin - now)
+ACCESS_STATUS_SQL = """
+    CASE
+        WHEN a.fecha_fin IS NULL THEN 'active'
+        WHEN a.fecha_fin <= datetime('now') THEN 'expired'
+        WHEN a.fecha_fin <= datetime('now', '+8 days') THEN 'expiring'
+        ELSE 'active'
+    END
+"""
+
 class Indicador(BaseModel):
     """Model for managing TradingView indicators"""
     table_name = "indicadores"
@@ -89,15 +215,10 @@ class Indicador(BaseModel):
         return cls.get_all("estado = 'activo'")
     
     @classmethod
-    def search(cls, term: str) -> List[Dict[str, Any]]:
-        """Search indicators by name or description"""
-        query = f"""
-            SELECT * FROM {cls.table_name} 
-            WHERE nombre LIKE ? OR descripcion LIKE ? OR pub_id LIKE ?
-            ORDER BY nombre
-        """
-        search_term = f"%{term}%"
-        return db.execute_query(query, (search_term, search_term, search_term))
+    def search(cls, term: str, estado: Optional[str] = None, limit: int = SEARCH_LIMIT) -> List[Dict[str, Any]]:
+        """Search indicators by name, description or PUB ID (word prefixes, best matches first)"""
+        return cls._search(term, ('nombre', 'descripcion', 'pub_id'), (10.0, 2.0, 5.0),
+                           'nombre', estado, limit)
 
 class Cliente(BaseModel):
     """Model for managing clients"""
@@ -123,15 +244,10 @@ class Cliente(BaseModel):
         return cls.get_all("estado = 'activo'")
     
     @classmethod
-    def search(cls, term: str) -> List[Dict[str, Any]]:
-        """Search clients by username, email, or name"""
-        query = f"""
-            SELECT * FROM {cls.table_name} 
-            WHERE username_tradingview LIKE ? OR email LIKE ? OR nombre_completo LIKE ?
-            ORDER BY username_tradingview
-        """
-        search_term = f"%{term}%"
-        return db.execute_query(query, (search_term, search_term, search_term))
+    def search(cls, term: str, estado: Optional[str] = None, limit: int = SEARCH_LIMIT) -> List[Dict[str, Any]]:
+        """Search clients by username, email, or name (word prefixes, best matches first)"""
+        return cls._search(term, ('username_tradingview', 'email', 'nombre_completo'), (10.0, 5.0, 5.0),
+                           'username_tradingview', estado, limit)
     
     @classmethod
     def get_with_access_count(cls) -> List[Dict[str, Any]]:
@@ -192,25 +308,108 @@ class Acceso(BaseModel):
         """
         return db.execute_query(query, (indicador_id,))
     
+    @staticmethod
+    def _expiry_keyset(limit: Optional[int], after: Optional[list]) -> tuple:
+        """(condition, order/limit clause, params) for paging by (fecha_fin, id) ascending.
+        
+        SQLite sorts NULL (permanent) first, so a cursor on a NULL fecha_fin
+        continues with the remaining NULL rows and then every dated row.
+        """
+        condition, params = "", []
+        if after:
+            fecha_fin, access_id = after
+            if fecha_fin is None:
+                condition = "AND ((a.fecha_fin IS NULL AND a.id > ?) OR a.fecha_fin IS NOT NULL)"
+                params = [int(access_id)]
+            else:
+                condition = "AND (a.fecha_fin > ? OR (a.fecha_fin = ? AND a.id > ?))"
+                params = [fecha_fin, fecha_fin, int(access_id)]
+        order = "ORDER BY a.fecha_fin ASC, a.id ASC"
+        if limit is not None:
+            order += " LIMIT ?"
+            params.append(limit)
+        return condition, order, params
+    
     @classmethod
-    def get_active_accesses(cls) -> List[Dict[str, Any]]:
-        """Get all active accesses with client and indicator details"""
-        query = """
+    def get_active_accesses(cls, limit: Optional[int] = None, after: Optional[list] = None) -> List[Dict[str, Any]]:
+        """Get all active accesses with client and indicator details (or one keyset page of them)"""
+        keyset, order, params = cls._expiry_keyset(limit, after)
+        query = f"""
             SELECT a.*, 
-                   c.username_tradingview, c.nombre_completo,
-                   i.nombre as indicador_nombre, i.pub_id
+                   c.username_tradingview, c.nombre_completo, c.email,
+                   i.nombre as indicador_nombre, i.pub_id, i.version,
+                   {ACCESS_STATUS_SQL} as status
             FROM accesos a
             JOIN clientes c ON a.cliente_id = c.id
             JOIN indicadores i ON a.indicador_id = i.id
-            WHERE a.estado = 'activo'
-            ORDER BY a.fecha_fin ASC
+            WHERE a.estado = 'activo' {keyset}
+            {order}
         """
-        return db.execute_query(query)
+        return db.execute_query(query, tuple(params))
     
     @classmethod
-    def get_expiring_soon(cls, days: int = 7) -> List[Dict[str, Any]]:
-        """Get accesses expiring in the next N days"""
-        query = """
+    def get_grouped_by_client(cls, limit: Optional[int] = None, after: Optional[list] = None) -> List[Dict[str, Any]]:
+        """Active accesses grouped per client, ordered by username, built by SQLite's JSON1.
+        
+        Clients are walked in username order and each one's accesses are
+        aggregated (indicator list ordered by fecha_fin, per-status counts)
+        by a correlated seek on the active-access index, so a page only touches
+        the clients it returns. after is the [username] of the previous
+        page's last client.
+        """
+        conditions, params = "", []
+        if after:
+            conditions = "AND c.username_tradingview > ?"
+            params.append(after[0])
+        limit_clause = ""
+        if limit is not None:
+            limit_clause = "LIMIT ?"
+            params.append(limit)
+        
+        query = f"""
+            SELECT c.id AS client_id, c.username_tradingview, c.nombre_completo,
+                   COALESCE(c.email, '') AS email,
+                   (SELECT json_object(
+                               'indicators', json_group_array(json(indicator)),
+                               'indicators_count', COUNT(*),
+                               'active_indicators', SUM(status = 'active'),
+                               'expiring_indicators', SUM(status = 'expiring'),
+                               'expired_indicators', SUM(status = 'expired'))
+                    FROM (
+                        SELECT status, json_object(
+                                   'indicator_id', a.indicador_id,
+                                   'indicator_name', i.nombre,
+                                   'indicator_version', COALESCE(i.version, '1.0'),
+                                   'pub_id', i.pub_id,
+                                   'access_id', a.id,
+                                   'fecha_inicio', a.fecha_inicio,
+                                   'fecha_fin', a.fecha_fin,
+                                   'estado', a.estado,
+                                   'fecha_creacion', a.fecha_creacion,
+                                   'status', status) AS indicator
+                        FROM (SELECT a.*, {ACCESS_STATUS_SQL} AS status
+                              FROM accesos a INDEXED BY idx_accesos_activo_unico
+                              WHERE a.cliente_id = c.id AND a.estado = 'activo') a
+                        JOIN indicadores i ON a.indicador_id = i.id
+                        ORDER BY a.fecha_fin, a.id
+                    )) AS summary
+            FROM clientes c
+            WHERE EXISTS (SELECT 1 FROM accesos a WHERE a.cliente_id = c.id AND a.estado = 'activo')
+            {conditions}
+            ORDER BY c.username_tradingview
+            {limit_clause}
+        """
+        rows = db.execute_query(query, tuple(params))
+        for row in rows:
+            row.update(json.loads(row.pop('summary')))
+        return rows
+    
+    @classmethod
+    def get_expiring_soon(cls, days: int = 7, limit: Optional[int] = None,
+                          after: Optional[list] = None) -> List[Dict[str, Any]]:
+        """Get accesses expiring in the next N days (or one keyset page of them)"""
+        keyset, order, params = cls._expiry_keyset(limit, after)
+        query = f"""
             SELECT a.*, 
                    c.username_tradingview, c.nombre_completo,
                    i.nombre as indicador_nombre, i.pub_id
@@ -219,10 +418,10 @@ class Acceso(BaseModel):
             JOIN indicadores i ON a.indicador_id = i.id
             WHERE a.estado = 'activo' 
             AND a.fecha_fin IS NOT NULL 
-            AND a.fecha_fin <= datetime('now', '+{days} days')
-            ORDER BY a.fecha_fin ASC
+            AND a.fecha_fin <= datetime('now', ?) {keyset}
+            {order}
         """
-        return db.execute_query(query)
+        return db.execute_query(query, (f'+{int(days)} days',) + tuple(params))
     
     @classmethod
     def get_expired(cls) -> List[Dict[str, Any]]:
@@ -243,46 +442,308 @@ class Acceso(BaseModel):
     
     @classmethod
     def grant_access(cls, cliente_id: int, indicador_id: int, days: int, tipo_acceso: str = "temporal") -> int:
-        """Grant access to a client for specific days"""
-        fecha_inicio = datetime.now()
-        fecha_fin = fecha_inicio + timedelta(days=days) if days > 0 else None
+        """Grant access to a client for specific days, renewing the active access if there is one"""
+        fecha_inicio = datetime.now(timezone.utc)
+        fecha_fin = to_db_timestamp(fecha_inicio + timedelta(days=days)) if days > 0 else None
         
-        # Check if there's already an active access
-        existing = cls.get_by_client_and_indicator(cliente_id, indicador_id)
-        if existing:
-            # Update existing access
-            cls.update(existing['id'], 
-                      fecha_fin=fecha_fin.isoformat() if fecha_fin else None,
-                      tipo_acceso=tipo_acceso,
-                      notas=f"Renovado por {days} días" if days > 0 else "Convertido a acceso permanente")
-            return existing['id']
-        else:
-            # Create new access
-            return cls.create(
-                cliente_id=cliente_id,
-                indicador_id=indicador_id,
-                fecha_inicio=fecha_inicio.isoformat(),
-                fecha_fin=fecha_fin.isoformat() if fecha_fin else None,
-                tipo_acceso=tipo_acceso,
-                notas=f"Acceso inicial por {days} días" if days > 0 else "Acceso permanente"
-            )
+        # One statement: the partial unique index on active accesses turns a
+        # second grant into a renewal of the existing row
+        return cls.upsert(
+            ['cliente_id', 'indicador_id'],
+            conflict_where="estado = 'activo'",
+            update={
+                'fecha_fin': fecha_fin,
+                'tipo_acceso': tipo_acceso,
+                'notas': f"Renovado por {days} días" if days > 0 else "Convertido a acceso permanente"
+            },
+            cliente_id=cliente_id,
+            indicador_id=indicador_id,
+            fecha_inicio=to_db_timestamp(fecha_inicio),
+            fecha_fin=fecha_fin,
+            tipo_acceso=tipo_acceso,
+            notas=f"Acceso inicial por {days} días" if days > 0 else "Acceso permanente"
+        )
     
     @classmethod
     def revoke_access(cls, cliente_id: int, indicador_id: int) -> bool:
         """Revoke access for a client to specific indicator"""
-        existing = cls.get_by_client_and_indicator(cliente_id, indicador_id)
-        if existing:
-            return cls.update(existing['id'], estado='revocado', notas="Acceso revocado manualmente")
-        return False
+        query = f"""
+            UPDATE {cls.table_name} 
+            SET estado = 'revocado', notas = 'Acceso revocado manualmente' 
+            WHERE cliente_id = ? AND indicador_id = ? AND estado = 'activo'
+        """
+        revoked = db.execute_update(query, (cliente_id, indicador_id)) > 0
+        if revoked:
+            cls._invalidate_cache()
+        return revoked
     
     @classmethod
-    def mark_expired(cls) -> int:
-        """Mark expired accesses as expired and return count"""
-        query = """
-            UPDATE accesos 
-            SET estado = 'expirado' 
-            WHERE estado = 'activo' 
-            AND fecha_fin IS NOT NULL 
-            AND fecha_fin <= datetime('now')
+    def get_upcoming_expirations(cls, limit: int) -> List[Dict[str, Any]]:
+        """(id, fecha_fin) of the earliest-expiring active accesses, overdue ones included"""
+        query = f"""
+            SELECT id, fecha_fin FROM {cls.table_name} 
+            WHERE estado = 'activo' AND fecha_fin IS NOT NULL 
+            ORDER BY fecha_fin ASC 
+            LIMIT ?
+        """
+        return db.execute_query(query, (limit,))
+    
+    @classmethod
+    def get_entitlements(cls, pub_ids: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """Unexpired active accesses on active indicators (username, pub_id, fecha_fin).
+        
+        pub_ids=None means every indicator; an empty list matches none.
+        """
+        query = f"""
+            SELECT a.id, a.fecha_fin, c.username_tradingview, i.pub_id
+            FROM {cls.table_name} a
+            JOIN clientes c ON a.cliente_id = c.id
+            JOIN indicadores i ON a.indicador_id = i.id
+            WHERE a.estado = 'activo' AND i.estado = 'activo'
+            AND (a.fecha_fin IS NULL OR a.fecha_fin > datetime('now'))
+        """
+        params: tuple = ()
+        if pub_ids is not None:
+            if not pub_ids:
+                return []
+            query += f" AND i.pub_id IN ({', '.join('?' for _ in pub_ids)})"
+            params = tuple(pub_ids)
+        return db.execute_query(query, params)
+    
+    @classmethod
+    def is_active_for(cls, username_tradingview: str, pub_id: str) -> bool:
+        """True if the client currently has an active access to the indicator in the DB"""
+        query = f"""
+            SELECT 1 FROM {cls.table_name} a
+            JOIN clientes c ON a.cliente_id = c.id
+            JOIN indicadores i ON a.indicador_id = i.id
+            WHERE c.username_tradingview = ? AND i.pub_id = ? AND a.estado = 'activo'
+            AND (a.fecha_fin IS NULL OR a.fecha_fin > datetime('now'))
         """
-        return db.execute_update(query)
\ No newline at end of file
+        return bool(db.execute_query(query, (username_tradingview, pub_id)))
+    
+    @classmethod
+    def mark_expired(cls, access_ids: Optional[List[int]] = None) -> int:
+        """Mark expired accesses (or just access_ids) as expired and return count"""
+        if access_ids is not None:
+            query = f"UPDATE {cls.table_name} SET estado = 'expirado' WHERE id = ? AND estado = 'activo'"
+            count = db.execute_many(query, [(access_id,) for access_id in access_ids])
+        else:
+            query = """
+                UPDATE accesos 
+                SET estado = 'expirado' 
+                WHERE estado = 'activo' 
+                AND fecha_fin IS NOT NULL 
+                AND fecha_fin <= datetime('now')
+            """
+            count = db.execute_update(query)
+        if count:
+            cls._invalidate_cache()
+        return count
+    
+class BulkJob(BaseModel):
+    """Model for background bulk-grant jobs (usernames x indicators)"""
+    table_name = "bulk_jobs"
+    invalidates_cache = False
+    
+    @classmethod
+    def _filter_columns(cls, **kwargs) -> Dict[str, Any]:
+        valid_columns = {
+            'tipo', 'estado', 'duracion_dias', 'total_items', 'fecha_inicio', 'fecha_fin'
+        }
+        return {k: v for k, v in kwargs.items() if k in valid_columns}
+    
+    @classmethod
+    def get_recent(cls, limit: int = 20) -> List[Dict[str, Any]]:
+        """Get the most recent jobs"""
+        query = f"SELECT * FROM {cls.table_name} ORDER BY id DESC LIMIT ?"
+        return db.execute_query(query, (limit,))
+    
+    @classmethod
+    def get_unfinished(cls) -> List[Dict[str, Any]]:
+        """Get jobs that were queued or running (e.g. before a restart)"""
+        return cls.get_all("estado IN ('pendiente', 'procesando')")
+    
+    @classmethod
+    def mark_started(cls, job_id: int) -> bool:
+        """Move a job to 'procesando' and stamp its start time"""
+        query = f"""
+            UPDATE {cls.table_name} 
+            SET estado = 'procesando', fecha_inicio = COALESCE(fecha_inicio, CURRENT_TIMESTAMP)
+            WHERE id = ?
+        """
+        return db.execute_update(query, (job_id,)) > 0
+    
+    @classmethod
+    def mark_finished_if_done(cls, job_id: int) -> bool:
+        """Mark a job completed once none of its items is pending or running"""
+        query = f"""
+            UPDATE {cls.table_name} 
+            SET estado = 'completado', fecha_fin = CURRENT_TIMESTAMP
+            WHERE id = ? AND estado != 'completado'
+            AND NOT EXISTS (
+                SELECT 1 FROM bulk_job_items 
+                WHERE job_id = ? AND estado IN ('pendiente', 'procesando')
+            )
+        """
+        return db.execute_update(query, (job_id, job_id)) > 0
+
+class BulkJobItem(BaseModel):
+    """Model for a single (username, indicator) cell of a bulk job"""
+    table_name = "bulk_job_items"
+    invalidates_cache = False
+    
+    @classmethod
+    def _filter_columns(cls, **kwargs) -> Dict[str, Any]:
+        valid_columns = {
+            'job_id', 'username_tradingview', 'pub_id', 'estado', 'mensaje', 
+            'access_id', 'fecha_actualizacion'
+        }
+        return {k: v for k, v in kwargs.items() if k in valid_columns}
+    
+    @classmethod
+    def create_many(cls, job_id: int, cells: List[tuple]) -> int:
+        """Insert all (username, pub_id) cells of a job (joins an open transaction)"""
+        query = f"""
+            INSERT INTO {cls.table_name} (job_id, username_tradingview, pub_id) 
+            VALUES (?, ?, ?)
+        """
+        return db.execute_many(query, [(job_id, username, pub_id) for username, pub_id in cells])
+    
+    @classmethod
+    def get_job_items(cls, job_id: int, estado: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Get the cells of a job, optionally filtered by estado"""
+        query = f"SELECT * FROM {cls.table_name} WHERE job_id = ?"
+        params: tuple = (job_id,)
+        if estado:
+            query += " AND estado = ?"
+            params += (estado,)
+        query += " ORDER BY id"
+        return db.execute_query(query, params)
+    
+    @classmethod
+    def count_by_estado(cls, job_id: int) -> Dict[str, int]:
+        """Progress counters for a job"""
+        query = f"""
+            SELECT estado, COUNT(*) as count FROM {cls.table_name} 
+            WHERE job_id = ? GROUP BY estado
+        """
+        return {row['estado']: row['count'] for row in db.execute_query(query, (job_id,))}
+    
+    @classmethod
+    def set_result(cls, item_id: int, estado: str, mensaje: str = "", access_id: Optional[int] = None) -> bool:
+        """Record the outcome of one cell"""
+        query = f"""
+            UPDATE {cls.table_name} 
+            SET estado = ?, mensaje = ?, access_id = ?, fecha_actualizacion = CURRENT_TIMESTAMP
+            WHERE id = ?
+        """
+        return db.execute_update(query, (estado, mensaje, access_id, item_id)) > 0
+    
+    @classmethod
+    def reset_running(cls, job_id: int) -> int:
+        """Put cells interrupted mid-flight back to pending"""
+        query = f"UPDATE {cls.table_name} SET estado = 'pendiente' WHERE job_id = ? AND estado = 'procesando'"
+        return db.execute_update(query, (job_id,))
+
+class SyncTask(BaseModel):
+    """Model for the TradingView sync outbox (pending grant/revoke calls)"""
+    table_name = "sync_outbox"
+    invalidates_cache = False
+    
+    @classmethod
+    def _filter_columns(cls, **kwargs) -> Dict[str, Any]:
+        valid_columns = {
+            'operacion', 'username_tradingview', 'pub_id', 'payload', 'access_id',
+            'estado', 'intentos', 'proximo_intento', 'ultimo_error'
+        }
+        return {k: v for k, v in kwargs.items() if k in valid_columns}
+    
+    @classmethod
+    def enqueue(cls, operacion: str, username_tradingview: str, pub_id: str,
+                payload: Optional[Dict[str, Any]] = None, access_id: Optional[int] = None) -> int:
+        """Add a pending TradingView call; call inside db.transaction() with the DB change"""
+        return cls.create(
+            operacion=operacion,
+            username_tradingview=username_tradingview,
+            pub_id=pub_id,
+            payload=json.dumps(payload or {}),
+            access_id=access_id
+        )
+    
+    @classmethod
+    def claim_due(cls, limit: int = 10, lease_seconds: int = 300) -> List[Dict[str, Any]]:
+        """Atomically take due tasks, leasing them so a crashed worker's tasks come back"""
+        query = f"""
+            UPDATE {cls.table_name}
+            SET estado = 'procesando', intentos = intentos + 1,
+                proximo_intento = datetime('now', ?), fecha_actualizacion = CURRENT_TIMESTAMP
+            WHERE id IN (
+                SELECT id FROM {cls.table_name}
+                WHERE estado IN ('pendiente', 'procesando') AND proximo_intento <= datetime('now')
+                ORDER BY proximo_intento, id
+                LIMIT ?
+            )
+            RETURNING *
+        """
+        tasks = db.execute_query(query, (f'+{lease_seconds} seconds', limit))
+        for task in tasks:
+            task['payload'] = json.loads(task['payload'] or '{}')
+        return sorted(tasks, key=lambda t: t['id'])
+    
+    @classmethod
+    def update_payload(cls, task_id: int, payload: Dict[str, Any]) -> bool:
+        """Persist state a task must keep across retries"""
+        query = f"UPDATE {cls.table_name} SET payload = ?, fecha_actualizacion = CURRENT_TIMESTAMP WHERE id = ?"
+        return db.execute_update(query, (json.dumps(payload), task_id)) > 0
+    
+    @classmethod
+    def mark_done(cls, task_id: int) -> bool:
+        query = f"""
+            UPDATE {cls.table_name}
+            SET estado = 'completado', ultimo_error = NULL, fecha_actualizacion = CURRENT_TIMESTAMP
+            WHERE id = ?
+        """
+        return db.execute_update(query, (task_id,)) > 0
+    
+    @classmethod
+    def mark_retry(cls, task_id: int, error: str, delay_seconds: float) -> bool:
+        """Schedule another attempt after delay_seconds"""
+        query = f"""
+            UPDATE {cls.table_name}
+            SET estado = 'pendiente', ultimo_error = ?, proximo_intento = datetime('now', ?),
+                fecha_actualizacion = CURRENT_TIMESTAMP
+            WHERE id = ?
+        """
+        return db.execute_update(query, (error, f'+{int(delay_seconds)} seconds', task_id)) > 0
+    
+    @classmethod
+    def mark_dead(cls, task_id: int, error: str) -> bool:
+        """Dead-letter a task that exhausted its retries"""
+        query = f"""
+            UPDATE {cls.table_name}
+            SET estado = 'fallido', ultimo_error = ?, fecha_actualizacion = CURRENT_TIMESTAMP
+            WHERE id = ?
+        """
+        return db.execute_update(query, (error, task_id)) > 0
+    
+    @classmethod
+    def requeue(cls, task_id: int) -> bool:
+        """Give a dead-lettered task a fresh set of attempts"""
+        query = f"""
+            UPDATE {cls.table_name}
+            SET estado = 'pendiente', intentos = 0, proximo_intento = CURRENT_TIMESTAMP,
+                fecha_actualizacion = CURRENT_TIMESTAMP
+            WHERE id = ? AND estado = 'fallido'
+        """
+        return db.execute_update(query, (task_id,)) > 0
+    
+    @classmethod
+    def count_by_estado(cls) -> Dict[str, int]:
+        query = f"SELECT estado, COUNT(*) as count FROM {cls.table_name} GROUP BY estado"
+        return {row['estado']: row['count'] for row in db.execute_query(query)}
+    
+    @classmethod
+    def get_by_estado(cls, estado: str, limit: int = 50) -> List[Dict[str, Any]]:
+        query = f"SELECT * FROM {cls.table_name} WHERE estado = ? ORDER BY id DESC LIMIT ?"
+        return db.execute_query(query, (estado, limit))
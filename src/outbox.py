@@ -0,0 +1,242 @@
+"""
+TradingView sync outbox worker
+
+Access changes are committed to SQLite together with a ``sync_outbox`` row;
+this worker drains those rows against TradingView in the background,
+retrying with exponential backoff and dead-lettering tasks that keep failing.
+"""
+import os
+import random
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from .database import DB_TIMESTAMP_FORMAT, to_db_timestamp
+from .models import SyncTask, Acceso
+from .circuit_breaker import breaker, CircuitOpenError
+
+# Seconds between polls when the queue is idle (wake() short-circuits the wait)
+POLL_INTERVAL = float(os.getenv('OUTBOX_POLL_INTERVAL', '5'))
+# Attempts before a task is dead-lettered as 'fallido'
+MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', '8'))
+# Backoff: BACKOFF_BASE * 2^(attempt-1) seconds, capped at BACKOFF_MAX, with jitter
+BACKOFF_BASE = float(os.getenv('OUTBOX_BACKOFF_BASE', '5'))
+BACKOFF_MAX = float(os.getenv('OUTBOX_BACKOFF_MAX', '3600'))
+BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', '10'))
+
+
+def backoff_delay(attempt: int) -> float:
+    """Delay before the next attempt, with full jitter on the upper half"""
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * (2 ** max(0, attempt - 1)))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def _grant_expiration(task: Dict[str, Any]) -> Optional[str]:
+    """Absolute expiration a grant task must leave on TradingView (None = lifetime).
+
+    Grants carry the fecha_fin committed with their access, so a replay after a
+    timeout that TradingView did apply sets the same date instead of extending
+    it twice. Tasks queued before that only have 'days': use the access row, or
+    count the days from when the task was queued.
+    """
+    payload = task['payload']
+    if 'expiration' in payload:
+        return payload['expiration']
+    if task.get('access_id'):
+        access = Acceso.get_by_id(task['access_id'])
+        if access:
+            return access['fecha_fin']
+    days = int(payload.get('days') or 0)
+    if days <= 0:
+        return None
+    queued_at = datetime.strptime(task['fecha_creacion'], DB_TIMESTAMP_FORMAT).replace(tzinfo=timezone.utc)
+    return to_db_timestamp(queued_at + timedelta(days=days))
+
+
+def _extended_expiration(task: Dict[str, Any], access: Dict[str, Any]) -> str:
+    """Expiration for a legacy grant queued as "extend by days".
+
+    Like add_access on the synchronous path, the days are added to the
+    expiration TradingView has. That base is read on the first attempt and
+    stored in the task, so a replay after a timeout that TradingView did
+    apply ends on the same date instead of extending twice.
+    """
+    payload = task['payload']
+    if 'base_expiration' not in payload:
+        current = datetime.fromisoformat(access['currentExpiration'].replace('Z', '+00:00'))
+        if current.tzinfo is None:
+            current = current.replace(tzinfo=timezone.utc)
+        payload['base_expiration'] = to_db_timestamp(current)
+        SyncTask.update_payload(task['id'], payload)
+    base = datetime.strptime(payload['base_expiration'], DB_TIMESTAMP_FORMAT).replace(tzinfo=timezone.utc)
+    return to_db_timestamp(base + timedelta(days=int(payload['days'])))
+
+
+def _is_stale(task: Dict[str, Any]) -> bool:
+    """True if the DB access a grant/set_expiration was queued for is no longer active"""
+    if not task.get('access_id'):
+        return False  # Legacy routes write TradingView only: no DB row to check
+    access = Acceso.get_by_id(task['access_id'])
+    return access is None or access['estado'] != 'activo'
+
+
+class OutboxWorker:
+    """Background thread that applies queued grant/revoke/set_expiration calls to TradingView"""
+
+    def __init__(self, poll_interval: float = POLL_INTERVAL, batch_size: int = BATCH_SIZE):
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.processed = 0
+        self.failed = 0
+        self._counter_lock = threading.Lock()
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='sync-outbox', daemon=True)
+        self._thread.start()
+        print("✅ Sync outbox worker started")
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def wake(self):
+        """Process the queue now instead of waiting for the next poll"""
+        self._wake.set()
+
+    def is_running(self) -> bool:
+        return bool(self._thread and self._thread.is_alive())
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                processed = self.drain_once()
+            except Exception as e:
+                print(f"⚠️ Sync outbox error: {e}")
+                processed = 0
+            if processed == 0:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+    def drain_once(self) -> int:
+        """Claim and process one batch of due tasks; returns how many were handled"""
+        if breaker.is_open():
+            # Leave tasks unclaimed so they don't burn attempts while TradingView is down
+            return 0
+        tasks = SyncTask.claim_due(self.batch_size)
+        # Tasks for the same user and script keep their queue order; different
+        # pairs sync concurrently (bounded by TV_MAX_CONCURRENCY)
+        chains = defaultdict(list)
+        for task in tasks:
+            chains[(task['username_tradingview'].lower(), task['pub_id'])].append(task)
+        if len(chains) > 1:
+            from .tradingview import get_client
+            from .tradingview_async import AsyncTradingView, run_async
+            run_async(AsyncTradingView(get_client(validate=False)).run_many(self._process_chain,
+                                                                             list(chains.values())))
+        else:
+            for chain in chains.values():
+                self._process_chain(chain)
+        return len(tasks)
+
+    def _process_chain(self, tasks: List[Dict[str, Any]]):
+        for task in tasks:
+            self._process(task)
+
+    def _process(self, task: Dict[str, Any]):
+        try:
+            self._apply(task)
+        except CircuitOpenError as e:
+            # Not the task's fault: retry once the circuit is expected to close
+            SyncTask.mark_retry(task['id'], str(e), e.retry_after)
+            return
+        except Exception as e:
+            error = str(e) or e.__class__.__name__
+            with self._counter_lock:
+                self.failed += 1
+            if task['intentos'] >= MAX_ATTEMPTS:
+                SyncTask.mark_dead(task['id'], error)
+                print(f"❌ Sync task {task['id']} ({task['operacion']} {task['pub_id']}) dead-lettered: {error}")
+            else:
+                SyncTask.mark_retry(task['id'], error, backoff_delay(task['intentos']))
+            return
+
+        SyncTask.mark_done(task['id'])
+        with self._counter_lock:
+            self.processed += 1
+
+    def _apply(self, task: Dict[str, Any]):
+        from .tradingview import get_client
+
+        if task['operacion'] in ('grant', 'set_expiration') and _is_stale(task):
+            return  # Revoked or expired since it was queued: granting now would resurrect it
+
+        tv = get_client()
+        # Every operation here writes: look the user up on TradingView, not in the roster index
+        access = tv.get_access_details(task['username_tradingview'], task['pub_id'], fresh=True)
+
+        if task['operacion'] == 'grant':
+            if task['payload'].get('extend'):
+                if access['noExpiration']:
+                    return  # Lifetime access: add_access leaves it untouched as well
+                tv.set_access_expiration(access, _extended_expiration(task, access))
+            else:
+                # Idempotent: set the committed expiration, never extend relative to TradingView's
+                tv.set_access_expiration(access, _grant_expiration(task))
+        elif task['operacion'] == 'revoke':
+            if not access['hasAccess']:
+                return  # Already gone on TradingView
+            # Automated revokes (expiry, reconciliation) yield to an access granted since they
+            # were queued; manual revokes always apply
+            if task['payload'].get('reason') in ('expirado', 'reconcile') and \
+                    Acceso.is_active_for(task['username_tradingview'], task['pub_id']):
+                return
+            tv.remove_access(access)
+        elif task['operacion'] == 'set_expiration':
+            # Exact expiration from the DB (reconciliation); None means lifetime
+            tv.set_access_expiration(access, task['payload'].get('expiration'))
+        else:
+            raise ValueError(f"Unknown outbox operation: {task['operacion']}")
+
+        if access.get('status') == 'Failure':
+            raise Exception(f"TradingView rejected {task['operacion']} for {task['username_tradingview']}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'running': self.is_running(),
+            'processed': self.processed,
+            'failed_attempts': self.failed,
+            'queue': SyncTask.count_by_estado()
+        }
+
+
+_worker: Optional[OutboxWorker] = None
+_worker_lock = threading.Lock()
+
+
+def get_outbox_worker() -> OutboxWorker:
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            _worker = OutboxWorker()
+        return _worker
+
+
+def start_outbox_worker() -> OutboxWorker:
+    worker = get_outbox_worker()
+    worker.start()
+    return worker
+
+
+def notify_outbox():
+    """Tell the worker new tasks were committed (no-op if it is not running)"""
+    if _worker is not None:
+        _worker.wake()
@@ -0,0 +1,69 @@
+"""
+Keyset (cursor) pagination for the list endpoints
+
+A page is requested with ``?limit=N`` and continued with ``?after=<cursor>``,
+where the cursor is the opaque ``next_cursor`` of the previous page. The
+cursor encodes the sort key of the last row returned, so each page is an
+index seek instead of an OFFSET scan and stays stable while rows are added.
+"""
+import base64
+import json
+import os
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+DEFAULT_PAGE_SIZE = int(os.getenv('API_DEFAULT_PAGE_SIZE', '50'))
+MAX_PAGE_SIZE = int(os.getenv('API_MAX_PAGE_SIZE', '500'))
+
+
+def encode_cursor(values: List[Any]) -> str:
+    """Opaque cursor for a sort key (list of JSON scalars)"""
+    raw = json.dumps(values, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> List[Any]:
+    """Inverse of encode_cursor; raises ValueError on a malformed cursor"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError):
+        raise ValueError('Invalid pagination cursor')
+    if not isinstance(values, list):
+        raise ValueError('Invalid pagination cursor')
+    return values
+
+
+def parse_page_args(args) -> Optional[Tuple[int, Optional[List[Any]]]]:
+    """Read limit/after from request args; None when the client did not ask for paging"""
+    if 'limit' not in args and 'after' not in args:
+        return None
+    try:
+        limit = int(args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise ValueError('limit must be an integer')
+    if limit < 1:
+        raise ValueError('limit must be positive')
+    after = args.get('after')
+    return min(limit, MAX_PAGE_SIZE), decode_cursor(after) if after else None
+
+
+def fetch_page(fetch: Callable[[int, Optional[List[Any]]], List[Dict[str, Any]]],
+               key: Callable[[Dict[str, Any]], List[Any]], limit: int,
+               after: Optional[List[Any]], total: Optional[int] = None) -> Dict[str, Any]:
+    """Run fetch(limit + 1, after) and split the result into a page.
+
+    The extra row only tells whether another page follows; key(row) gives the
+    sort key that the next cursor resumes after.
+    """
+    rows = fetch(limit + 1, after)
+    has_more = len(rows) > limit
+    items = rows[:limit]
+    return {
+        'items': items,
+        'pagination': {
+            'limit': limit,
+            'has_more': has_more,
+            'next_cursor': encode_cursor(key(items[-1])) if has_more else None,
+            'total': total
+        }
+    }
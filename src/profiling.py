@@ -0,0 +1,279 @@
+"""
+Opt-in per-request profiling for admin callers
+
+An admin request (web session or admin token) sent with the header
+"X-Profile: 1" or the query flag "?_profile=1" runs under cProfile. The
+profile is stored in PROFILE_DIR (a .prof file for pstats/snakeviz and a
+JSON summary) and the response carries X-Profile-Id plus a Server-Timing
+header with the time spent in each layer:
+
+    routes       src/routes/ (view functions, serialization they call)
+    service      src/services.py
+    model        src/models.py
+    db           src/database.py and the sqlite3 calls it makes
+    tradingview  TradingView client, roster index, rate limiter, breaker and
+                 the HTTP stack (requests/urllib3/sockets) they call
+    framework    Flask/Werkzeug request handling outside the above
+
+Library and helper frames are charged to the layer that called them. Only
+the request thread is profiled (work done in the async executor shows up
+as the caller waiting for it), and one request per process is profiled at
+a time; others are served normally with "X-Profile: busy".
+
+Set REQUEST_PROFILING=false to ignore the flag entirely.
+"""
+import cProfile
+import itertools
+import json
+import os
+import pstats
+import re
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+REQUEST_PROFILING = os.getenv('REQUEST_PROFILING', 'true').lower() == 'true'
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'data/profiles')
+PROFILE_KEEP = int(os.getenv('PROFILE_KEEP', '50'))
+PROFILE_TOP = int(os.getenv('PROFILE_TOP', '25'))
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(SRC_DIR)
+# Modules under src/ with a layer of their own; the rest (cache, helper,
+# pagination, metrics...) are charged to their caller
+MODULE_LAYERS = {
+    'services.py': 'service',
+    'models.py': 'model',
+    'database.py': 'db',
+    'tradingview.py': 'tradingview',
+    'tradingview_async.py': 'tradingview',
+    'roster.py': 'tradingview',
+    'ratelimit.py': 'tradingview',
+    'circuit_breaker.py': 'tradingview',
+}
+LAYERS = ('routes', 'service', 'model', 'db', 'tradingview', 'framework')
+PROFILE_ID = re.compile(r'^\d+-\d+-\d+$')
+
+# cProfile cannot nest profilers reliably: one profiled request per process
+_active = threading.Lock()
+_sequence = itertools.count(1)
+
+
+def _requested() -> bool:
+    from flask import request
+    flag = request.headers.get('X-Profile') or request.args.get('_profile')
+    return bool(flag) and flag.lower() not in ('0', 'false', 'no')
+
+
+def is_active() -> bool:
+    """True while the current request is being profiled"""
+    from flask import g
+    return g.get('_profiler') is not None
+
+
+def _layer(filename: str) -> Optional[str]:
+    """Layer of a source file, or None when it is charged to its caller"""
+    if filename.startswith('~') or filename.startswith('<'):
+        return None  # Builtins (sqlite3, socket...) and generated code
+    path = os.path.abspath(filename)
+    if not path.startswith(SRC_DIR + os.sep):
+        return None
+    relative = os.path.relpath(path, SRC_DIR)
+    if relative.startswith('routes' + os.sep):
+        return 'routes'
+    return MODULE_LAYERS.get(relative)
+
+
+def _label(func: tuple) -> str:
+    filename, lineno, name = func
+    if filename == '~':
+        return name
+    if filename.startswith('<'):
+        return f"{filename}:{lineno}({name})"
+    path = os.path.abspath(filename)
+    if path.startswith(ROOT_DIR + os.sep):
+        short = os.path.relpath(path, ROOT_DIR)
+    else:
+        short = '/'.join(path.split(os.sep)[-2:])
+    return f"{short}:{lineno}({name})"
+
+
+def layer_breakdown(stats: Dict[tuple, tuple]) -> Dict[tuple, Dict[str, float]]:
+    """Share of each function's self time charged to every layer.
+
+    A function in a known layer belongs to it; any other function inherits
+    the layers of its callers, weighted by the time spent under each call
+    site. Functions nobody in the profile called are framework code.
+    """
+    shares: Dict[tuple, Dict[str, float]] = {}
+
+    def resolve(func, visiting):
+        if func in shares:
+            return shares[func]
+        layer = _layer(func[0])
+        if layer:
+            result = {layer: 1.0}
+        else:
+            callers = {caller: edge[3] for caller, edge in stats[func][4].items()
+                       if caller in stats and caller not in visiting}
+            if not callers:
+                result = {'framework': 1.0}
+            else:
+                total = sum(callers.values())
+                result = defaultdict(float)
+                for caller, weight in callers.items():
+                    share = weight / total if total else 1.0 / len(callers)
+                    for name, fraction in resolve(caller, visiting | {func}).items():
+                        result[name] += fraction * share
+                result = dict(result)
+        shares[func] = result
+        return result
+
+    for func in stats:
+        resolve(func, frozenset())
+    return shares
+
+
+def summarize(profiler: cProfile.Profile, top: int = PROFILE_TOP) -> Dict[str, Any]:
+    """Milliseconds per layer plus the heaviest functions by self and cumulative time"""
+    stats = pstats.Stats(profiler).stats
+    shares = layer_breakdown(stats)
+    layers = dict.fromkeys(LAYERS, 0.0)
+    rows = []
+    for func, (_, calls, self_time, cumulative, _) in stats.items():
+        for name, fraction in shares[func].items():
+            layers[name] += self_time * fraction
+        rows.append({
+            'function': _label(func),
+            'layer': max(shares[func].items(), key=lambda item: item[1])[0],
+            'calls': calls,
+            'self_ms': round(self_time * 1000, 3),
+            'cumulative_ms': round(cumulative * 1000, 3)
+        })
+    return {
+        'layers': {name: round(seconds * 1000, 3) for name, seconds in layers.items()},
+        'top_self': sorted(rows, key=lambda row: row['self_ms'], reverse=True)[:top],
+        'top_cumulative': sorted(rows, key=lambda row: row['cumulative_ms'], reverse=True)[:top]
+    }
+
+
+def _path(profile_id: str, extension: str) -> str:
+    return os.path.join(PROFILE_DIR, f"{profile_id}.{extension}")
+
+
+def _save(profile_id: str, profiler: cProfile.Profile, report: Dict[str, Any]):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    profiler.dump_stats(_path(profile_id, 'prof'))
+    with open(_path(profile_id, 'json'), 'w') as f:
+        json.dump(report, f, indent=2)
+
+    # Keep the newest PROFILE_KEEP profiles (ids start with a millisecond timestamp)
+    stored = sorted(name[:-5] for name in os.listdir(PROFILE_DIR) if name.endswith('.json'))
+    for old in stored[:max(0, len(stored) - PROFILE_KEEP)]:
+        for extension in ('json', 'prof'):
+            try:
+                os.remove(_path(old, extension))
+            except OSError:
+                pass
+
+
+def list_profiles() -> List[Dict[str, Any]]:
+    """Stored profile summaries, newest first (without the function lists)"""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    profiles = []
+    for name in sorted(os.listdir(PROFILE_DIR), reverse=True):
+        if not name.endswith('.json'):
+            continue
+        report = get_profile(name[:-5])
+        if report:
+            profiles.append({key: value for key, value in report.items()
+                             if key not in ('top_self', 'top_cumulative')})
+    return profiles
+
+
+def get_profile(profile_id: str) -> Optional[Dict[str, Any]]:
+    if not PROFILE_ID.match(profile_id):
+        return None
+    try:
+        with open(_path(profile_id, 'json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def profile_stats_path(profile_id: str) -> Optional[str]:
+    """Absolute path of the raw pstats dump, if stored"""
+    if not PROFILE_ID.match(profile_id):
+        return None
+    path = os.path.abspath(_path(profile_id, 'prof'))
+    return path if os.path.exists(path) else None
+
+
+def _stop(profiler: cProfile.Profile):
+    profiler.disable()
+    _active.release()
+
+
+def init_app(app):
+    """Profile flagged admin requests (register before the other request hooks)"""
+    if not REQUEST_PROFILING:
+        return
+    from flask import g, request
+
+    @app.before_request
+    def _start_profile():
+        if not _requested():
+            return
+        from .routes.legacy_routes import is_admin_request
+        if not is_admin_request():
+            return  # Non-admin callers are served normally
+        if not _active.acquire(blocking=False):
+            g._profile_busy = True
+            return
+        g._profile_started = time.perf_counter()
+        g._profiler = cProfile.Profile()
+        g._profiler.enable()
+
+    @app.after_request
+    def _finish_profile(response):
+        profiler = g.pop('_profiler', None)
+        if profiler is None:
+            if g.pop('_profile_busy', False):
+                response.headers['X-Profile'] = 'busy'
+            return response
+        _stop(profiler)
+        elapsed = time.perf_counter() - g.pop('_profile_started')
+
+        profile_id = f"{int(time.time() * 1000)}-{os.getpid()}-{next(_sequence)}"
+        report = {
+            'id': profile_id,
+            'method': request.method,
+            'path': request.full_path.rstrip('?'),
+            'route': request.url_rule.rule if request.url_rule else None,
+            'status': response.status_code,
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'total_ms': round(elapsed * 1000, 3)
+        }
+        try:
+            report.update(summarize(profiler))
+            _save(profile_id, profiler, report)
+        except Exception as e:
+            print(f"⚠️ Could not store profile {profile_id}: {e}")
+            return response
+
+        response.headers['X-Profile-Id'] = profile_id
+        response.headers['Server-Timing'] = ', '.join(
+            [f"{name};dur={ms:.2f}" for name, ms in report['layers'].items() if ms]
+            + [f"total;dur={report['total_ms']:.2f}"])
+        print(f"🔬 Profiled {request.method} {report['path']} in {report['total_ms']:.1f}ms -> {profile_id}")
+        return response
+
+    @app.teardown_request
+    def _discard_profile(exc=None):
+        # after_request did not run (the response could not be built)
+        profiler = g.pop('_profiler', None)
+        if profiler is not None:
+            _stop(profiler)
@@ -0,0 +1,199 @@
+"""
+Adaptive rate limiting for outbound TradingView calls
+
+One token bucket per ``config.urls`` key, shared by every thread in the
+process. Buckets slow down multiplicatively on 429/5xx responses, honour
+``Retry-After`` and speed back up additively while calls succeed.
+
+Background workers wait as long as the bucket requires. Calls made while
+serving an HTTP request give up after REQUEST_MAX_WAIT seconds with
+RateLimitedError, which callers already handle like an open circuit (503
+or a queued outbox task) instead of tying up a server thread.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Optional
+
+from .circuit_breaker import CircuitOpenError
+
+# Steady-state requests per second allowed per endpoint, and burst size
+DEFAULT_RATE = float(os.getenv('TV_RATE_LIMIT', '5'))
+DEFAULT_BURST = int(os.getenv('TV_RATE_BURST', '10'))
+# Floor the adaptive rate never drops below
+MIN_RATE = float(os.getenv('TV_RATE_MIN', '0.2'))
+# Multiplicative decrease on throttling, additive increase (fraction of max) on success
+DECREASE_FACTOR = 0.5
+INCREASE_STEP = 0.05
+# Longest Retry-After we are willing to honour, in seconds
+MAX_RETRY_AFTER = 300
+# Longest a request-path call waits for a token before failing fast
+REQUEST_MAX_WAIT = float(os.getenv('TV_REQUEST_MAX_WAIT', '2'))
+
+# Wait budget of the current context; None (background workers) means no limit
+_max_wait: ContextVar[Optional[float]] = ContextVar('tv_rate_max_wait', default=None)
+
+
+class RateLimitedError(CircuitOpenError):
+    """Raised instead of waiting longer than the caller's budget for a token
+
+    A subclass of CircuitOpenError so request paths fall back the same way.
+    """
+
+    def __init__(self, key: str, retry_after: float):
+        self.retry_after = retry_after
+        Exception.__init__(self, f"TradingView {key} rate limited (retry in {retry_after:.0f}s)")
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After header as seconds (delta-seconds or HTTP-date form)"""
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds()
+        except (TypeError, ValueError):
+            return None
+    return max(0.0, min(seconds, MAX_RETRY_AFTER))
+
+
+class TokenBucket:
+    """Token bucket whose refill rate adapts to the server's responses"""
+
+    def __init__(self, rate: float, burst: int):
+        self.max_rate = rate
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.waiting = 0
+        self.throttled = 0
+        self.requests = 0
+
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+
+class AdaptiveRateLimiter:
+    """Per-endpoint token buckets shared across threads"""
+
+    def __init__(self, rate: float = DEFAULT_RATE, burst: int = DEFAULT_BURST,
+                 min_rate: float = MIN_RATE, overrides: Optional[Dict[str, float]] = None):
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.overrides = overrides or {}
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, key: str) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(self.overrides.get(key, self.rate), self.burst)
+        return bucket
+
+    def acquire(self, key: str, max_wait: Optional[float] = None) -> float:
+        """Block until a request to ``key`` is allowed; returns seconds waited.
+
+        Raises RateLimitedError when that would take longer than max_wait
+        (default: the budget of the current context, see init_app).
+        """
+        if max_wait is None:
+            max_wait = _max_wait.get()
+        started = time.monotonic()
+        queued = False
+        try:
+            while True:
+                with self._lock:
+                    bucket = self._bucket(key)
+                    now = time.monotonic()
+                    bucket.refill(now)
+                    if bucket.blocked_until > now:
+                        wait = bucket.blocked_until - now
+                    elif bucket.tokens >= 1:
+                        bucket.tokens -= 1
+                        bucket.requests += 1
+                        return now - started
+                    else:
+                        wait = (1 - bucket.tokens) / bucket.rate
+                    if max_wait is not None and now - started + wait > max_wait:
+                        raise RateLimitedError(key, wait)
+                    if not queued:
+                        bucket.waiting += 1
+                        queued = True
+                time.sleep(wait)
+        finally:
+            if queued:
+                with self._lock:
+                    self._bucket(key).waiting -= 1
+
+    def record(self, key: str, status_code: int, retry_after: Optional[str] = None):
+        """Feed a response back into the bucket for ``key``"""
+        with self._lock:
+            bucket = self._bucket(key)
+            if status_code == 429 or status_code >= 500:
+                bucket.throttled += 1
+                bucket.rate = max(self.min_rate, bucket.rate * DECREASE_FACTOR)
+                # Drop the burst so the slower rate takes effect immediately
+                bucket.tokens = min(bucket.tokens, 0.0)
+                delay = parse_retry_after(retry_after)
+                if delay:
+                    bucket.blocked_until = max(bucket.blocked_until, time.monotonic() + delay)
+                print(f"⚠️ TradingView {key} throttled ({status_code}); rate now {bucket.rate:.2f}/s")
+            elif status_code < 400:
+                bucket.rate = min(bucket.max_rate, bucket.rate + bucket.max_rate * INCREASE_STEP)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Current rate, tokens and queue depth per endpoint for monitoring"""
+        with self._lock:
+            now = time.monotonic()
+            result = {}
+            for key, bucket in self._buckets.items():
+                bucket.refill(now)
+                result[key] = {
+                    'rate_per_second': round(bucket.rate, 3),
+                    'max_rate_per_second': bucket.max_rate,
+                    'tokens': round(bucket.tokens, 2),
+                    'queue_depth': bucket.waiting,
+                    'requests': bucket.requests,
+                    'throttled': bucket.throttled,
+                    'blocked_for_seconds': round(max(0.0, bucket.blocked_until - now), 1)
+                }
+            return result
+
+
+# Process-wide limiter used by the TradingView client
+limiter = AdaptiveRateLimiter()
+
+
+@contextmanager
+def unbounded_wait():
+    """Let calls in this block wait as long as the buckets require (batch work started by a request)"""
+    token = _max_wait.set(None)
+    try:
+        yield
+    finally:
+        _max_wait.reset(token)
+
+
+def init_app(app):
+    """Give TradingView calls made while serving a request REQUEST_MAX_WAIT at most"""
+    from flask import g
+
+    @app.before_request
+    def _limit_rate_wait():
+        g._rate_wait_token = _max_wait.set(REQUEST_MAX_WAIT)
+
+    @app.teardown_request
+    def _reset_rate_wait(exc=None):
+        token = g.pop('_rate_wait_token', None)
+        if token is not None:
+            _max_wait.reset(token)
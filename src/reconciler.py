@@ -0,0 +1,216 @@
+"""
+DB <-> TradingView access reconciliation
+
+Reads the full TradingView roster of every active indicator (concurrently,
+bounded by TV_MAX_CONCURRENCY), diffs it against the active accesses in
+SQLite and reports three kinds of drift:
+
+- missing:          active in the DB, absent on TradingView
+- extra:            on TradingView without an active DB access
+- expiry_mismatch:  on both, but the expirations disagree
+
+In apply mode missing and mismatched accesses are queued as 'set_expiration'
+outbox tasks (the DB is authoritative); extra users are only revoked when
+explicitly requested, since legacy /access grants never reach the DB.
+"""
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from .database import db, DB_TIMESTAMP_FORMAT, to_db_timestamp
+from .models import Acceso, Indicador, SyncTask
+from .outbox import notify_outbox
+from .circuit_breaker import breaker, CircuitOpenError
+
+# Seconds between scheduled runs (0 disables the schedule)
+RECONCILE_INTERVAL = int(os.getenv('RECONCILE_INTERVAL', '0'))
+# Scheduled runs queue fixes instead of only reporting them
+RECONCILE_AUTO_APPLY = os.getenv('RECONCILE_AUTO_APPLY', 'false').lower() == 'true'
+# Expirations closer than this many seconds are considered equal
+RECONCILE_EXPIRY_TOLERANCE = int(os.getenv('RECONCILE_EXPIRY_TOLERANCE', '86400'))
+# Entries listed per drift kind in the summary (counts are always complete)
+RECONCILE_REPORT_LIMIT = int(os.getenv('RECONCILE_REPORT_LIMIT', '200'))
+
+
+def _parse_tv_expiration(value: Optional[str]) -> Optional[datetime]:
+    """TradingView expiration -> naive UTC datetime (None = lifetime)"""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        from dateutil import parser
+        parsed = parser.parse(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+class Reconciler:
+    """Diffs SQLite accesses against TradingView rosters and queues the fixes"""
+
+    def __init__(self, tolerance: int = RECONCILE_EXPIRY_TOLERANCE, report_limit: int = RECONCILE_REPORT_LIMIT):
+        self.tolerance = tolerance
+        self.report_limit = report_limit
+        self.last_result: Optional[Dict[str, Any]] = None
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def run(self, apply: bool = False, revoke_extra: bool = False,
+            pub_ids: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Reconcile once and return a summary with per-phase timings.
+
+        pub_ids limits the run to those indicators (None = every active one).
+        Raises ValueError if pub_ids is not a list of strings, and
+        CircuitOpenError without touching anything while TradingView is
+        unavailable; only one run happens at a time.
+        """
+        if pub_ids is not None and (not isinstance(pub_ids, list)
+                                    or not all(isinstance(p, str) for p in pub_ids)):
+            raise ValueError('pub_ids must be a list of indicator pub_ids')
+        if breaker.is_open():
+            raise CircuitOpenError(breaker.name, breaker.retry_after())
+
+        with self._lock:
+            timings: Dict[str, float] = {}
+            started_at = to_db_timestamp()
+            started = time.perf_counter()
+
+            # 1. What the DB says each user should have
+            phase = time.perf_counter()
+            wanted = set(pub_ids) if pub_ids is not None else None
+            indicators = [i['pub_id'] for i in Indicador.get_active()
+                          if wanted is None or i['pub_id'] in wanted]
+            expected: Dict[str, Dict[str, Dict[str, Any]]] = {p: {} for p in indicators}
+            for row in Acceso.get_entitlements(indicators):
+                expected[row['pub_id']][row['username_tradingview'].lower()] = row
+            timings['load_db'] = time.perf_counter() - phase
+
+            # 2. What TradingView says (full, concurrent roster reads)
+            phase = time.perf_counter()
+            rosters = []
+            if indicators:  # No matching active indicator: empty report
+                from .tradingview_async import AsyncTradingView, run_async
+                from .ratelimit import unbounded_wait
+                # A full sweep outruns the limiter burst: pace it instead of failing fast on the request path
+                with unbounded_wait():
+                    rosters = run_async(AsyncTradingView().get_rosters_many(indicators, max_age=0))
+            timings['fetch_rosters'] = time.perf_counter() - phase
+
+            # 3. Diff
+            phase = time.perf_counter()
+            drift: Dict[str, List[Dict[str, Any]]] = {'missing': [], 'extra': [], 'expiry_mismatch': []}
+            errors = []
+            for pub_id, roster in zip(indicators, rosters):
+                if isinstance(roster, Exception):
+                    errors.append({'pub_id': pub_id, 'error': str(roster) or roster.__class__.__name__})
+                    continue
+                self._diff(pub_id, expected[pub_id], roster, drift)
+            timings['diff'] = time.perf_counter() - phase
+
+            # 4. Queue fixes through the outbox (retries and dead-lettering come with it)
+            phase = time.perf_counter()
+            queued = 0
+            if apply:
+                queued = self._queue_fixes(drift, revoke_extra)
+            timings['apply'] = time.perf_counter() - phase
+            timings['total'] = time.perf_counter() - started
+
+            result = {
+                'mode': 'apply' if apply else 'report',
+                'started_at': started_at,
+                'indicators': len(indicators),
+                'db_accesses': sum(len(users) for users in expected.values()),
+                'tradingview_users': sum(len(r) for r in rosters if not isinstance(r, Exception)),
+                'counts': {kind: len(items) for kind, items in drift.items()},
+                'queued': queued,
+                'errors': errors,
+                'timings_ms': {name: round(seconds * 1000, 1) for name, seconds in timings.items()},
+                **{kind: items[:self.report_limit] for kind, items in drift.items()}
+            }
+            self.last_result = result
+            print(f"🔁 Reconciliation ({result['mode']}): {result['counts']}, "
+                  f"{queued} fix(es) queued in {result['timings_ms']['total']}ms")
+            return result
+
+    def _diff(self, pub_id: str, expected: Dict[str, Dict[str, Any]],
+              roster: Dict[str, Dict[str, Any]], drift: Dict[str, List[Dict[str, Any]]]):
+        for key, row in expected.items():
+            tv_user = roster.get(key)
+            if tv_user is None:
+                drift['missing'].append({'username': row['username_tradingview'], 'pub_id': pub_id,
+                                         'access_id': row['id'], 'db_expiration': row['fecha_fin']})
+            elif not self._same_expiration(row['fecha_fin'], tv_user.get('expiration')):
+                drift['expiry_mismatch'].append({'username': row['username_tradingview'], 'pub_id': pub_id,
+                                                 'access_id': row['id'], 'db_expiration': row['fecha_fin'],
+                                                 'tradingview_expiration': tv_user.get('expiration')})
+        for key, tv_user in roster.items():
+            if key not in expected:
+                drift['extra'].append({'username': tv_user['username'], 'pub_id': pub_id,
+                                       'tradingview_expiration': tv_user.get('expiration')})
+
+    def _same_expiration(self, db_value: Optional[str], tv_value: Optional[str]) -> bool:
+        tv_expiration = _parse_tv_expiration(tv_value)
+        if db_value is None or tv_expiration is None:
+            return db_value is None and tv_expiration is None
+        db_expiration = datetime.strptime(db_value, DB_TIMESTAMP_FORMAT)
+        return abs((db_expiration - tv_expiration).total_seconds()) <= self.tolerance
+
+    def _queue_fixes(self, drift: Dict[str, List[Dict[str, Any]]], revoke_extra: bool) -> int:
+        queued = 0
+        with db.transaction():
+            for item in drift['missing'] + drift['expiry_mismatch']:
+                SyncTask.enqueue('set_expiration', item['username'], item['pub_id'],
+                                 {'expiration': item['db_expiration'], 'reason': 'reconcile'},
+                                 access_id=item['access_id'])
+                queued += 1
+            if revoke_extra:
+                for item in drift['extra']:
+                    SyncTask.enqueue('revoke', item['username'], item['pub_id'], {'reason': 'reconcile'})
+                    queued += 1
+        if queued:
+            notify_outbox()
+        return queued
+
+    def start_schedule(self, interval: int = RECONCILE_INTERVAL, apply: bool = RECONCILE_AUTO_APPLY):
+        """Run every interval seconds in a daemon thread (no-op when interval is 0)"""
+        if interval <= 0 or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+
+        def loop():
+            while not self._stop.wait(interval):
+                try:
+                    self.run(apply=apply)
+                except CircuitOpenError as e:
+                    print(f"⚠️ Reconciliation skipped: {e}")
+                except Exception as e:
+                    print(f"⚠️ Reconciliation error: {e}")
+
+        self._thread = threading.Thread(target=loop, name='reconciler', daemon=True)
+        self._thread.start()
+        print(f"✅ Reconciliation scheduled every {interval}s ({'apply' if apply else 'report only'})")
+
+    def stop_schedule(self):
+        self._stop.set()
+
+
+_reconciler: Optional[Reconciler] = None
+_reconciler_lock = threading.Lock()
+
+
+def get_reconciler() -> Reconciler:
+    global _reconciler
+    with _reconciler_lock:
+        if _reconciler is None:
+            _reconciler = Reconciler()
+        return _reconciler
+
+
+def start_reconcile_schedule() -> Reconciler:
+    reconciler = get_reconciler()
+    reconciler.start_schedule()
+    return reconciler
@@ -0,0 +1,190 @@
+"""
+Per-indicator subscriber rosters for TradingView Pine scripts
+
+Pages through pine_perm/list_users for a pine_id and keeps an in-memory
+username -> expiration index so access lookups no longer depend on the
+first page of results.
+"""
+import os
+import threading
+import time
+from typing import Dict, Any, Optional, Tuple, List
+from urllib.parse import urljoin
+
+from . import config
+
+# Seconds before a roster is refreshed again (incrementally, newest first)
+ROSTER_TTL = int(os.getenv('TV_ROSTER_TTL', '120'))
+# Seconds before a roster is re-read completely to pick up external removals
+ROSTER_FULL_REFRESH = int(os.getenv('TV_ROSTER_FULL_REFRESH', '3600'))
+# Users requested per list_users page
+ROSTER_PAGE_SIZE = int(os.getenv('TV_ROSTER_PAGE_SIZE', '100'))
+
+
+class _Roster:
+    """Index of the users with access to one pine_id"""
+
+    def __init__(self, pine_id: str):
+        self.pine_id = pine_id
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self.fetched_at = 0.0
+        self.full_fetched_at = 0.0
+        self.lock = threading.Lock()
+
+    def is_stale(self, ttl: int) -> bool:
+        return time.monotonic() - self.fetched_at >= ttl
+
+
+class RosterIndex:
+    """Username -> expiration index per pine_id, refreshed lazily"""
+
+    def __init__(self, client, ttl: int = ROSTER_TTL, full_refresh: int = ROSTER_FULL_REFRESH,
+                 page_size: int = ROSTER_PAGE_SIZE):
+        self.client = client
+        self.ttl = ttl
+        self.full_refresh = full_refresh
+        self.page_size = page_size
+        self._rosters: Dict[str, _Roster] = {}
+        self._lock = threading.Lock()
+
+    def _get_roster(self, pine_id: str) -> _Roster:
+        with self._lock:
+            roster = self._rosters.get(pine_id)
+            if roster is None:
+                roster = self._rosters[pine_id] = _Roster(pine_id)
+            return roster
+
+    def _headers(self) -> Dict[str, str]:
+        return {
+            'origin': config.origin,
+            'Content-Type': 'application/x-www-form-urlencoded',
+            'Cookie': self.client.cookies
+        }
+
+    def _fetch_page(self, pine_id: str, url: Optional[str]) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Fetch one list_users page, returning its users and the next page URL"""
+        if url is None:
+            url = f"{config.urls['list_users']}?limit={self.page_size}&order_by=-created"
+        response = self.client._request('list_users', 'POST', url, headers=self._headers(),
+                                        data={'pine_id': pine_id})
+        data = response.json()
+        results = data.get('results', [])
+
+        next_url = data.get('next')
+        if next_url:
+            next_url = urljoin(config.urls['list_users'], next_url)
+        elif len(results) >= self.page_size and 'count' in data:
+            # No cursor in the payload: fall back to offset pagination
+            offset = int(data.get('offset', 0)) + len(results)
+            if offset < int(data['count']):
+                next_url = (f"{config.urls['list_users']}?limit={self.page_size}"
+                            f"&offset={offset}&order_by=-created")
+        return results, next_url
+
+    def refresh(self, pine_id: str, full: bool = False) -> int:
+        """Refresh the roster for pine_id and return the number of pages read.
+
+        An incremental refresh reads newest-first and stops at the first page
+        that holds no new or changed users; a full refresh rebuilds the index.
+        """
+        roster = self._get_roster(pine_id)
+        with roster.lock:
+            return self._refresh_locked(roster, full)
+
+    def _refresh_locked(self, roster: _Roster, full: bool) -> int:
+        full = full or not roster.full_fetched_at or \
+            time.monotonic() - roster.full_fetched_at >= self.full_refresh
+        entries = {} if full else dict(roster.entries)
+
+        pages = 0
+        url = None
+        while True:
+            results, url = self._fetch_page(roster.pine_id, url)
+            pages += 1
+            changed = False
+            for user in results:
+                key = user['username'].lower()
+                entry = {'username': user['username'], 'expiration': user.get('expiration')}
+                if entries.get(key) != entry:
+                    entries[key] = entry
+                    changed = True
+            if not url or (not full and not changed):
+                break
+
+        roster.entries = entries
+        roster.fetched_at = time.monotonic()
+        if full:
+            roster.full_fetched_at = roster.fetched_at
+        print(f"Roster {roster.pine_id} refreshed ({'full' if full else 'incremental'}): "
+              f"{len(entries)} users, {pages} page(s)")
+        return pages
+
+    def lookup(self, pine_id: str, username: str) -> Optional[Dict[str, Any]]:
+        """Return the roster entry for username, or None if it has no access"""
+        roster = self._get_roster(pine_id)
+        with roster.lock:
+            if roster.is_stale(self.ttl):
+                self._refresh_locked(roster, full=False)
+            return roster.entries.get(username.lower())
+
+    def lookup_fresh(self, pine_id: str, username: str) -> Optional[Dict[str, Any]]:
+        """Ask TradingView for this one user, bypassing the cached roster.
+
+        Incremental refreshes cannot see changed expirations on older entries
+        and every process has its own index, so writes that build on the
+        current expiration must not trust it. The answer is written through
+        to the index.
+        """
+        url = f"{config.urls['list_users']}?limit={self.page_size}&order_by=-created"
+        response = self.client._request('list_users', 'POST', url, headers=self._headers(),
+                                        data={'pine_id': pine_id, 'username': username})
+        key = username.lower()
+        for user in response.json().get('results', []):
+            if user['username'].lower() == key:
+                entry = {'username': user['username'], 'expiration': user.get('expiration')}
+                self.record(pine_id, entry['username'], entry['expiration'])
+                return entry
+        self.discard(pine_id, username)
+        return None
+
+    def get_users(self, pine_id: str, max_age: Optional[int] = None) -> Dict[str, Dict[str, Any]]:
+        """Return a copy of the whole roster, refreshing it if older than max_age"""
+        roster = self._get_roster(pine_id)
+        with roster.lock:
+            if roster.is_stale(self.ttl if max_age is None else max_age):
+                self._refresh_locked(roster, full=max_age == 0)
+            return dict(roster.entries)
+
+    def record(self, pine_id: str, username: str, expiration: Optional[str]):
+        """Write-through after a successful add/modify so the index stays current"""
+        roster = self._get_roster(pine_id)
+        with roster.lock:
+            if roster.fetched_at:
+                roster.entries[username.lower()] = {'username': username, 'expiration': expiration}
+
+    def discard(self, pine_id: str, username: str):
+        """Write-through after a successful removal"""
+        roster = self._get_roster(pine_id)
+        with roster.lock:
+            roster.entries.pop(username.lower(), None)
+
+    def invalidate(self, pine_id: Optional[str] = None):
+        """Drop cached rosters (all of them if pine_id is None)"""
+        with self._lock:
+            if pine_id is None:
+                self._rosters.clear()
+            else:
+                self._rosters.pop(pine_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        """Size and age of every cached roster"""
+        now = time.monotonic()
+        with self._lock:
+            rosters = list(self._rosters.values())
+        return {
+            r.pine_id: {
+                'users': len(r.entries),
+                'age_seconds': round(now - r.fetched_at, 1) if r.fetched_at else None
+            }
+            for r in rosters
+        }
@@ -2,10 +2,13 @@
 API Routes for PineScript Control Access
 New management endpoints alongside existing legacy API
 """
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app, send_file
 from functools import wraps
 import os
 from ..services import ClienteService, IndicadorService, AccesoService, DashboardService
+from ..cache import response_cache
+from ..pagination import parse_page_args
+from .. import profiling
 
 # Create blueprint for new API routes
 api_bp = Blueprint('api', __name__, url_prefix='/api/v1')
@@ -33,9 +36,36 @@ def require_admin_token(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def cached_response(f):
+    """Serve repeated GETs from the in-process response cache until the next write.
+    
+    Only successful JSON responses are stored (keyed on path + query string);
+    must be applied below require_admin_token so auth still runs on hits.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if profiling.is_active():
+            # A profile of a cache hit would not show where the time goes
+            return f(*args, **kwargs)
+        
+        key = (f.__name__, request.full_path)
+        generation, body = response_cache.get(key)
+        if body is not None:
+            response = current_app.response_class(body, mimetype='application/json')
+            response.headers['X-Cache'] = 'HIT'
+            return response
+        
+        response = f(*args, **kwargs)
+        if getattr(response, 'status_code', None) == 200:
+            response_cache.set(generation, key, response.get_data())
+            response.headers['X-Cache'] = 'MISS'
+        return response
+    return decorated_function
+
 # Dashboard endpoint
 @api_bp.route('/dashboard', methods=['GET'])
 @require_admin_token
+@cached_response
 def dashboard():
     """Get dashboard statistics"""
     try:
@@ -50,13 +80,22 @@ def dashboard():
 # Client management endpoints
 @api_bp.route('/clients', methods=['GET'])
 @require_admin_token
+@cached_response
 def get_clients():
     """Get all clients"""
     try:
         search_term = request.args.get('search', '')
+        page_args = parse_page_args(request.args)
         
         if search_term:
             clients = ClienteService.search_clients(search_term)
+        elif page_args:
+            page = ClienteService.get_active_clients_page(*page_args)
+            return jsonify({
+                'success': True,
+                'data': page['items'],
+                'pagination': page['pagination']
+            })
         else:
             clients = ClienteService.get_active_clients()
         
@@ -64,6 +103,8 @@ def get_clients():
             'success': True,
             'data': clients
         })
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -91,6 +132,25 @@ def create_client():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@api_bp.route('/clients/validate', methods=['POST'])
+@require_admin_token
+def validate_usernames():
+    """Validate a list of TradingView usernames"""
+    try:
+        data = request.get_json()
+        
+        if not data or not isinstance(data.get('usernames'), list) or not data['usernames']:
+            return jsonify({'error': 'usernames (non-empty list) is required'}), 400
+        
+        return jsonify({
+            'success': True,
+            'data': ClienteService.validate_usernames(data['usernames'])
+        })
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @api_bp.route('/clients/<int:client_id>', methods=['GET'])
 @require_admin_token
 def get_client_profile(client_id):
@@ -146,13 +206,22 @@ def deactivate_client(client_id):
 # Indicator management endpoints
 @api_bp.route('/indicators', methods=['GET'])
 @require_admin_token
+@cached_response
 def get_indicators():
     """Get all indicators"""
     try:
         search_term = request.args.get('search', '')
+        page_args = parse_page_args(request.args)
         
         if search_term:
             indicators = IndicadorService.search_indicators(search_term)
+        elif page_args:
+            page = IndicadorService.get_active_indicators_page(*page_args)
+            return jsonify({
+                'success': True,
+                'data': page['items'],
+                'pagination': page['pagination']
+            })
         else:
             indicators = IndicadorService.get_active_indicators()
         
@@ -160,6 +229,8 @@ def get_indicators():
             'success': True,
             'data': indicators
         })
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -235,8 +306,8 @@ def update_indicator(indicator_id):
                 return jsonify({'error': 'Invalid price format'}), 400
         
         # Auto-update timestamp
-        from datetime import datetime
-        filtered_data['ultima_actualizacion'] = datetime.now().isoformat()
+        from ..database import to_db_timestamp
+        filtered_data['ultima_actualizacion'] = to_db_timestamp()
         
         success = IndicadorService.update_indicator(indicator_id, **filtered_data)
         
@@ -266,10 +337,22 @@ def delete_indicator(indicator_id):
 # Access management endpoints
 @api_bp.route('/access', methods=['GET'])
 @require_admin_token
+@cached_response
 def get_accesses():
     """Get all accesses"""
     try:
         filter_type = request.args.get('filter', 'all')  # all, active, expiring
+        page_args = parse_page_args(request.args)
+        
+        if page_args:
+            # ?limit=N[&after=cursor]: keyset pages ordered by (fecha_fin, id)
+            expiring_days = int(request.args.get('days', 7)) if filter_type == 'expiring' else None
+            page = AccesoService.get_accesses_page(*page_args, expiring_days=expiring_days)
+            return jsonify({
+                'success': True,
+                'data': page['items'],
+                'pagination': page['pagination']
+            })
         
         if filter_type == 'expiring':
             days = int(request.args.get('days', 7))
@@ -283,6 +366,8 @@ def get_accesses():
             'success': True,
             'data': accesses
         })
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -368,6 +453,16 @@ def grant_bulk_access():
         if not client:
             return jsonify({'error': 'Client not found'}), 400
         
+        # Optional background mode: return a job id immediately instead of blocking
+        if data.get('async'):
+            from ..jobs import get_job_runner
+            job = get_job_runner().submit_grant_job(
+                usernames=[client['username_tradingview']],
+                pub_ids=None,
+                days=int(data['duracion_dias'])
+            )
+            return jsonify({'success': True, 'job': job}), 202
+        
         result = AccesoService.grant_access_to_all_indicators(
             username_tradingview=client['username_tradingview'],
             days=int(data['duracion_dias'])
@@ -381,18 +476,99 @@ def grant_bulk_access():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# Bulk job endpoints
+@api_bp.route('/jobs/bulk-grant', methods=['POST'])
+@require_admin_token
+def submit_bulk_grant_job():
+    """Queue a usernames x pub_ids grant job and return its id immediately"""
+    try:
+        data = request.get_json()
+        
+        if not data or 'duracion_dias' not in data or not (data.get('usernames') or data.get('client_ids')):
+            return jsonify({
+                'error': 'Required fields: duracion_dias and usernames or client_ids'
+            }), 400
+        
+        usernames = list(data.get('usernames') or [])
+        if data.get('client_ids'):
+            from ..models import Cliente
+            for client_id in data['client_ids']:
+                client = Cliente.get_by_id(client_id)
+                if not client:
+                    return jsonify({'error': f'Client not found: {client_id}'}), 400
+                usernames.append(client['username_tradingview'])
+        
+        from ..jobs import get_job_runner
+        job = get_job_runner().submit_grant_job(
+            usernames=usernames,
+            pub_ids=data.get('pub_ids'),  # Default: all active indicators
+            days=int(data['duracion_dias'])
+        )
+        
+        return jsonify({'success': True, 'job': job}), 202
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api_bp.route('/jobs', methods=['GET'])
+@require_admin_token
+def list_jobs():
+    """List recent bulk jobs"""
+    try:
+        from ..jobs import get_job_runner
+        limit = int(request.args.get('limit', 20))
+        return jsonify({
+            'success': True,
+            'data': get_job_runner().list_jobs(limit)
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api_bp.route('/jobs/<int:job_id>', methods=['GET'])
+@require_admin_token
+def get_job(job_id):
+    """Get bulk job progress (per-cell results unless items=0)"""
+    try:
+        from ..jobs import get_job_runner
+        include_items = request.args.get('items', '1') != '0'
+        job = get_job_runner().get_job(job_id, include_items=include_items)
+        
+        if not job:
+            return jsonify({'error': 'Job not found'}), 404
+        
+        return jsonify({
+            'success': True,
+            'data': job
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 # Grouped access view endpoint
 @api_bp.route('/access/grouped', methods=['GET'])
 @require_admin_token
+@cached_response
 def get_grouped_accesses():
     """Get accesses grouped by client"""
     try:
+        page_args = parse_page_args(request.args)
+        if page_args:
+            page = AccesoService.get_accesses_grouped_page(*page_args)
+            return jsonify({
+                'success': True,
+                'data': page['items'],
+                'pagination': page['pagination']
+            })
+        
         grouped_accesses = AccesoService.get_accesses_grouped_by_client()
         
         return jsonify({
             'success': True,
             'data': grouped_accesses
         })
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -432,12 +608,156 @@ def process_expired():
         
         return jsonify({
             'success': True,
-            'message': f'Processed {count} expired accesses'
+            'message': f'Processed {count} expired accesses (TradingView revocations queued)'
         })
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@api_bp.route('/maintenance/reconcile', methods=['POST'])
+@require_admin_token
+def reconcile_accesses():
+    """Diff DB accesses against TradingView rosters; queue fixes when apply is true"""
+    try:
+        from ..reconciler import get_reconciler
+        from ..circuit_breaker import CircuitOpenError
+        
+        data = request.get_json(silent=True) or {}
+        try:
+            result = get_reconciler().run(
+                apply=bool(data.get('apply', False)),
+                revoke_extra=bool(data.get('revoke_extra', False)),
+                pub_ids=data.get('pub_ids')
+            )
+        except CircuitOpenError as e:
+            response = jsonify({'error': str(e), 'retry_after': round(e.retry_after)})
+            response.headers['Retry-After'] = str(max(1, round(e.retry_after)))
+            return response, 503
+        
+        return jsonify({
+            'success': True,
+            'data': result
+        })
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api_bp.route('/maintenance/reconcile', methods=['GET'])
+@require_admin_token
+def get_last_reconciliation():
+    """Summary of the most recent reconciliation run"""
+    try:
+        from ..reconciler import get_reconciler
+        
+        return jsonify({
+            'success': True,
+            'data': get_reconciler().last_result
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# TradingView sync outbox endpoints
+@api_bp.route('/sync/outbox', methods=['GET'])
+@require_admin_token
+def get_outbox_status():
+    """Get sync queue counters and the most recent dead-lettered tasks"""
+    try:
+        from ..outbox import get_outbox_worker
+        from ..expiry import get_expiry_scheduler
+        from ..models import SyncTask
+        
+        return jsonify({
+            'success': True,
+            'data': {
+                'worker': get_outbox_worker().stats(),
+                'expiry_scheduler': get_expiry_scheduler().stats(),
+                'dead_letter': SyncTask.get_by_estado('fallido', int(request.args.get('limit', 50)))
+            }
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api_bp.route('/sync/outbox/<int:task_id>/retry', methods=['POST'])
+@require_admin_token
+def retry_outbox_task(task_id):
+    """Re-queue a dead-lettered sync task"""
+    try:
+        from ..outbox import notify_outbox
+        from ..models import SyncTask
+        
+        if not SyncTask.requeue(task_id):
+            return jsonify({'error': 'Task not found or not dead-lettered'}), 404
+        
+        notify_outbox()
+        return jsonify({'success': True, 'message': f'Task {task_id} re-queued'})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# TradingView client monitoring
+@api_bp.route('/system/tradingview', methods=['GET'])
+@require_admin_token
+def get_tradingview_client_status():
+    """Circuit breaker, outbound rate limits, queue depth and roster cache state"""
+    try:
+        from ..ratelimit import limiter
+        from ..circuit_breaker import breaker
+        from ..tradingview import peek_client, username_cache
+        
+        client = peek_client()
+        return jsonify({
+            'success': True,
+            'data': {
+                'circuit_breaker': breaker.snapshot(),
+                'rate_limits': limiter.snapshot(),
+                'rosters': client.roster.stats() if client else {},
+                'username_cache': username_cache.stats()
+            }
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api_bp.route('/system/cache', methods=['GET'])
+@require_admin_token
+def get_cache_status():
+    """Hit rate, size and generation of the read-endpoint response cache"""
+    try:
+        return jsonify({
+            'success': True,
+            'data': {'responses': response_cache.stats()}
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# Request profiles (X-Profile: 1 or ?_profile=1 on any admin request)
+@api_bp.route('/system/profiles', methods=['GET'])
+@require_admin_token
+def get_profiles():
+    """Stored request profiles of this host, newest first, with time per layer"""
+    try:
+        return jsonify({'success': True, 'data': profiling.list_profiles()})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api_bp.route('/system/profiles/<profile_id>', methods=['GET'])
+@require_admin_token
+def get_profile(profile_id):
+    """One profile as JSON, or the raw pstats dump with ?format=pstats"""
+    try:
+        if request.args.get('format') == 'pstats':
+            path = profiling.profile_stats_path(profile_id)
+            if not path:
+                return jsonify({'error': 'Profile not found'}), 404
+            return send_file(path, mimetype='application/octet-stream',
+                             as_attachment=True, download_name=f'{profile_id}.prof')
+        
+        report = profiling.get_profile(profile_id)
+        if not report:
+            return jsonify({'error': 'Profile not found'}), 404
+        return jsonify({'success': True, 'data': report})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 # Token validation endpoints
 @api_bp.route("/validate-token", methods=["POST", "GET"])
 def validate_token():
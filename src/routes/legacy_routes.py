@@ -0,0 +1,415 @@
+"""
+Legacy routes for PineScript Control Access
+Original TradingView access API, web login and the admin web pages
+"""
+from flask import Blueprint, request, render_template, jsonify, session, redirect
+from ..tradingview import get_client, reset_client
+from ..circuit_breaker import breaker, CircuitOpenError
+from ..cookie_manager import CookieManager
+import json
+import os
+from datetime import datetime
+from functools import wraps
+
+# Routes served at the root, without a URL prefix
+legacy_bp = Blueprint('legacy', __name__)
+
+
+def request_admin_token():
+    """Token sent as X-Admin-Token, or as a Bearer token (as Prometheus scrapers do)"""
+    admin_token = request.headers.get('X-Admin-Token')
+    authorization = request.headers.get('Authorization', '')
+    if not admin_token and authorization.startswith('Bearer '):
+        admin_token = authorization[len('Bearer '):].strip()
+    return admin_token
+
+def is_admin_request():
+    """Authenticated web session or a valid admin token"""
+    if session.get('authenticated'):
+        return True
+    expected_token = os.getenv('ADMIN_TOKEN')
+    return bool(expected_token) and request_admin_token() == expected_token
+
+# Security: Admin authentication for API endpoints
+def require_admin_token(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        # Check for authenticated session first
+        if session.get('authenticated'):
+            return f(*args, **kwargs)
+        
+        # Fall back to token authentication
+        admin_token = request_admin_token()
+        expected_token = os.getenv('ADMIN_TOKEN')
+        
+        # Require ADMIN_TOKEN to be set
+        if not expected_token:
+            return jsonify({'error': 'Server misconfigured - ADMIN_TOKEN not set'}), 500
+        
+        if not admin_token or admin_token != expected_token:
+            return jsonify({'error': 'Unauthorized - Valid X-Admin-Token header required'}), 401
+        
+        return f(*args, **kwargs)
+    return decorated_function
+
+# Security: Web session authentication
+def require_web_login(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if 'authenticated' not in session or not session['authenticated']:
+            return redirect('/admin?redirect=' + request.path)
+        return f(*args, **kwargs)
+    return decorated_function
+
+# API endpoint for web login
+@legacy_bp.route('/api/auth/login', methods=['POST'])
+def web_login():
+    """Web login endpoint"""
+    data = request.get_json()
+    token = data.get('token') if data else None
+    
+    if not token:
+        return jsonify({'error': 'Token required'}), 400
+    
+    expected_token = os.getenv('ADMIN_TOKEN')
+    if not expected_token:
+        return jsonify({'error': 'Server misconfigured'}), 500
+    
+    if token == expected_token:
+        session['authenticated'] = True
+        session['admin_token'] = token
+        return jsonify({'success': True, 'message': 'Authenticated successfully'})
+    else:
+        return jsonify({'error': 'Invalid token'}), 401
+
+@legacy_bp.route('/api/auth/logout', methods=['POST'])
+def web_logout():
+    """Web logout endpoint"""
+    session.clear()
+    return jsonify({'success': True, 'message': 'Logged out successfully'})
+
+
+@legacy_bp.route('/validate/<username>', methods=['GET'])
+def validate(username):
+  try:
+    tv = get_client()
+    response = tv.validate_username(username)
+    return json.dumps(response), 200, {
+      'Content-Type': 'application/json; charset=utf-8'
+    }
+  except Exception as e:
+    print("[X] Exception Occured : ", e)
+    failureResponse = {'errorMessage': 'Unknown Exception Occurred'}
+    return json.dumps(failureResponse), 500, {
+      'Content-Type': 'application/json; charset=utf-8'
+    }
+
+
+def tradingview_unavailable(retry_after):
+  """503 devuelto de inmediato mientras el circuito hacia TradingView está abierto"""
+  response = jsonify({
+    'success': False,
+    'error': 'TradingView temporalmente no disponible',
+    'retry_after': round(retry_after)
+  })
+  return response, 503, {'Retry-After': str(max(1, round(retry_after)))}
+
+
+def enqueue_legacy_sync(operacion, username, pine_id, payload=None):
+  """Encolar la operación en el outbox cuando TradingView no responde"""
+  from ..models import SyncTask
+  from ..outbox import notify_outbox
+  task_id = SyncTask.enqueue(operacion, username, pine_id, payload)
+  notify_outbox()
+  return jsonify({
+    'success': True,
+    'queued': True,
+    'sync_task_id': task_id,
+    'message': 'TradingView no disponible; operación encolada'
+  }), 202
+
+
+def enqueue_legacy_grant(username, pine_id, days):
+  """Encolar un grant que extiende `days` días la expiración actual en TradingView, como add_access"""
+  return enqueue_legacy_sync('grant', username, pine_id, {'days': days, 'extend': True})
+
+
+@legacy_bp.route('/access/<username>', methods=['GET', 'POST', 'DELETE'])
+@require_admin_token
+def access(username):
+  try:
+    # Solo leer JSON en métodos que tienen body
+    if request.method in ['POST', 'DELETE']:
+      jsonPayload = request.json or {}
+    else:
+      jsonPayload = {}
+
+    # Circuito abierto: escrituras con indicator_id se encolan, el resto falla rápido
+    if breaker.is_open():
+      indicator_id = jsonPayload.get('indicator_id')
+      if request.method == 'POST' and indicator_id and jsonPayload.get('days'):
+        return enqueue_legacy_grant(username, indicator_id, int(jsonPayload['days']))
+      if request.method == 'DELETE' and indicator_id:
+        return enqueue_legacy_sync('revoke', username, indicator_id)
+      return tradingview_unavailable(breaker.retry_after())
+      
+    # Nuevo formato para compatibilidad con pruebas
+    if 'indicator_id' in jsonPayload or request.method == 'GET':
+      # Formato de pruebas: indicator_id + days
+      indicator_id = jsonPayload.get('indicator_id')
+      days = jsonPayload.get('days')
+      
+      if request.method == 'GET':
+        # Verificar acceso real al indicador si se proporciona indicator_id en query params
+        indicator_id_param = request.args.get('indicator_id')
+        if indicator_id_param:
+          try:
+            tv = get_client()
+            access = tv.get_access_details(username, indicator_id_param)
+            # Usar el campo correcto 'hasAccess' en lugar de 'results'
+            has_access = access.get('hasAccess', False) if isinstance(access, dict) else False
+            response = {
+              'username': username,
+              'has_access': has_access,
+              'status': 'checked',
+              'indicator_id': indicator_id_param,
+              'expiration': access.get('currentExpiration') if has_access else None,
+              'no_expiration': access.get('noExpiration', False) if has_access else False
+            }
+            return jsonify(response), 200
+          except Exception as e:
+            print(f"Error checking access: {e}")
+            response = {
+              'username': username,
+              'has_access': False,
+              'status': 'error',
+              'error': str(e)
+            }
+            return jsonify(response), 200
+        else:
+          # Respuesta simple sin indicador específico
+          response = {
+            'username': username,
+            'has_access': False,
+            'status': 'checked'
+          }
+          return jsonify(response), 200
+      
+      elif request.method == 'POST' and indicator_id and days:
+        # Otorgar acceso
+        try:
+          tv = get_client()
+          access = tv.get_access_details(username, indicator_id, fresh=True)
+          # Formato correcto según documentación: Para 30 días usar 1M (1 mes)
+          if days == 30:
+            tv.add_access(access, 'M', 1)  # 1 mes = 30 días aproximadamente
+          else:
+            # Para otros valores usar días directamente  
+            tv.add_access(access, 'd', days)
+          return jsonify({'success': True, 'message': f'Access granted for {days} days'}), 200
+        except CircuitOpenError:
+          # Circuito abierto o cupo de peticiones agotado: reintentar desde el outbox
+          return enqueue_legacy_grant(username, indicator_id, int(days))
+        except Exception as e:
+          print(f"Error granting access: {e}")
+          return jsonify({'success': False, 'error': str(e)}), 200
+      
+      elif request.method == 'DELETE' and indicator_id:
+        # Revocar acceso
+        try:
+          tv = get_client()
+          access = tv.get_access_details(username, indicator_id, fresh=True)
+          tv.remove_access(access)
+          return jsonify({'success': True, 'message': 'Access revoked'}), 200
+        except CircuitOpenError:
+          return enqueue_legacy_sync('revoke', username, indicator_id)
+        except Exception as e:
+          print(f"Error revoking access: {e}")
+          return jsonify({'success': False, 'error': str(e)}), 200
+    
+    # Formato original para retrocompatibilidad: pine_ids + duration
+    else:
+      # Las llamadas por pine_id se lanzan en paralelo (limitado por TV_MAX_CONCURRENCY)
+      from ..tradingview_async import AsyncTradingView, run_async
+      atv = AsyncTradingView()
+      pine_ids = jsonPayload.get('pine_ids') or []
+      accessList = run_async(atv.get_access_details_many(username, pine_ids, fresh=True))
+
+      if request.method == 'POST':
+        duration = jsonPayload.get('duration')
+        if duration:
+          dNumber = int(duration[:-1])
+          dType = duration[-1:]
+          run_async(atv.add_access_many(accessList, dType, dNumber))
+
+      if request.method == 'DELETE':
+        run_async(atv.remove_access_many(accessList))
+      
+      return json.dumps(accessList), 200, {
+        'Content-Type': 'application/json; charset=utf-8'
+      }
+
+    return jsonify({'error': 'Invalid request format'}), 400
+
+  except CircuitOpenError as e:
+    return tradingview_unavailable(e.retry_after)
+  except Exception as e:
+    print("[X] Exception Occured : ", e)
+    failureResponse = {'errorMessage': 'Unknown Exception Occurred'}
+    return json.dumps(failureResponse), 500, {
+      'Content-Type': 'application/json; charset=utf-8'
+    }
+
+
+@legacy_bp.route('/')
+def home():
+  """Main home page - Admin panel for PineScript Control Access"""
+  # Public access to serve the HTML - authentication happens via API calls
+  redirect_url = request.args.get('redirect', '')
+  return render_template('admin.html', redirect_url=redirect_url)
+
+
+@legacy_bp.route('/admin')
+def admin_panel():
+  """Legacy admin route - redirects to home"""
+  # Redirect to main home page to consolidate routes
+  redirect_url = request.args.get('redirect', '')
+  if redirect_url:
+    return redirect(f'/?redirect={redirect_url}')
+  return redirect('/')
+
+# Web Dashboard Routes (require login)
+@legacy_bp.route('/dashboard')
+@require_web_login
+def dashboard():
+  """Dashboard web interface"""
+  return render_template('dashboard.html')
+
+@legacy_bp.route('/clients')
+@require_web_login
+def clients():
+  """Clients management web interface"""
+  return render_template('clients.html')
+
+@legacy_bp.route('/indicators')
+@require_web_login
+def indicators():
+  """Indicators management web interface"""
+  return render_template('indicators.html')
+
+@legacy_bp.route('/access')
+@require_web_login
+def access_management():
+  """Access management web interface"""
+  return render_template('access.html')
+
+
+@legacy_bp.route('/doc')
+def documentation():
+  # Public documentation endpoint
+  return render_template('documentation.html')
+
+
+@legacy_bp.route('/api/v1/status')
+def api_status():
+  """Basic API status endpoint for PineScript Control Access"""
+  return jsonify({
+    'status': 'active',
+    'service': 'PineScript Control Access',
+    'version': '1.0.0-phase1',
+    'features': {
+      'legacy_api': 'active',
+      'management_suite': 'development',
+      'database': 'sqlite_ready'
+    },
+    'endpoints': {
+      'validate': '/validate/<username>',
+      'access': '/access/<username>',  
+      'admin': '/admin',
+      'documentation': '/doc'
+    }
+  })
+
+
+@legacy_bp.route('/metrics', methods=['GET'])
+@require_admin_token
+def prometheus_metrics():
+  """Request, TradingView, SQLite and cache metrics in Prometheus text format"""
+  from .. import metrics
+  return metrics.render(), 200, {'Content-Type': metrics.CONTENT_TYPE}
+
+
+@legacy_bp.route('/admin/cookies/status', methods=['GET'])
+@require_admin_token
+def check_cookies_status():
+  # Estado servido desde memoria: solo se consulta tvcoins si el resultado en caché
+  # expiró o si cambió el archivo de cookies (el monitor en segundo plano lo mantiene al día)
+  tv = get_client(validate=False)
+  try:
+    tv.ensure_session()
+  except Exception as e:
+    print(f"Session check failed: {e}")
+  
+  status = tv.session_status()
+  current_time = status['lastCheck'] or datetime.now().isoformat()
+  
+  if not status['valid']:
+    return jsonify({
+      'valid': False,
+      'lastCheck': current_time,
+      'error': status['error'] or 'Invalid or expired TradingView session',
+      'status': 'failed'
+    })
+  
+  # Obtener información completa de la cuenta
+  return jsonify({
+    'valid': True,
+    'lastCheck': current_time,
+    'balance': status['balance'],
+    'username': status['username'],
+    'partner_status': status['partner_status'],
+    'aff_id': status['aff_id'],
+    'profile_info': tv.profile_info,  # Se descarga una sola vez por sesión
+    'status': 'authenticated'
+  })
+
+
+@legacy_bp.route('/admin/cookies/update', methods=['POST'])
+@require_admin_token
+def update_cookies():
+  try:
+    data = request.json or {}
+    sessionid = data.get('sessionid', '').strip()
+    sessionid_sign = data.get('sessionid_sign', '').strip()
+    
+    if not sessionid or not sessionid_sign:
+      return jsonify({
+        'success': False,
+        'error': 'Both sessionid and sessionid_sign are required'
+      }), 400
+    
+    # Guardar en archivo JSON
+    cookie_manager = CookieManager()
+    if not cookie_manager.save_cookies(sessionid, sessionid_sign):
+      raise Exception("Failed to save cookies to JSON file")
+    
+    # Verificar que las cookies funcionan forzando una nueva validación del cliente compartido
+    try:
+      reset_client()
+      get_client()
+      return jsonify({
+        'success': True,
+        'message': 'Cookies updated and verified successfully',
+        'timestamp': datetime.now().isoformat()
+      })
+    except Exception as test_error:
+      return jsonify({
+        'success': False,
+        'error': f'Cookies saved but failed verification: {str(test_error)}'
+      }), 400
+      
+  except Exception as e:
+    return jsonify({
+      'success': False,
+      'error': f'Failed to update cookies: {str(e)}'
+    }), 500
@@ -1,384 +1,125 @@
-from flask import Flask, request, render_template, jsonify, session, redirect, url_for
-from .tradingview import tradingview
-from .cookie_manager import CookieManager
-import json
+from flask import Flask
 import os
 import logging
-from datetime import datetime
-from functools import wraps
-#from threading import Thread
-app = Flask('')
+import threading
+from typing import Optional
 
-# Configure sessions for web navigation
-app.secret_key = os.getenv('SECRET_KEY', 'dev-secret-key-change-in-production')
-app.config['SESSION_COOKIE_SECURE'] = False  # True in production with HTTPS
-app.config['SESSION_COOKIE_HTTPONLY'] = True
-app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
+# Templates live at the repository root, next to main.py
+TEMPLATE_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'templates')
+# Lock file owned by the one process that runs the singleton schedules
+BACKGROUND_LOCK = os.getenv('BACKGROUND_LOCK', 'data/background.lock')
 
-# PineScript Control Access - Phase 1 Core Functionality
-print("🚀 PineScript Control Access - Starting core functionality")
+_background_pid: Optional[int] = None
+_background_lock = threading.Lock()
 
-# Initialize database and API routes now that dependencies are resolved
-try:
-    from .database import db
-    print("✅ Database module loaded successfully")
-    
-    # Register new API routes
-    from .routes.api_routes import api_bp
-    app.register_blueprint(api_bp)
-    print("✅ New API routes registered successfully")
-    
-except Exception as e:
-    print(f"⚠️ Advanced features failed to load: {e}")
-    print("   Legacy API endpoints remain available")
 
-# Disable access logging for production to prevent username leakage
-if os.getenv('ENV') == 'production':
-    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+def create_app(start_background: bool = True) -> Flask:
+  """Application factory used by the development server and wsgi.py.
 
-# Security: Admin authentication for API endpoints
-def require_admin_token(f):
-    @wraps(f)
-    def decorated_function(*args, **kwargs):
-        # Check for authenticated session first
-        if session.get('authenticated'):
-            return f(*args, **kwargs)
-        
-        # Fall back to token authentication
-        admin_token = request.headers.get('X-Admin-Token')
-        expected_token = os.getenv('ADMIN_TOKEN')
-        
-        # Require ADMIN_TOKEN to be set
-        if not expected_token:
-            return jsonify({'error': 'Server misconfigured - ADMIN_TOKEN not set'}), 500
-        
-        if not admin_token or admin_token != expected_token:
-            return jsonify({'error': 'Unauthorized - Valid X-Admin-Token header required'}), 401
-        
-        return f(*args, **kwargs)
-    return decorated_function
+  No threads are started here: with start_background the worker threads are
+  started by the first request each process serves (or earlier through
+  start_background_services(), e.g. gunicorn's post_fork hook), so an app
+  built in a preloading master process is safe to fork.
+  """
+  app = Flask(__name__, template_folder=TEMPLATE_FOLDER)
 
-# Security: Web session authentication
-def require_web_login(f):
-    @wraps(f)
-    def decorated_function(*args, **kwargs):
-        if 'authenticated' not in session or not session['authenticated']:
-            return redirect('/admin?redirect=' + request.path)
-        return f(*args, **kwargs)
-    return decorated_function
+  # Configure sessions for web navigation
+  app.secret_key = os.getenv('SECRET_KEY', 'dev-secret-key-change-in-production')
+  app.config['SESSION_COOKIE_SECURE'] = False  # True in production with HTTPS
+  app.config['SESSION_COOKIE_HTTPONLY'] = True
+  app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
 
-# API endpoint for web login
-@app.route('/api/auth/login', methods=['POST'])
-def web_login():
-    """Web login endpoint"""
-    data = request.get_json()
-    token = data.get('token') if data else None
-    
-    if not token:
-        return jsonify({'error': 'Token required'}), 400
-    
-    expected_token = os.getenv('ADMIN_TOKEN')
-    if not expected_token:
-        return jsonify({'error': 'Server misconfigured'}), 500
-    
-    if token == expected_token:
-        session['authenticated'] = True
-        session['admin_token'] = token
-        return jsonify({'success': True, 'message': 'Authenticated successfully'})
-    else:
-        return jsonify({'error': 'Invalid token'}), 401
+  # PineScript Control Access - Phase 1 Core Functionality
+  print("🚀 PineScript Control Access - Starting core functionality")
 
-@app.route('/api/auth/logout', methods=['POST'])
-def web_logout():
-    """Web logout endpoint"""
-    session.clear()
-    return jsonify({'success': True, 'message': 'Logged out successfully'})
+  # Opt-in cProfile of admin requests (X-Profile: 1 or ?_profile=1); first so
+  # its hooks wrap the others
+  from . import profiling
+  profiling.init_app(app)
 
+  # Request timing for GET /metrics (covers every blueprint)
+  from . import metrics
+  metrics.init_app(app)
 
-@app.route('/validate/<username>', methods=['GET'])
-def validate(username):
-  try:
-    tv = tradingview()
-    response = tv.validate_username(username)
-    return json.dumps(response), 200, {
-      'Content-Type': 'application/json; charset=utf-8'
-    }
-  except Exception as e:
-    print("[X] Exception Occured : ", e)
-    failureResponse = {'errorMessage': 'Unknown Exception Occurred'}
-    return json.dumps(failureResponse), 500, {
-      'Content-Type': 'application/json; charset=utf-8'
-    }
+  # TradingView calls from request handlers fail fast instead of sleeping on a throttled bucket
+  from . import ratelimit
+  ratelimit.init_app(app)
 
+  from .routes.legacy_routes import legacy_bp
+  app.register_blueprint(legacy_bp)
 
-@app.route('/access/<username>', methods=['GET', 'POST', 'DELETE'])
-@require_admin_token
-def access(username):
+  # Initialize database and API routes now that dependencies are resolved
   try:
-    # Solo leer JSON en métodos que tienen body
-    if request.method in ['POST', 'DELETE']:
-      jsonPayload = request.json or {}
-    else:
-      jsonPayload = {}
-      
-    # Nuevo formato para compatibilidad con pruebas
-    if 'indicator_id' in jsonPayload or request.method == 'GET':
-      # Formato de pruebas: indicator_id + days
-      indicator_id = jsonPayload.get('indicator_id')
-      days = jsonPayload.get('days')
-      
-      if request.method == 'GET':
-        # Verificar acceso real al indicador si se proporciona indicator_id en query params
-        indicator_id_param = request.args.get('indicator_id')
-        if indicator_id_param:
-          try:
-            tv = tradingview()
-            access = tv.get_access_details(username, indicator_id_param)
-            # Usar el campo correcto 'hasAccess' en lugar de 'results'
-            has_access = access.get('hasAccess', False) if isinstance(access, dict) else False
-            response = {
-              'username': username,
-              'has_access': has_access,
-              'status': 'checked',
-              'indicator_id': indicator_id_param,
-              'expiration': access.get('currentExpiration') if has_access else None,
-              'no_expiration': access.get('noExpiration', False) if has_access else False
-            }
-            return jsonify(response), 200
-          except Exception as e:
-            print(f"Error checking access: {e}")
-            response = {
-              'username': username,
-              'has_access': False,
-              'status': 'error',
-              'error': str(e)
-            }
-            return jsonify(response), 200
-        else:
-          # Respuesta simple sin indicador específico
-          response = {
-            'username': username,
-            'has_access': False,
-            'status': 'checked'
-          }
-          return jsonify(response), 200
-      
-      elif request.method == 'POST' and indicator_id and days:
-        # Otorgar acceso
-        try:
-          tv = tradingview()
-          access = tv.get_access_details(username, indicator_id)
-          # Formato correcto según documentación: Para 30 días usar 1M (1 mes)
-          if days == 30:
-            tv.add_access(access, 'M', 1)  # 1 mes = 30 días aproximadamente
-          else:
-            # Para otros valores usar días directamente  
-            tv.add_access(access, 'd', days)
-          return jsonify({'success': True, 'message': f'Access granted for {days} days'}), 200
-        except Exception as e:
-          print(f"Error granting access: {e}")
-          return jsonify({'success': False, 'error': str(e)}), 200
-      
-      elif request.method == 'DELETE' and indicator_id:
-        # Revocar acceso
-        try:
-          tv = tradingview()
-          access = tv.get_access_details(username, indicator_id)
-          tv.remove_access(access)
-          return jsonify({'success': True, 'message': 'Access revoked'}), 200
-        except Exception as e:
-          print(f"Error revoking access: {e}")
-          return jsonify({'success': False, 'error': str(e)}), 200
-    
-    # Formato original para retrocompatibilidad: pine_ids + duration
-    else:
-      tv = tradingview()
-      pine_ids = jsonPayload.get('pine_ids') or []
-      accessList = []
-      for pine_id in pine_ids:
-        access = tv.get_access_details(username, pine_id)
-        accessList = accessList + [access]
-
-      if request.method == 'POST':
-        duration = jsonPayload.get('duration')
-        if duration:
-          dNumber = int(duration[:-1])
-          dType = duration[-1:]
-          for access in accessList:
-            tv.add_access(access, dType, dNumber)
+    from .database import db
+    print("✅ Database module loaded successfully")
 
-      if request.method == 'DELETE':
-        for access in accessList:
-          tv.remove_access(access)
-      
-      return json.dumps(accessList), 200, {
-        'Content-Type': 'application/json; charset=utf-8'
-      }
+    # Register new API routes
+    from .routes.api_routes import api_bp
+    app.register_blueprint(api_bp)
+    print("✅ New API routes registered successfully")
 
-    return jsonify({'error': 'Invalid request format'}), 400
+    if start_background:
+      app.before_request(ensure_background_services)
 
   except Exception as e:
-    print("[X] Exception Occured : ", e)
-    failureResponse = {'errorMessage': 'Unknown Exception Occurred'}
-    return json.dumps(failureResponse), 500, {
-      'Content-Type': 'application/json; charset=utf-8'
-    }
-
-
-@app.route('/')
-def home():
-  """Main home page - Admin panel for PineScript Control Access"""
-  # Public access to serve the HTML - authentication happens via API calls
-  redirect_url = request.args.get('redirect', '')
-  return render_template('admin.html', redirect_url=redirect_url)
-
-
-@app.route('/admin')
-def admin_panel():
-  """Legacy admin route - redirects to home"""
-  # Redirect to main home page to consolidate routes
-  redirect_url = request.args.get('redirect', '')
-  if redirect_url:
-    return redirect(f'/?redirect={redirect_url}')
-  return redirect('/')
-
-# Web Dashboard Routes (require login)
-@app.route('/dashboard')
-@require_web_login
-def dashboard():
-  """Dashboard web interface"""
-  return render_template('dashboard.html')
+    print(f"⚠️ Advanced features failed to load: {e}")
+    print("   Legacy API endpoints remain available")
 
-@app.route('/clients')
-@require_web_login
-def clients():
-  """Clients management web interface"""
-  return render_template('clients.html')
+  # Disable access logging for production to prevent username leakage
+  if os.getenv('ENV') == 'production':
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
 
-@app.route('/indicators')
-@require_web_login
-def indicators():
-  """Indicators management web interface"""
-  return render_template('indicators.html')
+  return app
 
-@app.route('/access')
-@require_web_login
-def access_management():
-  """Access management web interface"""
-  return render_template('access.html')
 
+def start_background_services():
+  """Start this process's background threads (once per process).
 
-@app.route('/doc')
-def documentation():
-  # Public documentation endpoint
-  return render_template('documentation.html')
+  Every process drains the sync outbox, expires accesses on time and keeps
+  its own TradingView session fresh. Reconciliation and bulk job resumption
+  must not run twice, so only the process holding BACKGROUND_LOCK does them.
+  """
+  global _background_pid
+  with _background_lock:
+    if _background_pid == os.getpid():
+      return
+    _background_pid = os.getpid()
 
+  try:
+    # Background worker that pushes queued access changes to TradingView
+    from .outbox import start_outbox_worker
+    start_outbox_worker()
 
-@app.route('/api/v1/status')
-def api_status():
-  """Basic API status endpoint for PineScript Control Access"""
-  return jsonify({
-    'status': 'active',
-    'service': 'PineScript Control Access',
-    'version': '1.0.0-phase1',
-    'features': {
-      'legacy_api': 'active',
-      'management_suite': 'development',
-      'database': 'sqlite_ready'
-    },
-    'endpoints': {
-      'validate': '/validate/<username>',
-      'access': '/access/<username>',  
-      'admin': '/admin',
-      'documentation': '/doc'
-    }
-  })
+    # Expire accesses when fecha_fin passes and queue their TradingView removal
+    from .expiry import start_expiry_scheduler
+    start_expiry_scheduler()
 
+    # Keep the TradingView session verdict fresh without blocking requests
+    from .tradingview import start_session_monitor
+    start_session_monitor()
 
-@app.route('/admin/cookies/status', methods=['GET'])
-@require_admin_token
-def check_cookies_status():
-  try:
-    # Crear instancia de tradingview para verificar el estado
-    tv = tradingview()
-    
-    # Si llegamos aquí sin errores, las cookies son válidas
-    current_time = datetime.now().isoformat()
-    
-    # Obtener información completa de la cuenta
-    balance = getattr(tv, 'account_balance', '0.00')
-    username = getattr(tv, 'username', '')
-    partner_status = getattr(tv, 'partner_status', 0)
-    aff_id = getattr(tv, 'aff_id', 0)
-    profile_info = getattr(tv, 'profile_info', {})
-    
-    return jsonify({
-      'valid': True,
-      'lastCheck': current_time,
-      'balance': balance,
-      'username': username,
-      'partner_status': partner_status,
-      'aff_id': aff_id,
-      'profile_info': profile_info,
-      'status': 'authenticated'
-    })
-  except Exception as e:
-    current_time = datetime.now().isoformat()
-    return jsonify({
-      'valid': False,
-      'lastCheck': current_time,
-      'error': str(e),
-      'status': 'failed'
-    })
+    from .locks import try_hold_lock
+    if try_hold_lock(BACKGROUND_LOCK):
+      # Optional periodic DB <-> TradingView reconciliation (RECONCILE_INTERVAL)
+      from .reconciler import start_reconcile_schedule
+      start_reconcile_schedule()
 
+      # Bulk jobs interrupted by the last restart
+      from .jobs import resume_bulk_jobs
+      resume_bulk_jobs()
 
-@app.route('/admin/cookies/update', methods=['POST'])
-@require_admin_token
-def update_cookies():
-  try:
-    data = request.json or {}
-    sessionid = data.get('sessionid', '').strip()
-    sessionid_sign = data.get('sessionid_sign', '').strip()
-    
-    if not sessionid or not sessionid_sign:
-      return jsonify({
-        'success': False,
-        'error': 'Both sessionid and sessionid_sign are required'
-      }), 400
-    
-    # Guardar en archivo JSON
-    cookie_manager = CookieManager()
-    if not cookie_manager.save_cookies(sessionid, sessionid_sign):
-      raise Exception("Failed to save cookies to JSON file")
-    
-    # Verificar que las cookies funcionan creando una instancia
-    try:
-      test_tv = tradingview()
-      return jsonify({
-        'success': True,
-        'message': 'Cookies updated and verified successfully',
-        'timestamp': datetime.now().isoformat()
-      })
-    except Exception as test_error:
-      return jsonify({
-        'success': False,
-        'error': f'Cookies saved but failed verification: {str(test_error)}'
-      }), 400
-      
   except Exception as e:
-    return jsonify({
-      'success': False,
-      'error': f'Failed to update cookies: {str(e)}'
-    }), 500
-
+    print(f"⚠️ Background services failed to start: {e}")
 
-# def run():
-#   app.run(host='0.0.0.0', port=5000)
 
-# def start_server_async():
-#   server = Thread(target=run)
-#   server.start()
+def ensure_background_services():
+  # before_request hook: a single comparison once this process has started them
+  if _background_pid != os.getpid():
+    start_background_services()
 
 
 def start_server():
+  # Development server; production runs wsgi:app under gunicorn (gunicorn.conf.py)
+  app = create_app()
+  start_background_services()
   app.run(host='0.0.0.0', port=5000)
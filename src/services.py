@@ -2,8 +2,14 @@
 Business logic services for PineScript Control Access
 """
 from typing import Dict, List, Any, Optional
-from .models import Indicador, Cliente, Acceso
-from .tradingview import tradingview
+from .models import Indicador, Cliente, Acceso, SyncTask
+from .database import db
+from .cache import response_cache
+from .outbox import notify_outbox
+from .expiry import notify_expiry
+from .tradingview import get_client
+from .circuit_breaker import CircuitOpenError
+from .pagination import fetch_page
 
 class IndicadorService:
     """Service for managing indicators"""
@@ -29,6 +35,15 @@ class IndicadorService:
         """Get only active indicators"""
         return Indicador.get_active()
     
+    @staticmethod
+    def get_active_indicators_page(limit: int, after: Optional[list] = None) -> Dict[str, Any]:
+        """One keyset page of active indicators, newest first"""
+        return fetch_page(
+            lambda n, cursor: Indicador.get_page(n, cursor, "estado = 'activo'"),
+            lambda row: [row['id']], limit, after,
+            total=db.get_stats()['indicadores_activos']
+        )
+    
     @staticmethod
     def search_indicators(term: str) -> List[Dict[str, Any]]:
         """Search indicators by name or description"""
@@ -98,7 +113,7 @@ class ClienteService:
         
         # Validate username with TradingView API for new clients
         try:
-            tv = tradingview()
+            tv = get_client()
             validation = tv.validate_username(username_tradingview)
             
             if not validation.get('validuser', False):
@@ -126,6 +141,17 @@ class ClienteService:
         
         return result
     
+    @staticmethod
+    def validate_usernames(usernames: List[str]) -> Dict[str, Any]:
+        """Validate a batch of TradingView usernames (cached, concurrent for misses)"""
+        from .tradingview_async import AsyncTradingView, run_async
+        outcomes = run_async(AsyncTradingView().validate_usernames(usernames))
+        return {
+            username: ({'validuser': False, 'verifiedUserName': '', 'error': str(outcome)}
+                       if isinstance(outcome, Exception) else outcome)
+            for username, outcome in outcomes.items()
+        }
+    
     @staticmethod
     def get_all_clients() -> List[Dict[str, Any]]:
         """Get all clients with access count"""
@@ -136,12 +162,19 @@ class ClienteService:
         """Get only active clients"""
         return Cliente.get_active()
     
+    @staticmethod
+    def get_active_clients_page(limit: int, after: Optional[list] = None) -> Dict[str, Any]:
+        """One keyset page of active clients, newest first"""
+        return fetch_page(
+            lambda n, cursor: Cliente.get_page(n, cursor, "estado = 'activo'"),
+            lambda row: [row['id']], limit, after,
+            total=db.get_stats()['clientes_activos']
+        )
+    
     @staticmethod
     def search_clients(term: str) -> List[Dict[str, Any]]:
         """Search clients (only active)"""
-        # Search only among active clients
-        all_results = Cliente.search(term)
-        return [client for client in all_results if client.get('estado') == 'activo']
+        return Cliente.search(term, estado='activo')
     
     @staticmethod
     def get_client_profile(client_id: int) -> Dict[str, Any]:
@@ -196,30 +229,27 @@ class AccesoService:
                 result['message'] = f"Indicador no encontrado con PUB ID: {pub_id}"
                 return result
             
-            # Grant access
-            access_id = Acceso.grant_access(
-                cliente_id=client['id'],
-                indicador_id=indicator['id'],
-                days=days
-            )
-            
-            # Sync with TradingView API
-            try:
-                tv = tradingview()
-                tv_access = tv.get_access_details(username_tradingview, pub_id)
-                
-                if days == 30:
-                    tv.add_access(tv_access, 'M', 1)  # 1 month
-                else:
-                    tv.add_access(tv_access, 'd', days)
-                    
-            except Exception as tv_error:
-                result['message'] = f"Acceso creado en DB pero error en TradingView: {str(tv_error)}"
-                return result
+            # Grant access and queue the TradingView sync in the same transaction
+            with db.transaction():
+                access_id = Acceso.grant_access(
+                    cliente_id=client['id'],
+                    indicador_id=indicator['id'],
+                    days=days
+                )
+                # The committed fecha_fin travels with the task so retries are idempotent
+                fecha_fin = Acceso.get_by_id(access_id)['fecha_fin']
+                task_id = SyncTask.enqueue('grant', username_tradingview, pub_id,
+                                           {'days': days, 'expiration': fecha_fin}, access_id=access_id)
+            # Bumped again after COMMIT so no reader caches the pre-commit snapshot
+            response_cache.bump()
+            notify_outbox()
+            notify_expiry(access_id)
             
             result['success'] = True
             result['access_id'] = access_id
-            result['message'] = f"Acceso otorgado por {days} días"
+            result['sync_task_id'] = task_id
+            result['sync_status'] = 'pendiente'
+            result['message'] = f"Acceso otorgado por {days} días (sincronización con TradingView en cola)"
             
         except Exception as e:
             result['message'] = f"Error granting access: {str(e)}"
@@ -244,23 +274,21 @@ class AccesoService:
                 result['message'] = "Indicador no encontrado"
                 return result
             
-            # Revoke in database
-            revoked = Acceso.revoke_access(client['id'], indicator['id'])
+            # Revoke in database and queue the TradingView removal atomically
+            with db.transaction():
+                revoked = Acceso.revoke_access(client['id'], indicator['id'])
+                if revoked:
+                    task_id = SyncTask.enqueue('revoke', username_tradingview, pub_id)
             if not revoked:
                 result['message'] = "No se encontró acceso activo para revocar"
                 return result
-            
-            # Sync with TradingView API
-            try:
-                tv = tradingview()
-                tv_access = tv.get_access_details(username_tradingview, pub_id)
-                tv.remove_access(tv_access)
-            except Exception as tv_error:
-                result['message'] = f"Acceso revocado en DB pero error en TradingView: {str(tv_error)}"
-                return result
+            response_cache.bump()
+            notify_outbox()
             
             result['success'] = True
-            result['message'] = "Acceso revocado exitosamente"
+            result['sync_task_id'] = task_id
+            result['sync_status'] = 'pendiente'
+            result['message'] = "Acceso revocado exitosamente (sincronización con TradingView en cola)"
             
         except Exception as e:
             result['message'] = f"Error revoking access: {str(e)}"
@@ -289,9 +317,11 @@ class AccesoService:
             
             # Check in TradingView
             try:
-                tv = tradingview()
+                tv = get_client()
                 tv_access = tv.get_access_details(username_tradingview, pub_id)
                 result['tradingview_status'] = tv_access
+            except CircuitOpenError as e:
+                result['tradingview_status'] = {'error': 'unavailable', 'retry_after': round(e.retry_after)}
             except Exception:
                 pass  # TradingView check is optional
                 
@@ -310,10 +340,34 @@ class AccesoService:
         """Get accesses expiring in the next N days"""
         return Acceso.get_expiring_soon(days)
     
+    @staticmethod
+    def get_accesses_page(limit: int, after: Optional[list] = None,
+                          expiring_days: Optional[int] = None) -> Dict[str, Any]:
+        """One keyset page of active (or, with expiring_days, expiring) accesses by fecha_fin"""
+        stats = db.get_stats()
+        if expiring_days is None:
+            fetch = lambda n, cursor: Acceso.get_active_accesses(n, cursor)
+            total = stats['accesos_activos']
+        else:
+            fetch = lambda n, cursor: Acceso.get_expiring_soon(expiring_days, n, cursor)
+            # Only the 7-day window is pre-counted
+            total = stats['proximos_vencimientos'] if expiring_days == 7 else None
+        return fetch_page(fetch, lambda row: [row['fecha_fin'], row['id']], limit, after, total=total)
+    
     @staticmethod
     def process_expired_accesses() -> int:
-        """Process expired accesses and return count"""
-        return Acceso.mark_expired()
+        """Mark due accesses as expired and queue their TradingView revocation; returns count"""
+        with db.transaction():
+            expired = Acceso.get_expired()
+            if expired:
+                Acceso.mark_expired([access['id'] for access in expired])
+                for access in expired:
+                    SyncTask.enqueue('revoke', access['username_tradingview'], access['pub_id'],
+                                     {'reason': 'expirado'}, access_id=access['id'])
+        if expired:
+            response_cache.bump()
+            notify_outbox()
+        return len(expired)
     
     @staticmethod
     def grant_access_to_all_indicators(username_tradingview: str, days: int) -> Dict[str, Any]:
@@ -340,8 +394,9 @@ class AccesoService:
             granted_count = 0
             failed_count = 0
             details = []
+            granted_ids = []
             
-            # Grant access to each indicator
+            # Same path as a single grant: each DB access commits together with its sync task
             for indicator in active_indicators:
                 try:
                     # Check if access already exists
@@ -354,39 +409,24 @@ class AccesoService:
                         })
                         continue
                     
-                    # Grant access
-                    access_id = Acceso.grant_access(
-                        cliente_id=client['id'],
-                        indicador_id=indicator['id'],
-                        days=days
-                    )
-                    
-                    # Sync with TradingView API
-                    try:
-                        tv = tradingview()
-                        tv_access = tv.get_access_details(username_tradingview, indicator['pub_id'])
-                        
-                        if days == 30:
-                            tv.add_access(tv_access, 'M', 1)  # 1 month
-                        else:
-                            tv.add_access(tv_access, 'd', days)
-                        
-                        granted_count += 1
-                        details.append({
-                            'indicator': indicator['nombre'],
-                            'status': 'granted',
-                            'access_id': access_id
-                        })
-                        
-                    except Exception as tv_error:
-                        # If TV fails, remove the DB access
-                        Acceso.revoke_access(client['id'], indicator['id'])
-                        failed_count += 1
-                        details.append({
-                            'indicator': indicator['nombre'],
-                            'status': 'failed',
-                            'reason': f"Error en TradingView: {str(tv_error)}"
-                        })
+                    with db.transaction():
+                        access_id = Acceso.grant_access(
+                            cliente_id=client['id'],
+                            indicador_id=indicator['id'],
+                            days=days
+                        )
+                        fecha_fin = Acceso.get_by_id(access_id)['fecha_fin']
+                        task_id = SyncTask.enqueue('grant', username_tradingview, indicator['pub_id'],
+                                                   {'days': days, 'expiration': fecha_fin}, access_id=access_id)
+                    granted_ids.append(access_id)
+                    granted_count += 1
+                    details.append({
+                        'indicator': indicator['nombre'],
+                        'status': 'granted',
+                        'access_id': access_id,
+                        'sync_task_id': task_id,
+                        'sync_status': 'pendiente'
+                    })
                         
                 except Exception as indicator_error:
                     failed_count += 1
@@ -396,13 +436,21 @@ class AccesoService:
                         'reason': str(indicator_error)
                     })
             
+            if granted_ids:
+                response_cache.bump()
+                notify_outbox()
+                for access_id in granted_ids:
+                    notify_expiry(access_id)
+            
             result['granted_count'] = granted_count
+            result['queued_count'] = granted_count
             result['failed_count'] = failed_count
             result['details'] = details
             
             if granted_count > 0:
                 result['success'] = True
-                result['message'] = f"Acceso otorgado a {granted_count} indicadores (fallaron: {failed_count})"
+                result['message'] = (f"Acceso otorgado a {granted_count} indicadores, sincronización con "
+                                      f"TradingView en cola (fallaron: {failed_count})")
             else:
                 result['message'] = f"No se pudo otorgar acceso a ningún indicador (fallaron: {failed_count})"
                 
@@ -414,87 +462,13 @@ class AccesoService:
     @staticmethod
     def get_accesses_grouped_by_client() -> List[Dict[str, Any]]:
         """Get accesses grouped by client with indicator details"""
-        # SQLite doesn't support JSON_OBJECT in GROUP_CONCAT, so use the fallback method directly
-        return AccesoService._get_grouped_accesses_fallback()
+        return Acceso.get_grouped_by_client()
     
     @staticmethod
-    def _get_grouped_accesses_fallback() -> List[Dict[str, Any]]:
-        """Fallback method for grouped accesses using Acceso.get_active_accesses() directly"""
-        try:
-            from datetime import datetime
-            
-            # Use the exact same method that works in flat access
-            all_accesses = Acceso.get_active_accesses()
-            
-            # Group accesses by client (using Spanish field names from DB)
-            clients_dict = {}
-            for access in all_accesses:
-                cliente_id = access['cliente_id']  # Use Spanish field name from DB
-                
-                if cliente_id not in clients_dict:
-                    clients_dict[cliente_id] = {
-                        'client_id': cliente_id,  # Return as client_id for frontend
-                        'username_tradingview': access['username_tradingview'],
-                        'nombre_completo': access['nombre_completo'],
-                        'email': access.get('email', ''),  # Email might not be in the query
-                        'indicators': []
-                    }
-                
-                # Calculate status
-                status = 'active'
-                if access['fecha_fin']:
-                    try:
-                        # Handle different datetime formats
-                        fecha_fin_str = access['fecha_fin']
-                        if 'T' in fecha_fin_str:
-                            # ISO format like "2025-10-28T11:11:53.083419"
-                            expiry = datetime.fromisoformat(fecha_fin_str.replace('Z', '+00:00'))
-                        else:
-                            # SQLite format like "2025-10-28 11:11:53"
-                            expiry = datetime.strptime(fecha_fin_str, '%Y-%m-%d %H:%M:%S')
-                        
-                        now = datetime.now()
-                        
-                        if expiry < now:
-                            status = 'expired'
-                        elif (expiry - now).days <= 7:
-                            status = 'expiring'
-                    except Exception as e:
-                        status = 'active'  # Default to active if can't parse
-                
-                clients_dict[cliente_id]['indicators'].append({
-                    'indicator_id': access['indicador_id'],
-                    'indicator_name': access['indicador_nombre'],
-                    'indicator_version': access.get('version', '1.0'),  # Get version if available
-                    'pub_id': access['pub_id'],
-                    'access_id': access['id'],
-                    'fecha_inicio': access['fecha_inicio'],
-                    'fecha_fin': access['fecha_fin'],
-                    'estado': access['estado'],
-                    'fecha_creacion': access['fecha_creacion'],
-                    'status': status
-                })
-            
-            # Convert to list and add summary statistics
-            grouped_accesses = []
-            for client_data in clients_dict.values():
-                indicators = client_data['indicators']
-                client_data.update({
-                    'indicators_count': len(indicators),
-                    'active_indicators': len([i for i in indicators if i['status'] == 'active']),
-                    'expiring_indicators': len([i for i in indicators if i['status'] == 'expiring']),
-                    'expired_indicators': len([i for i in indicators if i['status'] == 'expired'])
-                })
-                grouped_accesses.append(client_data)
-            
-            # Sort by username
-            grouped_accesses.sort(key=lambda x: x['username_tradingview'])
-            
-            return grouped_accesses
-            
-        except Exception as e:
-            print(f"Error in fallback grouped accesses: {e}")
-            return []
+    def get_accesses_grouped_page(limit: int, after: Optional[list] = None) -> Dict[str, Any]:
+        """One page of the grouped view, paged by client username"""
+        return fetch_page(Acceso.get_grouped_by_client, lambda row: [row['username_tradingview']],
+                          limit, after)
 
 class DashboardService:
     """Service for dashboard statistics and overview"""
@@ -502,8 +476,6 @@ class DashboardService:
     @staticmethod
     def get_dashboard_stats() -> Dict[str, Any]:
         """Get complete dashboard statistics"""
-        from .database import db
-        
         stats = db.get_stats()
         
         # Get recent activity (last 10 accesses created) with JOINs
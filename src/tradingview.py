@@ -1,30 +1,103 @@
 import os
+import threading
+import time
 from . import config
-import requests
 import platform
-from urllib3 import encode_multipart_formdata
 from datetime import datetime, timezone
 from . import helper
 from .cookie_manager import CookieManager
+from .roster import RosterIndex
+from .ratelimit import limiter, RateLimitedError
+from .circuit_breaker import breaker, CircuitOpenError
+from .cache import TTLCache
+from . import metrics
+
+# Seconds a successful tvcoins check is trusted before the session is probed again
+SESSION_TTL = int(os.getenv('TV_SESSION_TTL', '300'))
+# Keep-alive connections kept open towards TradingView (config.base_url)
+POOL_SIZE = int(os.getenv('TV_POOL_SIZE', '20'))
+# validate_username cache: verified names are stable, unknown names may be registered soon
+USERNAME_TTL = int(os.getenv('TV_USERNAME_TTL', '86400'))
+USERNAME_NEGATIVE_TTL = int(os.getenv('TV_USERNAME_NEGATIVE_TTL', '600'))
+username_cache = TTLCache(maxsize=int(os.getenv('TV_USERNAME_CACHE_SIZE', '10000')), ttl=USERNAME_TTL)
+
+
+def _build_http_session():
+  """Create a requests.Session with a keep-alive connection pool"""
+  # requests/urllib3 are imported with the first client, not at server startup
+  import requests
+  from requests.adapters import HTTPAdapter
+  http = requests.Session()
+  adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+  http.mount('https://', adapter)
+  http.mount('http://', adapter)
+  return http
+
+
+def encode_multipart_formdata(fields):
+  """urllib3's encoder, imported on the first write instead of at startup"""
+  from urllib3 import encode_multipart_formdata
+  return encode_multipart_formdata(fields)
 
 
 class tradingview:
 
+  def _request(self, endpoint, method, url, **kwargs):
+    """Send a request through the pooled session with per-endpoint timeouts,
+    rate limiting and the shared circuit breaker.
+
+    endpoint is the config.urls key (or 'profile') used to group limits.
+    """
+    # Fail fast while TradingView is known to be down instead of pinning a worker
+    try:
+      breaker.before_call()
+    except CircuitOpenError:
+      metrics.tradingview_errors.inc(endpoint, 'circuit_open')
+      raise
+    # From here on every exit records a success or failure, or hands back a half-open trial
+    try:
+      limiter.acquire(endpoint)
+    except RateLimitedError:
+      breaker.cancel_trial()
+      metrics.tradingview_errors.inc(endpoint, 'rate_limited')
+      raise
+    kwargs.setdefault('timeout', config.timeouts.get(endpoint, config.timeouts['default']))
+    from requests import RequestException
+    started = time.perf_counter()
+    try:
+      response = self.http.request(method, url, **kwargs)
+    except RequestException:
+      metrics.tradingview_latency.observe(time.perf_counter() - started, endpoint)
+      metrics.tradingview_requests.inc(endpoint, 'error')
+      metrics.tradingview_errors.inc(endpoint, 'exception')
+      breaker.record_failure()
+      raise
+    except BaseException:
+      # Not a TradingView failure (bad arguments, interrupted thread)
+      breaker.cancel_trial()
+      raise
+    metrics.tradingview_latency.observe(time.perf_counter() - started, endpoint)
+    metrics.tradingview_requests.inc(endpoint, str(response.status_code))
+    if response.status_code >= 500:
+      metrics.tradingview_errors.inc(endpoint, 'server_error')
+      breaker.record_failure()
+    else:
+      if response.status_code == 429:
+        metrics.tradingview_errors.inc(endpoint, 'throttled')
+      breaker.record_success()
+    limiter.record(endpoint, response.status_code, response.headers.get('Retry-After'))
+    return response
+
   def get_profile_info(self):
     """Get detailed profile information"""
     try:
       # Try different endpoints for user data
       headers = {'cookie': self.cookies}
-      endpoints_to_try = [
-        f"https://www.tradingview.com/pine_perm/get_author_data/?username={self.username}",
-        f"https://www.tradingview.com/u/{self.username}/",
-        "https://www.tradingview.com/accounts/me/",
-        "https://www.tradingview.com/social/user/",
-      ]
+      endpoints_to_try = config.profile_urls(self.username)
       
       for endpoint in endpoints_to_try:
         try:
-          response = requests.get(endpoint, headers=headers)
+          response = self._request('profile', 'GET', endpoint, headers=headers)
           if response.status_code == 200:
             # Try to parse as JSON first
             try:
@@ -48,87 +121,228 @@ class tradingview:
     except Exception as e:
       return None
     
-  def __init__(self):
-    print('Loading cookies from JSON file')
-    
-    # Initialize cookie manager
+  def __init__(self, validate=True):
+    # Initialize cookie manager and the pooled HTTP session shared by every call
     self.cookie_manager = CookieManager()
-    
-    # Try to get cookies from JSON file first
-    self.sessionid, self.sessionid_sign, _ = self.cookie_manager.load_cookies()
-    
-    if self.sessionid and self.sessionid_sign:
-      print('Using cookies from JSON file')
-      self.cookies = f'sessionid={self.sessionid}; sessionid_sign={self.sessionid_sign}'
-      
+    self.http = _build_http_session()
+    self._lock = threading.RLock()
+    self._checked_at = 0
+    self._valid = False
+    self._last_error = None
+    self._last_check_time = None
+    self.cookies_updated_at = None
+    self._profile_info = None
+    self._profile_loaded = False
+    self._probe = None  # threading.Event of the tvcoins check in flight
+    self.sessionid = ''
+    self.sessionid_sign = ''
+    self.cookies = ''
+    self.account_balance = 0
+    self.username = ''
+    self.partner_status = 0
+    self.aff_id = 0
+    self.roster = RosterIndex(self)
+
+    if validate:
+      self.ensure_session(force=True)
+
+  @property
+  def profile_info(self):
+    """Profile data, fetched on first access only.
+
+    The profile pages are fetched without holding self._lock (every request
+    takes it through ensure_session); only the result is cached under it.
+    """
+    with self._lock:
+      if self._profile_loaded:
+        return self._profile_info
+      cookies = self.cookies
+    profile = self.get_profile_info() or {}
+    with self._lock:
+      if not self._profile_loaded and self.cookies == cookies:
+        # Cache it unless the session changed while fetching
+        self._profile_info = profile
+        self._profile_loaded = True
+    return profile
+
+  def ensure_session(self, force=False):
+    """Validate the TradingView session at most once per SESSION_TTL.
+
+    The cookie file is only re-parsed when its mtime changes; a new cookie
+    pair triggers an immediate re-validation. A rejected session (401/403) is
+    cached for the same TTL so a dead session doesn't hit tvcoins on every
+    request; network errors and other statuses (429, 5xx) keep the last
+    verdict and are retried on the next call.
+
+    The tvcoins probe runs outside self._lock: while one thread re-validates,
+    the others keep the last verdict (or wait for that probe when there is
+    none yet) instead of queueing behind the HTTP call.
+    """
+    with self._lock:
+      sessionid, sessionid_sign, updated_at = self.cookie_manager.load_cookies()
+      cookies_changed = (sessionid, sessionid_sign) != (self.sessionid, self.sessionid_sign)
+      fresh = self._checked_at and time.monotonic() - self._checked_at < SESSION_TTL
+      if not force and not cookies_changed and fresh:
+        if self._valid:
+          return
+        raise Exception(self._last_error)
+
+      in_flight = self._probe if not cookies_changed else None
+      if in_flight is not None and self._checked_at and not force:
+        # Another thread is re-validating: serve the last verdict meanwhile
+        if self._valid:
+          return
+        raise Exception(self._last_error)
+
+      if in_flight is None:
+        if cookies_changed:
+          # Different account/session: cached profile and rosters belong to the old one
+          self._profile_loaded = False
+          self._profile_info = None
+          self.roster.invalidate()
+        self.sessionid, self.sessionid_sign = sessionid, sessionid_sign
+        self.cookies_updated_at = updated_at
+
+        if not (sessionid and sessionid_sign):
+          # If no valid cookies, raise an error that requires manual intervention
+          print('No valid cookies found - please update through admin panel')
+          self._record_check(False, 'Invalid or expired TradingView session. Please update cookies through /admin panel.')
+          raise Exception(self._last_error)
+
+        print('Using cookies from JSON file')
+        self.cookies = f'sessionid={self.sessionid}; sessionid_sign={self.sessionid_sign}'
+        probe = self._probe = threading.Event()
+        headers = {'cookie': self.cookies}
+
+    if in_flight is not None:
+      # No usable verdict yet (or a forced check): the running probe provides it
+      in_flight.wait(sum(config.timeouts.get('tvcoins', config.timeouts['default'])))
+      with self._lock:
+        if self._valid:
+          return
+        raise Exception(self._last_error or 'TradingView session check did not finish')
+
+    try:
       # Test if cookies are valid
-      headers = {'cookie': self.cookies}
-      test = requests.request("GET", config.urls["tvcoins"], headers=headers)
+      try:
+        test = self._request('tvcoins', 'GET', config.urls["tvcoins"], headers=headers)
+      except Exception as e:
+        # Network trouble says nothing about the cookies: keep the last verdict, retry next call
+        with self._lock:
+          self._last_error = f'Could not reach TradingView: {e}'
+        raise
       print(f'Cookie test response status: {test.status_code}')
-      
+      if test.status_code not in (200, 401, 403):
+        # Throttled or TradingView-side failure: not a verdict on the cookies either
+        with self._lock:
+          self._last_error = f'TradingView session check failed (HTTP {test.status_code})'
+        raise Exception(self._last_error)
+
+      account_data = None
       if test.status_code == 200:
         print('JSON file cookies are valid')
         try:
           account_data = test.json()
-          self.account_balance = account_data.get('partner_fiat_balance', 0)
-          self.username = account_data.get('link', '')
-          self.partner_status = account_data.get('partner_status', 0)
-          self.aff_id = account_data.get('aff_id', 0)
-          print('Account data loaded successfully')
-          
-          # Try to get additional profile info
-          profile_info = self.get_profile_info()
-          if profile_info:
-            self.profile_info = profile_info
-        except:
-          self.account_balance = 0
-        return
-      else:
+        except ValueError:
+          account_data = {}
+
+      with self._lock:
+        if (self.sessionid, self.sessionid_sign) != (sessionid, sessionid_sign):
+          # The cookies were replaced while probing: this verdict belongs to the old pair
+          if account_data is not None:
+            return
+          raise Exception('TradingView session cookies changed during validation')
+
+        if account_data is not None:
+          if isinstance(account_data, dict) and account_data:
+            self.account_balance = account_data.get('partner_fiat_balance', 0)
+            self.username = account_data.get('link', '')
+            self.partner_status = account_data.get('partner_status', 0)
+            self.aff_id = account_data.get('aff_id', 0)
+            print('Account data loaded successfully')
+          else:
+            self.account_balance = 0
+          self._record_check(True, None)
+          return
+
         print('JSON file cookies are invalid, need manual update')
-        
-    # If no valid cookies, raise an error that requires manual intervention
-    print('No valid cookies found - please update through admin panel')
-    raise Exception('Invalid or expired TradingView session. Please update cookies through /admin panel.')
+        print('No valid cookies found - please update through admin panel')
+        self._record_check(False, 'Invalid or expired TradingView session. Please update cookies through /admin panel.')
+        raise Exception(self._last_error)
+    finally:
+      with self._lock:
+        if self._probe is probe:
+          self._probe = None
+      probe.set()
+
+  def _record_check(self, valid, error):
+    self._valid = valid
+    self._last_error = error
+    self._checked_at = time.monotonic()
+    self._last_check_time = datetime.now().isoformat()
+
+  def session_status(self):
+    """Last known session state, served from memory without calling TradingView"""
+    with self._lock:
+      return {
+        'valid': self._valid,
+        'lastCheck': self._last_check_time,
+        'balance': self.account_balance,
+        'username': self.username,
+        'partner_status': self.partner_status,
+        'aff_id': self.aff_id,
+        'profile_info': self._profile_info or {},
+        'cookies_updated_at': self.cookies_updated_at,
+        'error': self._last_error
+      }
 
   def validate_username(self, username):
-    users = requests.get(config.urls["username_hint"] + "?s=" + username)
+    key = username.lower()
+    cached = username_cache.get(key)
+    if cached is not None:
+      return dict(cached)
+
+    users = self._request('username_hint', 'GET', config.urls["username_hint"], params={'s': username})
     usersList = users.json()
     validUser = False
     verifiedUserName = ''
     for user in usersList:
-      if user['username'].lower() == username.lower():
+      hint = user['username']
+      # Every exact username in the hint list is a verified account: cache it too
+      username_cache.set(hint.lower(), {"validuser": True, "verifiedUserName": hint}, ttl=USERNAME_TTL)
+      if hint.lower() == key:
         validUser = True
-        verifiedUserName = user['username']
-    return {"validuser": validUser, "verifiedUserName": verifiedUserName}
+        verifiedUserName = hint
+    result = {"validuser": validUser, "verifiedUserName": verifiedUserName}
+    username_cache.set(key, result, ttl=USERNAME_TTL if validUser else USERNAME_NEGATIVE_TTL)
+    return dict(result)
+
+  def get_access_details(self, username, pine_id, fresh=False):
+    """Current access of username to pine_id.
 
-  def get_access_details(self, username, pine_id):
+    Reads are answered from the cached per-script roster. Pass fresh=True
+    before add_access, set_access_expiration or remove_access: the user is
+    then looked up on TradingView directly, since the index may be behind.
+    """
     user_payload = {'pine_id': pine_id, 'username': username}
 
-    user_headers = {
-      'origin': 'https://www.tradingview.com',
-      'Content-Type': 'application/x-www-form-urlencoded',
-      'Cookie': self.cookies
-    }
-    usersResponse = requests.post(config.urls['list_users'] +
-                                  '?limit=10&order_by=-created',
-                                  headers=user_headers,
-                                  data=user_payload)
-    userResponseJson = usersResponse.json()
-    print(f"Access details request completed with status: {usersResponse.status_code}")
-    users = userResponseJson['results']
+    if fresh:
+      user = self.roster.lookup_fresh(pine_id, username)
+    else:
+      # Answered from the paginated per-script roster instead of the first 10 users
+      user = self.roster.lookup(pine_id, username)
 
     access_details = user_payload
     hasAccess = False
     noExpiration = False
     expiration = str(datetime.now(timezone.utc))
-    for user in users:
-      if user['username'].lower() == username.lower():
-        hasAccess = True
-        strExpiration = user.get("expiration")
-        if strExpiration is not None:
-          expiration = user['expiration']
-        else:
-          noExpiration = True
+    if user is not None:
+      hasAccess = True
+      strExpiration = user.get("expiration")
+      if strExpiration is not None:
+        expiration = strExpiration
+      else:
+        noExpiration = True
 
     access_details['hasAccess'] = hasAccess
     access_details['noExpiration'] = noExpiration
@@ -158,16 +372,52 @@ class tradingview:
       body, contentType = encode_multipart_formdata(payload)
 
       headers = {
-        'origin': 'https://www.tradingview.com',
+        'origin': config.origin,
         'Content-Type': contentType,
         'cookie': self.cookies
       }
-      add_access_response = requests.post(config.urls[enpoint_type],
+      add_access_response = self._request(enpoint_type, 'POST',
+                                          config.urls[enpoint_type],
                                           data=body,
                                           headers=headers)
       access_details['status'] = 'Success' if (
         add_access_response.status_code == 200
         or add_access_response.status_code == 201) else 'Failure'
+      if access_details['status'] == 'Success':
+        self.roster.record(access_details['pine_id'], access_details['username'],
+                           None if access_details['noExpiration'] else access_details['expiration'])
+    return access_details
+
+  def set_access_expiration(self, access_details, expiration):
+    """Add or modify access so it ends exactly at expiration.
+
+    expiration is canonical DB text ('YYYY-MM-DD HH:MM:SS', UTC); None grants
+    lifetime access. Used by reconciliation, where the DB is authoritative.
+    """
+    payload = {
+      'pine_id': access_details['pine_id'],
+      'username_recip': access_details['username']
+    }
+    if expiration is not None:
+      payload['expiration'] = str(
+        datetime.strptime(expiration, '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc))
+    enpoint_type = 'modify_access' if access_details['hasAccess'] else 'add_access'
+
+    body, contentType = encode_multipart_formdata(payload)
+
+    headers = {
+      'origin': config.origin,
+      'Content-Type': contentType,
+      'cookie': self.cookies
+    }
+    response = self._request(enpoint_type, 'POST', config.urls[enpoint_type],
+                             data=body, headers=headers)
+    access_details['expiration'] = payload.get('expiration')
+    access_details['noExpiration'] = expiration is None
+    access_details['status'] = 'Success' if response.status_code in (200, 201) else 'Failure'
+    if access_details['status'] == 'Success':
+      self.roster.record(access_details['pine_id'], access_details['username'],
+                         access_details['expiration'])
     return access_details
 
   def remove_access(self, access_details):
@@ -178,12 +428,86 @@ class tradingview:
     body, contentType = encode_multipart_formdata(payload)
 
     headers = {
-      'origin': 'https://www.tradingview.com',
+      'origin': config.origin,
       'Content-Type': contentType,
       'cookie': self.cookies
     }
-    remove_access_response = requests.post(config.urls['remove_access'],
+    remove_access_response = self._request('remove_access', 'POST',
+                                           config.urls['remove_access'],
                                            data=body,
                                            headers=headers)
     access_details['status'] = 'Success' if (remove_access_response.status_code
                                              == 200) else 'Failure'
+    if access_details['status'] == 'Success':
+      self.roster.discard(access_details['pine_id'], access_details['username'])
+
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client(validate=True):
+  """Return the process-wide TradingView client with a validated session.
+
+  The client is created once and reused by every request; the tvcoins probe
+  only runs again after SESSION_TTL seconds, when the cookie file changes or
+  after reset_client(). validate=False skips the session check entirely.
+  """
+  global _client
+  with _client_lock:
+    if _client is None:
+      _client = tradingview(validate=False)
+  if validate:
+    _client.ensure_session()
+  return _client
+
+
+def reset_client():
+  """Force the next get_client() call to re-read cookies and re-validate"""
+  with _client_lock:
+    if _client is not None:
+      _client._checked_at = 0
+
+
+_monitor = None
+
+
+def start_session_monitor(interval=None):
+  """Re-validate the session in the background so requests never pay for the probe"""
+  global _monitor
+  if _monitor is not None and _monitor.is_alive():
+    return _monitor
+  # Refresh a bit before SESSION_TTL runs out
+  interval = interval or max(30, SESSION_TTL * 0.8)
+
+  def run():
+    while True:
+      time.sleep(interval)
+      client = get_client(validate=False)
+      try:
+        client.ensure_session(force=True)
+        client.profile_info  # Warm the lazy profile for the status page
+      except Exception as e:
+        print(f'Session monitor: {e}')
+
+  _monitor = threading.Thread(target=run, name='tv-session-monitor', daemon=True)
+  _monitor.start()
+  return _monitor
+
+
+def peek_client():
+  """The shared client if one was created, without validating the session"""
+  return _client
+
+
+def _reset_after_fork():
+  # The parent's pooled sockets and monitor thread must not leak into a forked worker
+  global _client, _client_lock, _monitor
+  _client = None
+  _client_lock = threading.Lock()
+  _monitor = None
+
+
+if hasattr(os, 'register_at_fork'):
+  os.register_at_fork(after_in_child=_reset_after_fork)
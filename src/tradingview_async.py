@@ -0,0 +1,119 @@
+"""
+Asyncio front-end for the TradingView client
+
+Exposes the same surface as ``tradingview`` (validate_username,
+get_access_details, add_access, remove_access) as coroutines, plus bulk
+helpers that fan out across many pine_ids with a bounded number of requests
+in flight. Calls run on the pooled synchronous client in a dedicated thread
+pool, so they share its keep-alive connections and roster index.
+"""
+import asyncio
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+from .tradingview import get_client, POOL_SIZE
+
+# Maximum TradingView requests in flight per bulk operation
+MAX_CONCURRENCY = int(os.getenv('TV_MAX_CONCURRENCY', '10'))
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    # asyncio's default executor is sized from the CPU count, which would cap
+    # the fan-out on small containers; TradingView calls are pure I/O.
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=max(MAX_CONCURRENCY, POOL_SIZE),
+                                           thread_name_prefix='tv-async')
+        return _executor
+
+
+class AsyncTradingView:
+    """Coroutine wrapper around the shared TradingView client"""
+
+    def __init__(self, client=None, max_concurrency: int = MAX_CONCURRENCY):
+        self.client = client or get_client()
+        self.max_concurrency = max(1, max_concurrency)
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # Created lazily so it binds to the loop that actually runs the calls
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def _call(self, func: Callable, *args) -> Any:
+        async with self._get_semaphore():
+            loop = asyncio.get_running_loop()
+            # Carry context variables (the request's rate-limit wait budget) into the worker thread
+            context = contextvars.copy_context()
+            return await loop.run_in_executor(_get_executor(), context.run, func, *args)
+
+    async def validate_username(self, username: str) -> Dict[str, Any]:
+        return await self._call(self.client.validate_username, username)
+
+    async def get_access_details(self, username: str, pine_id: str, fresh: bool = False) -> Dict[str, Any]:
+        return await self._call(self.client.get_access_details, username, pine_id, fresh)
+
+    async def add_access(self, access_details: Dict[str, Any], extension_type: str,
+                         extension_length: int) -> Dict[str, Any]:
+        return await self._call(self.client.add_access, access_details, extension_type, extension_length)
+
+    async def remove_access(self, access_details: Dict[str, Any]) -> Dict[str, Any]:
+        await self._call(self.client.remove_access, access_details)
+        return access_details
+
+    async def get_roster(self, pine_id: str, max_age: Optional[int] = None) -> Dict[str, Dict[str, Any]]:
+        """Every user with access to pine_id (max_age=0 forces a full re-read)"""
+        return await self._call(self.client.roster.get_users, pine_id, max_age)
+
+    async def _gather(self, coros: Iterable[Awaitable], return_exceptions: bool) -> List[Any]:
+        return list(await asyncio.gather(*coros, return_exceptions=return_exceptions))
+
+    async def get_access_details_many(self, username: str, pine_ids: List[str],
+                                      return_exceptions: bool = False, fresh: bool = False) -> List[Any]:
+        """Access details for one user across many scripts, in pine_ids order (fresh=True before writes)"""
+        return await self._gather((self.get_access_details(username, p, fresh) for p in pine_ids),
+                                  return_exceptions)
+
+    async def add_access_many(self, accesses: List[Dict[str, Any]], extension_type: str,
+                              extension_length: int, return_exceptions: bool = False) -> List[Any]:
+        return await self._gather((self.add_access(a, extension_type, extension_length) for a in accesses),
+                                  return_exceptions)
+
+    async def remove_access_many(self, accesses: List[Dict[str, Any]],
+                                 return_exceptions: bool = False) -> List[Any]:
+        return await self._gather((self.remove_access(a) for a in accesses), return_exceptions)
+
+    async def get_rosters_many(self, pine_ids: List[str], max_age: Optional[int] = None) -> List[Any]:
+        """Rosters for many scripts in pine_ids order; failures are returned in place as exceptions"""
+        return await self._gather((self.get_roster(p, max_age) for p in pine_ids), return_exceptions=True)
+
+    async def run_many(self, func: Callable, items: Iterable) -> List[Any]:
+        """func(item) for every item on the client's thread pool, in items order;
+        failures are returned in place as exceptions"""
+        return await self._gather((self._call(func, item) for item in items), return_exceptions=True)
+
+    async def validate_usernames(self, usernames: List[str]) -> Dict[str, Any]:
+        """Validate many usernames; duplicates (case-insensitive) cost one lookup.
+
+        Returns {username: result or exception}; cached names never leave the process.
+        Raises ValueError if an entry is not a string.
+        """
+        if not all(isinstance(u, str) for u in usernames):
+            raise ValueError('usernames must be a list of strings')
+        unique = list(dict.fromkeys(u.lower() for u in usernames))
+        outcomes = await self._gather((self.validate_username(u) for u in unique), return_exceptions=True)
+        by_key = dict(zip(unique, outcomes))
+        return {u: by_key[u.lower()] for u in usernames}
+
+
+def run_async(coro: Awaitable) -> Any:
+    """Run a coroutine to completion from synchronous (Flask/service) code"""
+    return asyncio.run(coro)
@@ -0,0 +1,16 @@
+"""
+WSGI entry point for production servers
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Every worker process must see the same ADMIN_TOKEN and SECRET_KEY, so both
+come from the environment (main.py only generates a token for development).
+"""
+import os
+
+from src.server import create_app
+
+if not os.getenv('ADMIN_TOKEN'):
+    print("⚠️ ADMIN_TOKEN is not set - admin endpoints will refuse every request")
+
+app = create_app()